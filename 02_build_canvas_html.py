@@ -14,14 +14,12 @@ Approach:
 from __future__ import annotations
 
 import argparse
-import re
 from pathlib import Path
+from typing import Optional
 
 import markdown
 
-
-BLOCK_RE = re.compile(r"^:::(?P<name>\w+)(?P<header>[^\n]*)\n(?P<body>.*?\n):::\s*$",
-                      re.MULTILINE | re.DOTALL)
+from pp_blocks import Block, Document, parse_document
 
 
 def strip_custom_blocks(md_text: str) -> str:
@@ -29,38 +27,64 @@ def strip_custom_blocks(md_text: str) -> str:
     Remove custom ::: blocks entirely (meta/criterion/signoff/private_note).
     Leaves the normal markdown headings and text around them.
     """
-    def repl(match: re.Match) -> str:
-        name = match.group("name").strip().lower()
-        # For Canvas display, we DO want the instructional text that surrounds blocks,
-        # but the block bodies are structured inputs students fill. Those can stay as plain text,
-        # OR be removed. We'll keep criterion bodies because they are the student prompts.
-        #
-        # However, the 'meta' block is mostly structured fields and looks ugly; remove it.
-        if name == "meta":
-            return ""
-        # Keep the body content for criterion/signoff/private_note as plain markdown text
-        body = match.group("body").rstrip()
-        header = match.group("header").strip()
-        # Convert block header (if any) into a subtle divider
-        prefix = ""
-        if header:
-            prefix = f"\n\n<!-- {name} {header} -->\n\n"
-        return prefix + body + "\n"
-
-    return BLOCK_RE.sub(repl, md_text)
-
-
-def make_canvas_html(md_text: str) -> str:
-    html_body = markdown.markdown(
-        md_text,
-        extensions=[
-            "extra",
-            "sane_lists",
-            "smarty",
-            "tables",
-        ],
-        output_format="html5",
-    )
+    doc = parse_document(md_text)
+    pieces = []
+    pos = 0
+    for block in doc.blocks:
+        pieces.append(md_text[pos:block.start])
+        pieces.append(render_block(doc, block))
+        pos = block.end
+    pieces.append(md_text[pos:])
+    return "".join(pieces)
+
+
+def render_block(doc: Document, block: Block) -> str:
+    """
+    Canvas text that replaces one custom block.
+    """
+    name = block.kind.strip().lower()
+    # For Canvas display, we DO want the instructional text that surrounds blocks,
+    # but the block bodies are structured inputs students fill. Those can stay as plain text,
+    # OR be removed. We'll keep criterion bodies because they are the student prompts.
+    #
+    # However, the 'meta' block is mostly structured fields and looks ugly; remove it.
+    if name == "meta":
+        return ""
+    # Keep the body content for criterion/signoff/private_note as plain markdown text
+    body = doc.body(block).rstrip()
+    header = block.header.strip()
+    # Convert block header (if any) into a subtle divider
+    prefix = ""
+    if header:
+        prefix = f"\n\n<!-- {name} {header} -->\n\n"
+    return prefix + body + "\n"
+
+
+MARKDOWN_EXTENSIONS = [
+    "extra",
+    "sane_lists",
+    "smarty",
+    "tables",
+]
+
+def make_converter() -> markdown.Markdown:
+    """
+    One configured converter; building it (loading every extension) costs far more than a
+    typical conversion, so callers converting many documents should keep and reuse it.
+    """
+    return markdown.Markdown(extensions=MARKDOWN_EXTENSIONS, output_format="html5")
+
+
+def render_markdown(md_text: str, converter: markdown.Markdown) -> str:
+    """
+    Markdown -> HTML with a reused converter (reset() between documents clears footnotes,
+    abbreviations and other per-document state). Not thread-safe; use one converter per thread.
+    """
+    return converter.reset().convert(md_text)
+
+
+def make_canvas_html(md_text: str, converter: Optional[markdown.Markdown] = None) -> str:
+    html_body = render_markdown(md_text, converter or make_converter())
 
     # Canvas tends to like plain HTML without full <html> boilerplate.
     # Still wrap in a div for easy paste.
@@ -70,6 +94,14 @@ def make_canvas_html(md_text: str) -> str:
 """
 
 
+def build_canvas_html(md_text: str, converter: Optional[markdown.Markdown] = None) -> str:
+    """
+    Full 01 -> 02 conversion: strip custom blocks, then render Canvas HTML.
+    Pass a converter from make_converter() when building several pages.
+    """
+    return make_canvas_html(strip_custom_blocks(md_text), converter)
+
+
 def main() -> int:
     ap = argparse.ArgumentParser()
     ap.add_argument("--src", default="01_source.md", help="Source markdown file")
@@ -80,8 +112,7 @@ def main() -> int:
     out_path = Path(args.out)
 
     md_text = src_path.read_text(encoding="utf-8")
-    cleaned = strip_custom_blocks(md_text)
-    html = make_canvas_html(cleaned)
+    html = build_canvas_html(md_text)
 
     out_path.write_text(html, encoding="utf-8")
     print(f"Wrote {out_path} ({len(html)} chars)")
@@ -8,49 +8,22 @@ Reads 01_source.md and produces:
 Extracts:
 - rubric criteria from :::criterion{id="...", points="..."} blocks
 - validates sum(points) == 10 (as per contract)
+- stamps the source path + sha256 so 04_grade.py can tell when the rubric is stale
 """
 
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
-import re
+import os
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 import yaml
 
-
-CRITERION_RE = re.compile(
-    r'^:::criterion\{(?P<attrs>[^}]*)\}\n(?P<body>.*?\n):::\s*$',
-    re.MULTILINE | re.DOTALL
-)
-
-META_RE = re.compile(
-    r'^:::meta\n(?P<body>.*?\n):::\s*$',
-    re.MULTILINE | re.DOTALL
-)
-
-SIGNOFF_RE = re.compile(
-    r'^:::signoff\n(?P<body>.*?\n):::\s*$',
-    re.MULTILINE | re.DOTALL
-)
-
-PRIVATE_RE = re.compile(
-    r'^:::private_note\n(?P<body>.*?\n):::\s*$',
-    re.MULTILINE | re.DOTALL
-)
-
-
-def parse_attrs(attr_text: str) -> Dict[str, str]:
-    """
-    Parse attribute string like: id="work_summary" points="2"
-    """
-    attrs: Dict[str, str] = {}
-    for m in re.finditer(r'(\w+)\s*=\s*"([^"]*)"', attr_text):
-        attrs[m.group(1)] = m.group(2)
-    return attrs
+from pp_blocks import Document, parse_document
 
 
 @dataclass
@@ -60,11 +33,11 @@ class Criterion:
     prompt: str
 
 
-def load_meta(md_text: str) -> Optional[Dict[str, Any]]:
-    m = META_RE.search(md_text)
-    if not m:
+def load_meta(doc: Document) -> Optional[Dict[str, Any]]:
+    block = doc.first("meta")
+    if not block:
         return None
-    body = m.group("body")
+    body = doc.body(block)
     # YAML-ish block
     try:
         data = yaml.safe_load(body)
@@ -75,40 +48,55 @@ def load_meta(md_text: str) -> Optional[Dict[str, Any]]:
     return None
 
 
-def extract_criteria(md_text: str) -> List[Criterion]:
+def extract_criteria(doc: Document) -> List[Criterion]:
     criteria: List[Criterion] = []
-    for m in CRITERION_RE.finditer(md_text):
-        attrs = parse_attrs(m.group("attrs"))
-        cid = attrs.get("id", "").strip()
-        pts_raw = attrs.get("points", "").strip()
+    for block in doc.of_kind("criterion"):
+        cid = block.attr("id").strip()
+        pts_raw = block.attr("points").strip()
         if not cid or not pts_raw:
             continue
         try:
             pts = float(pts_raw)
         except ValueError:
             continue
-        prompt = m.group("body").strip()
+        prompt = doc.body(block).strip()
         criteria.append(Criterion(criterion_id=cid, points=pts, prompt=prompt))
     return criteria
 
 
-def main() -> int:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--src", default="01_source.md", help="Source markdown")
-    ap.add_argument("--out", default="03_rubric.json", help="Output rubric JSON")
-    ap.add_argument("--require-sum", type=float, default=10.0, help="Expected total points")
-    args = ap.parse_args()
+def source_fingerprint(source_bytes: bytes) -> str:
+    """
+    sha256 of the source file's raw bytes; stamped into the rubric so 04_grade.py can detect
+    staleness by hashing the file the same way (line endings included).
+    """
+    return hashlib.sha256(source_bytes).hexdigest()
+
+
+def decode_source(source_bytes: bytes) -> str:
+    """
+    Source markdown text with CRLF line endings normalized, so Windows-edited sources build
+    the same rubric.
+    """
+    return source_bytes.decode("utf-8").replace("\r\n", "\n")
 
-    md_text = Path(args.src).read_text(encoding="utf-8")
-    meta = load_meta(md_text)
-    criteria = extract_criteria(md_text)
+
+def build_rubric(md_text: str, require_sum: float, source_path: str = "", source_sha256: str = "") -> Dict[str, Any]:
+    """
+    Builds the rubric dict from source markdown (parsed once via pp_blocks).
+    source_path is recorded as given so graders can find and re-hash the source; source_sha256
+    is source_fingerprint() of the file's raw bytes (default: md_text encoded as UTF-8).
+    Raises ValueError if no criteria are found.
+    """
+    doc = parse_document(md_text)
+    meta = load_meta(doc)
+    criteria = extract_criteria(doc)
 
     if not criteria:
-        raise SystemExit("No criteria found. Did you keep :::criterion{id=\"...\" points=\"...\"} blocks?")
+        raise ValueError("No criteria found. Did you keep :::criterion{id=\"...\" points=\"...\"} blocks?")
 
     total = sum(c.points for c in criteria)
 
-    rubric = {
+    return {
         "doc_kind": (meta or {}).get("DOC_KIND", "unknown"),
         "doc_version": (meta or {}).get("DOC_VERSION", "unknown"),
         "criteria": [
@@ -120,17 +108,45 @@ def main() -> int:
             for c in criteria
         ],
         "total_points": total,
-        "expected_total_points": args.require_sum,
-        "valid_total": abs(total - args.require_sum) < 1e-9,
+        "expected_total_points": require_sum,
+        "valid_total": abs(total - require_sum) < 1e-9,
         "notes": {
-            "signoff_required": bool(SIGNOFF_RE.search(md_text)),
-            "private_note_ignored": bool(PRIVATE_RE.search(md_text)),
+            "signoff_required": doc.first("signoff") is not None,
+            "private_note_ignored": doc.first("private_note") is not None,
         },
+        "source": source_path,
+        "source_sha256": source_sha256 or source_fingerprint(md_text.encode("utf-8")),
     }
 
+
+def rubric_source_path(src: str, out: str) -> str:
+    """
+    Source path relative to the rubric's folder, so the pair can be moved together.
+    """
+    try:
+        return os.path.relpath(Path(src).resolve(), Path(out).resolve().parent)
+    except ValueError:  # different drive on Windows
+        return str(Path(src).resolve())
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--src", default="01_source.md", help="Source markdown")
+    ap.add_argument("--out", default="03_rubric.json", help="Output rubric JSON")
+    ap.add_argument("--require-sum", type=float, default=10.0, help="Expected total points")
+    args = ap.parse_args()
+
+    source_bytes = Path(args.src).read_bytes()
+    try:
+        rubric = build_rubric(decode_source(source_bytes), args.require_sum, rubric_source_path(args.src, args.out),
+                              source_fingerprint(source_bytes))
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+
+    total = rubric["total_points"]
     Path(args.out).write_text(json.dumps(rubric, indent=2), encoding="utf-8")
     print(f"Wrote {args.out}")
-    print(f"Criteria: {len(criteria)} | Total points: {total} | Valid total: {rubric['valid_total']}")
+    print(f"Criteria: {len(rubric['criteria'])} | Total points: {total} | Valid total: {rubric['valid_total']}")
     if not rubric["valid_total"]:
         raise SystemExit(f"ERROR: points sum to {total} but expected {args.require_sum}")
     return 0
@@ -11,6 +11,11 @@ Outputs:
 Also supports creating an initial submission file from a template:
   python 04_grade.py --init-submission submissions/alice_pp01.md
 
+Batch (--submissions-dir), watch (--watch) and service (--serve) modes and the prompt, cache and
+cascade options are listed in --help; the parts live in pp_ollama.py (client and host pool),
+pp_prompts.py, pp_contract.py (output parsing), pp_submission.py, pp_cache.py (cache and batch
+journal), pp_rubric.py, pp_metrics.py and pp_service.py.
+
 Key improvements:
 - Enforces CONTRACT FLAGS (stable IDs)
 - Pre-checks common structural requirements deterministically:
@@ -24,389 +29,1994 @@ from __future__ import annotations
 
 import argparse
 import json
-import re
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+from http.server import ThreadingHTTPServer
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, Optional, Tuple
 
 import requests
 
-# --- Contract-stable flags (keep these IDs stable) ---
-FLAG_MISSING_SIGNOFF_A = "missing_signoff_a"
-FLAG_MISSING_SIGNOFF_B = "missing_signoff_b"
-FLAG_MISSING_LLM_REFLECTION = "missing_llm_reflection"
-FLAG_MISSING_WORK_SUMMARY = "missing_work_summary"
-FLAG_MISSING_SNAG = "missing_snag"
-FLAG_MISSING_NEXT_TIME_CHOICE = "missing_next_time_choice"
+from pp_blocks import parse_document
+from pp_cache import BatchJournal, GradeCache, sha256_text
+from pp_contract import (
+    CRITERION_FLAGS,
+    FLAG_MISSING_SIGNOFF_A,
+    FLAG_MISSING_SIGNOFF_B,
+    REPAIR_FLAG_PREFIXES,
+    expand_compact,
+    extract_json,
+    record_wire_savings,
+    render_human_text,
+    validate_and_normalize,
+)
+from pp_metrics import (
+    MetricsWriter,
+    describe_budget,
+    describe_cascade,
+    describe_incremental,
+    describe_micro_batch,
+    describe_prompt_eval,
+    describe_prompt_size,
+    describe_wire,
+    render_metrics_summary,
+)
+from pp_ollama import OllamaClient, OllamaPool, TokenBudget, is_transient_error
+from pp_prompts import (
+    build_compact_prompt_prefix,
+    build_criterion_prompt,
+    build_layout_prompt,
+    build_micro_batch_prompt,
+    build_prompt_prefix,
+    build_prompt_tail,
+    compact_schema,
+    contract_schema,
+    criterion_schema,
+    micro_batch_schema,
+)
+from pp_results import ResultStore
+from pp_rubric import StaleRubricError, ensure_fresh_rubric, load_rubric, rubric_sha256
+from pp_service import GradingService, make_service_handler, parse_listen_address
+from pp_similarity import SimilarityIndex, SimilarPair, parse_participants
+from pp_submission import (
+    TRIMMED_FLAG_PREFIX,
+    TRIMMED_MARKER,
+    compact_submission,
+    criteria_answers,
+    criterion_fingerprints,
+    extract_pair_type,
+    find_empty_criteria,
+    init_submission,
+    load_submission,
+    load_template_lines,
+    precheck_flags,
+    strip_template_lines,
+    trim_criterion_bodies,
+    trim_text,
+)
+
+logger = logging.getLogger(__name__)
+
+
+NO_EVIDENCE_COMMENT = "No evidence found (template not filled in)."
+
+
+@dataclass
+class GradeConfig:
+    """
+    Ollama settings shared by every grading call in one run (single file or batch).
+    """
+    host: str
+    model: str
+    num_predict: int = 650
+    timeout_s: int = 90
+    temperature: float = 0.0
+    stream: bool = False
+    engine: str = "whole"  # "whole" | "per-criterion"
+    fast_path: bool = False
+    keep_alive: Optional[str] = "30m"
+    compact_prompt: bool = False
+    response_format: str = "schema"  # "schema" | "json" | "none" (Ollama `format` parameter)
+    prompt_layout: str = "classic"  # "classic" | "prefix" (rubric-invariant prefix, per-submission tail)
+    wire: str = "contract"  # model output form: "contract" | "compact" (expanded by expand_compact)
+    template_lines: FrozenSet[str] = frozenset()  # boilerplate dropped by --compact-prompt
+    budget: Optional["TokenBudget"] = None  # per-call num_ctx/num_predict sizing; fixed num_predict when None
+    micro_batch: int = 1  # submissions per model call in batch mode (grade_micro_batch)
+    # Cascade: a larger model's config, used when the result from this one looks unreliable
+    escalation: Optional["GradeConfig"] = None
+    escalate_cutoffs: Tuple[float, ...] = (0.6, 0.7, 0.8, 0.9)  # grade cutoffs as fractions of total
+    escalate_margin: float = 0.5  # points just below a cutoff that count as a boundary score
+
+
+def response_format(config: GradeConfig, schema: Dict[str, Any]) -> Optional[Any]:
+    """
+    Value for Ollama's `format` parameter under config.response_format (None: leave it out).
+    """
+    if config.response_format == "schema":
+        return schema
+    if config.response_format == "json":
+        return "json"
+    return None
 
 
-JSON_OBJ_RE = re.compile(r"\{.*\}", re.DOTALL)
+@contextmanager
+def timed(stats: Dict[str, Any], stage: str) -> Iterator[None]:
+    """
+    Adds the wall time of the with-block to stats["<stage>_s"] (accumulates across calls).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        key = f"{stage}_s"
+        stats[key] = stats.get(key, 0.0) + time.perf_counter() - started
 
-META_RE = re.compile(r"^:::meta\s*\n(?P<body>.*?\n):::\s*$", re.MULTILINE | re.DOTALL)
-CRITERION_RE = re.compile(r'^:::criterion\{(?P<attrs>[^}]*)\}\n(?P<body>.*?\n):::\s*$',
-                          re.MULTILINE | re.DOTALL)
-SIGNOFF_RE = re.compile(r"^:::signoff\s*\n(?P<body>.*?\n):::\s*$", re.MULTILINE | re.DOTALL)
 
-CHECKBOX_RE = re.compile(r"^\s*-\s*\[(?P<x>[ xX])\]\s*(?P<label>.+?)\s*$", re.MULTILINE)
+def merge_stats(into: Dict[str, Any], part: Dict[str, Any]) -> None:
+    """
+    Folds one call's stats into a submission's stats: numbers add up, other values overwrite.
+    """
+    for key, value in part.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and key in into:
+            into[key] += value
+        else:
+            into[key] = value
 
 
-def load_rubric(path: str) -> Dict[str, Any]:
-    p = Path(path)
-    if not p.exists():
-        raise FileNotFoundError(f"Rubric file not found: {path}. Run: python 03_build_rubric_json.py")
-    return json.loads(p.read_text(encoding="utf-8"))
+def generate_text(prompt: str, config: GradeConfig, num_predict: int, stats: Dict[str, Any],
+                  fmt: Optional[Any] = None, client: Optional[OllamaClient] = None) -> str:
+    """
+    Runs one generation of config.model using the configured transport (plain or streaming), with
+    fmt as Ollama's `format` parameter, on the shared client (a one-shot connection when None).
+    Call details (time to first token, early hang-up, warm/cold model) are recorded into stats.
+    With config.budget, num_ctx is sized for this prompt and num_predict, and the reported
+    prompt_eval_count calibrates the budget's token estimate.
+    """
+    shared = client
+    client = shared or OllamaClient(config.host, config.model, config.timeout_s,
+                                    keep_alive=config.keep_alive, pool_size=1)
+    num_ctx = None
+    if config.budget:
+        num_ctx = config.budget.num_ctx(config.model, len(prompt), num_predict)
+        stats["ctx_tokens"] = stats.get("ctx_tokens", 0) + num_ctx
+        stats["predict_tokens"] = stats.get("predict_tokens", 0) + num_predict
+        stats["budgeted_calls"] = stats.get("budgeted_calls", 0) + 1
+    evaluated_before = stats.get("prompt_eval_count", 0)
+    try:
+        with timed(stats, "http"):
+            text = generate_with_client(client, prompt, config, num_predict, stats, fmt, num_ctx)
+    finally:
+        if client is not shared:
+            client.close()
+    if config.budget:
+        config.budget.observe(config.model, len(prompt), stats.get("prompt_eval_count", 0) - evaluated_before)
+    return text
+
+
+def generate_with_client(
+    client: OllamaClient,
+    prompt: str,
+    config: GradeConfig,
+    num_predict: int,
+    stats: Dict[str, Any],
+    fmt: Optional[Any] = None,
+    num_ctx: Optional[int] = None,
+) -> str:
+    if not config.stream:
+        return client.generate(prompt, num_predict, config.temperature, stats, fmt, num_ctx, config.model)
 
+    # an uncalibrated budget needs the stats frame's prompt_eval_count, however chatty the model
+    drain = config.budget is not None and not config.budget.is_calibrated(config.model)
+    streamed = client.generate_stream(prompt, num_predict, config.temperature, stats, fmt, num_ctx, config.model,
+                                      drain)
+    stats["first_token_s"] = streamed.first_token_s
+    stats["generate_s"] = streamed.total_s
+    stats["stopped_early"] = streamed.stopped_early
+    return streamed.text
 
-def load_submission(path: str) -> str:
-    p = Path(path)
-    if not p.exists():
-        raise FileNotFoundError(
-            f"Submission file not found: {path}\n"
-            f"Fix:\n"
-            f"  mkdir -p {p.parent}\n"
-            f"  cp submissions/_TEMPLATE_pp.md {path}\n"
-            f"  vi {path}\n"
-        )
-    return p.read_text(encoding="utf-8")
 
+def num_predict_attempts(config: GradeConfig, n_criteria: int, submissions: int = 1) -> Tuple[int, int]:
+    """
+    Generation budgets for the first call and the one retry after empty or unusable output.
+    Fixed: --num-predict, then at least 900. With config.budget the first is sized from the
+    number of criteria to answer and the retry doubles it (up to the same at-least-900 ceiling).
+    A micro-batch answers for several submissions, so its budgets and ceiling scale with them.
+    """
+    retry_cap = max(config.num_predict, 900) * submissions
+    if config.budget is None:
+        return config.num_predict * submissions, retry_cap
+    first = config.budget.num_predict(n_criteria, config.num_predict * submissions)
+    return first, max(first, min(2 * first, retry_cap))
 
-def init_submission(dest: str, template: str) -> None:
-    src = Path(template)
-    if not src.exists():
-        raise FileNotFoundError(f"{template} not found; can't init a submission.")
-    d = Path(dest)
-    d.parent.mkdir(parents=True, exist_ok=True)
-    if d.exists():
-        raise FileExistsError(f"{dest} already exists. Refusing to overwrite.")
-    d.write_text(src.read_text(encoding="utf-8"), encoding="utf-8")
-    print(f"Created starter submission: {dest}")
 
+def fit_prompt(
+    prompt: str,
+    config: GradeConfig,
+    num_predict: int,
+    shrink: Callable[[int], Tuple[str, List[str]]],
+    stats: Dict[str, Any],
+) -> Tuple[str, List[str]]:
+    """
+    With config.budget, a prompt too long for max_ctx next to num_predict is rebuilt by
+    shrink(excess_chars), which trims answer text and returns (prompt, trimmed criterion ids).
+    shrink trims the raw markdown, and compaction may then remove less than that, so the
+    rebuilt prompt is measured again and shrunk harder until it fits.
+    Returns the prompt to send and the trimmed ids (recorded in stats["trimmed_criteria"]).
+    Raises ValueError if trimming the answers can't bring the prompt under the budget.
+    """
+    if config.budget is None:
+        return prompt, []
+    limit = config.budget.max_prompt_chars(config.model, num_predict)
+    if len(prompt) <= limit:
+        return prompt, []
+    excess = len(prompt) - limit
+    shortest = len(prompt)
+    while True:
+        fitted, trimmed = shrink(excess)
+        if len(fitted) <= limit:
+            break
+        if len(fitted) >= shortest:  # nothing left to trim
+            raise ValueError(f"Prompt is {len(fitted)} chars after trimming answers; the budget allows {limit}")
+        shortest = len(fitted)
+        excess += len(fitted) - limit
+    stats["trimmed_criteria"] = stats.get("trimmed_criteria", []) + trimmed
+    return fitted, trimmed
+
+
+def grade_submission_text(
+    rubric: Dict[str, Any],
+    submission_md: str,
+    config: GradeConfig,
+    cache: Optional[GradeCache] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    client: Optional[OllamaClient] = None,
+    settled_points: float = 0.0,
+    total_points: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Grades one submission: prechecks, prompt, model call, JSON extraction, normalization.
+    Returns the normalized contract result (from the cache when the same prompt was graded before).
+    If stats is given, per-call details (e.g. streaming time to first token) are written into it.
+    client is the run's shared OllamaClient/OllamaPool (one-shot connections when None).
+    When rubric is part of a larger rubric (incremental regrade), settled_points are the points
+    already awarded outside it and total_points the larger rubric's total; the cascade's
+    boundary check uses them.
+    Raises requests.RequestException on HTTP failures and ValueError on unusable model output.
+    """
+    if stats is None:
+        stats = {}
+    empty_ids: List[str] = []
+    if config.fast_path:
+        with timed(stats, "fast_path_check"):
+            empty_ids = find_empty_criteria(rubric, submission_md)
+    if empty_ids:
+        return grade_with_fast_path(rubric, submission_md, config, empty_ids, cache, stats, client,
+                                    settled_points, total_points)
+    return grade_with_model(rubric, submission_md, config, cache, stats, client=client,
+                            settled_points=settled_points, total_points=total_points)
+
+
+def escalation_reasons(
+    result: Dict[str, Any],
+    preflags: List[str],
+    rubric: Dict[str, Any],
+    config: GradeConfig,
+    known_ids: FrozenSet[str] = frozenset(),
+    settled_points: float = 0.0,
+    total_points: Optional[float] = None,
+) -> List[str]:
+    """
+    Why a result should be re-graded by the larger model (empty: keep it):
+    - repair:<flag>   validate_and_normalize had to patch the output (unknown_criterion_id flags
+                      for ids in known_ids are ignored; a fast-path model may still answer
+                      zeroed criteria)
+    - flags:<+f/-f>   the model's flags disagree with the prechecks on this rubric's criteria
+    - boundary:<cut>  the final score (score_total + settled_points) sits within escalate_margin
+                      points below a grade cutoff of total_points (default: rubric's total)
+    """
+    reasons = [f"repair:{f}" for f in result["flags"] if f.startswith(REPAIR_FLAG_PREFIXES)
+               and not (f.startswith("unknown_criterion_id:") and f.split(":", 1)[1] in known_ids)]
+
+    graded_ids = {c["criterion_id"] for c in rubric["criteria"]}
+    relevant = {FLAG_MISSING_SIGNOFF_A, FLAG_MISSING_SIGNOFF_B}
+    relevant |= {f for cid in graded_ids for f in CRITERION_FLAGS.get(cid, [])}
+    model_flags = {f for f in result["flags"] if f in relevant}
+    expected = {f for f in preflags if f in relevant}
+    reasons += [f"flags:+{f}" for f in sorted(model_flags - expected)]
+    reasons += [f"flags:-{f}" for f in sorted(expected - model_flags)]
+
+    if total_points is None:
+        total_points = sum(float(c["max_points"]) for c in rubric["criteria"])
+    score = result["score_total"] + settled_points
+    for cutoff in config.escalate_cutoffs:
+        points = cutoff * total_points
+        if points - config.escalate_margin <= score < points:
+            reasons.append(f"boundary:{points:g}")
+    return reasons
+
+
+def grade_with_model(
+    rubric: Dict[str, Any],
+    submission_md: str,
+    config: GradeConfig,
+    cache: Optional[GradeCache] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    prefix_rubric: Optional[Dict[str, Any]] = None,
+    client: Optional[OllamaClient] = None,
+    settled_points: float = 0.0,
+    total_points: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Grades every criterion in rubric with the configured engine (no fast path).
+    prefix_rubric is the full rubric when rubric is a fast-path subset; settled_points and
+    total_points place rubric's score on the final result's scale (see grade_submission_text).
+    With config.escalation set (cascade), the result is re-graded by the larger model when
+    escalation_reasons() finds a problem, or when the small model's output is unusable.
+    stats gets "graded_by" (model), "tier" ("base" or "escalated") and "escalation_reasons".
+    Raises requests.RequestException on HTTP failures and ValueError on unusable model output.
+    """
+    if stats is None:
+        stats = {}
+    stats["graded_by"] = config.model
+    stats["tier"] = "base"
+    if config.escalation is None:
+        return grade_with_engine(rubric, submission_md, config, cache, stats, prefix_rubric, client)
+
+    try:
+        result = grade_with_engine(rubric, submission_md, config, cache, stats, prefix_rubric, client)
+        known_ids = frozenset(c["criterion_id"] for c in (prefix_rubric or rubric)["criteria"])
+        reasons = escalation_reasons(result, precheck_flags(submission_md), rubric, config, known_ids,
+                                     settled_points, total_points)
+    except ValueError as exc:
+        reasons = [f"unusable:{type(exc).__name__}"]
+    if not reasons:
+        return result
+
+    stats["escalation_reasons"] = reasons
+    stats["graded_by"] = config.escalation.model
+    stats["tier"] = "escalated"
+    return grade_with_engine(rubric, submission_md, config.escalation, cache, stats, prefix_rubric, client)
+
+
+def grade_with_engine(
+    rubric: Dict[str, Any],
+    submission_md: str,
+    config: GradeConfig,
+    cache: Optional[GradeCache] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    prefix_rubric: Optional[Dict[str, Any]] = None,
+    client: Optional[OllamaClient] = None,
+) -> Dict[str, Any]:
+    """
+    One grading pass with config's model and engine.
+    Raises requests.RequestException on HTTP failures and ValueError on unusable model output.
+    """
+    if stats is None:
+        stats = {}
+    if config.engine == "per-criterion":
+        return grade_per_criterion(rubric, submission_md, config, cache, stats, client)
+
+    with timed(stats, "precheck_flags"):
+        preflags = precheck_flags(submission_md)
+    attempts = num_predict_attempts(config, len(rubric["criteria"]))
+    with timed(stats, "build_prompt"):
+        prompt, trimmed = build_engine_prompt(rubric, submission_md, preflags, config, attempts[0], stats,
+                                              prefix_rubric)
+
+    cache_key = GradeCache.make_key(rubric, config, prompt) if cache else ""
+    if cache:
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry["result"]
+
+    raw, normalized = generate_contract(prompt, rubric, config, attempts, stats, client)
+    if trimmed:
+        normalized["flags"] = sorted(set(normalized["flags"]) | {TRIMMED_FLAG_PREFIX + cid for cid in trimmed})
+    if cache:
+        cache.put(cache_key, raw, normalized)
+    return normalized
+
+
+def build_engine_prompt(
+    rubric: Dict[str, Any],
+    submission_md: str,
+    preflags: List[str],
+    config: GradeConfig,
+    num_predict: int,
+    stats: Dict[str, Any],
+    prefix_rubric: Optional[Dict[str, Any]] = None,
+) -> Tuple[str, List[str]]:
+    """
+    The whole-submission prompt in config's layout and wire form, compacted and trimmed to fit the
+    budget as configured, and the ids of criteria whose answers were trimmed. Prompt sizes go to stats.
+    """
+    def render(md: str) -> str:
+        if config.compact_prompt:
+            md = compact_submission(md, config.template_lines)
+        return build_layout_prompt(rubric, md, preflags, config.prompt_layout, prefix_rubric, config.wire)
+
+    def shrink(excess_chars: int) -> Tuple[str, List[str]]:
+        trimmed_md, trimmed = trim_criterion_bodies(submission_md, excess_chars)
+        return render(trimmed_md), trimmed
+
+    prompt = build_layout_prompt(rubric, submission_md, preflags, config.prompt_layout, prefix_rubric, config.wire)
+    stats["prompt_chars_full"] = len(prompt)
+    if config.compact_prompt:
+        prompt = render(submission_md)
+    prompt, trimmed = fit_prompt(prompt, config, num_predict, shrink, stats)
+    stats["prompt_chars"] = len(prompt)
+    stats["prompt_sha256"] = sha256_text(prompt)
+    if config.prompt_layout == "prefix":
+        prefix = build_compact_prompt_prefix if config.wire == "compact" else build_prompt_prefix
+        stats["prompt_prefix_chars"] = len(prefix(prefix_rubric or rubric))
+    return prompt, trimmed
+
+
+def generate_contract(
+    prompt: str,
+    rubric: Dict[str, Any],
+    config: GradeConfig,
+    attempts: Tuple[int, int],
+    stats: Dict[str, Any],
+    client: Optional[OllamaClient] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    (raw output, normalized result) for a whole-submission prompt. Tries once and retries with the
+    second budget if the output is empty, unrecoverable or (repaired but) missing contract keys --
+    usually cut off by num_predict. Raises ValueError if the retry is unusable too.
+    """
+    compact = config.wire == "compact"
+    fmt = response_format(config, compact_schema(rubric) if compact else contract_schema(rubric))
+    generated_before = stats.get("eval_count", 0)
+    for attempt, num_predict in enumerate(attempts):
+        raw = generate_text(prompt, config, num_predict, stats, fmt, client)
+        try:
+            with timed(stats, "extract_json"):
+                answer = extract_json(raw, stats)
+                result = expand_compact(answer, rubric) if compact else answer
+            with timed(stats, "validate_and_normalize"):
+                normalized = validate_and_normalize(result, rubric)
+            break
+        except ValueError:
+            if attempt:
+                raise
+    if compact:
+        record_wire_savings(stats, raw, answer, normalized, stats.get("eval_count", 0) - generated_before)
+    return raw, normalized
+
+
+def grade_with_fast_path(
+    rubric: Dict[str, Any],
+    submission_md: str,
+    config: GradeConfig,
+    empty_ids: List[str],
+    cache: Optional[GradeCache],
+    stats: Dict[str, Any],
+    client: Optional[OllamaClient] = None,
+    settled_points: float = 0.0,
+    total_points: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Scores the criteria in empty_ids as 0 without the model and grades only the rest
+    (nothing at all when every criterion is empty). Precheck flags for the zeroed criteria,
+    and all precheck flags when the model is skipped entirely, are kept deterministically.
+    Raises requests.RequestException on HTTP failures and ValueError on unusable model output.
+    """
+    with timed(stats, "precheck_flags"):
+        preflags = precheck_flags(submission_md)
+    remaining = [c for c in rubric["criteria"] if c["criterion_id"] not in empty_ids]
+    stats["fast_path_criteria"] = empty_ids
+
+    if remaining:
+        sub_rubric = dict(rubric, criteria=remaining,
+                          expected_total_points=sum(float(c["max_points"]) for c in remaining))
+        if total_points is None:
+            total_points = sum(float(c["max_points"]) for c in rubric["criteria"])
+        partial = grade_with_model(sub_rubric, submission_md, config, cache, stats, prefix_rubric=rubric,
+                                   client=client, settled_points=settled_points, total_points=total_points)
+        zeroed_flags = {f for cid in empty_ids for f in CRITERION_FLAGS.get(cid, [])}
+        # a model that still answers the zeroed criteria isn't an error; drop those repair flags
+        ignored = {f"unknown_criterion_id:{cid}" for cid in empty_ids}
+        flags = [f for f in partial["flags"] if f not in ignored]
+        flags += [f for f in preflags if f in zeroed_flags]
+    else:
+        partial = {
+            "criteria": [],
+            "overall_comment": "Submission is still the blank template; graded without a model call.",
+        }
+        flags = preflags
+
+    merged = {
+        "score_total": 0,
+        "criteria": partial["criteria"] + [
+            {"criterion_id": cid, "points": 0, "comment": NO_EVIDENCE_COMMENT} for cid in empty_ids
+        ],
+        "overall_comment": partial["overall_comment"],
+        "flags": flags,
+    }
+    with timed(stats, "validate_and_normalize"):
+        return validate_and_normalize(merged, rubric)
+
+
+def regrade_stale_criteria(
+    rubric: Dict[str, Any],
+    submission_md: str,
+    previous: Dict[str, Any],
+    previous_fingerprints: Dict[str, str],
+    config: GradeConfig,
+    cache: Optional[GradeCache] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    client: Optional[OllamaClient] = None,
+) -> Dict[str, Any]:
+    """
+    Incremental regrade against a stored result and its criterion fingerprints: only criteria
+    whose criterion_fingerprints() entry changed (or that previous lacks) are graded, and the
+    pieces are merged into previous through validate_and_normalize. Kept criteria keep their
+    points, comments and flags and the overall comment is kept. Signoff flags come from the
+    regrade's answer, as in a full grade. With nothing stale, previous is returned unchanged
+    (no model call).
+    stats gets "regraded_criteria" (ids).
+    Raises requests.RequestException on HTTP failures and ValueError on unusable model output.
+    """
+    if stats is None:
+        stats = {}
+    fingerprints = criterion_fingerprints(rubric, submission_md)
+    previous_ids = {c["criterion_id"] for c in previous.get("criteria", [])}
+    stale = [cid for cid, fp in fingerprints.items() if cid not in previous_ids or previous_fingerprints.get(cid) != fp]
+    stats["regraded_criteria"] = stale
+    if not stale:
+        return previous
+    if len(stale) == len(fingerprints):
+        return grade_submission_text(rubric, submission_md, config, cache, stats, client)
+
+    def concerns(flag: str, ids: List[str]) -> bool:
+        return any(flag in CRITERION_FLAGS.get(cid, []) or flag.endswith(":" + cid) for cid in ids)
+
+    signoff = {FLAG_MISSING_SIGNOFF_A, FLAG_MISSING_SIGNOFF_B}
+    replaced = stale + sorted(previous_ids - set(fingerprints))  # regraded, or dropped from the rubric
+    criteria = [c for c in previous["criteria"] if c["criterion_id"] in fingerprints and c["criterion_id"] not in stale]
+    flags = [f for f in previous.get("flags", []) if f not in signoff and not concerns(f, replaced)]
+    sub_rubric = dict(rubric, criteria=[c for c in rubric["criteria"] if c["criterion_id"] in stale])
+    sub_rubric["expected_total_points"] = sum(float(c["max_points"]) for c in sub_rubric["criteria"])
+    settled = sum(float(c["points"]) for c in criteria)
+    total = sum(float(c["max_points"]) for c in rubric["criteria"])
+    partial = grade_submission_text(sub_rubric, submission_md, config, cache, stats, client, settled, total)
+    criteria += partial["criteria"]
+    flags += [f for f in partial["flags"] if f in signoff or concerns(f, stale)]
+
+    merged = {
+        "score_total": 0,
+        "criteria": criteria,
+        "overall_comment": previous.get("overall_comment", ""),
+        "flags": flags,
+    }
+    with timed(stats, "validate_and_normalize"):
+        return validate_and_normalize(merged, rubric)
 
-def parse_attrs(attr_text: str) -> Dict[str, str]:
-    attrs: Dict[str, str] = {}
-    for m in re.finditer(r'(\w+)\s*=\s*"([^"]*)"', attr_text):
-        attrs[m.group(1)] = m.group(2)
-    return attrs
 
+MICRO_BATCH_CACHE_TAG = "[micro-batch]\n"
 
-def extract_criteria_blocks(submission_md: str) -> Dict[str, str]:
+
+def grade_micro_batch_text(
+    rubric: Dict[str, Any],
+    items: List[Tuple[str, str]],
+    config: GradeConfig,
+    cache: Optional[GradeCache] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    client: Optional[OllamaClient] = None,
+    escalations: Optional[Dict[str, List[str]]] = None,
+) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Grades several (submission_id, markdown) items with one model call and splits the answer.
+    Returns submission_id -> normalized result, or None for an item whose entry is missing, does
+    not validate cleanly (any repair flag from validate_and_normalize) or, with a cascade, would
+    be escalated; callers grade those on their own. With a cascade, escalations (if given) gets
+    submission_id -> escalation reasons for the entries the larger model should grade, so callers
+    skip a second base-model pass. Entries are cached per submission (under the submission's own
+    prompt tail, tagged as micro-batch output).
+    Raises requests.RequestException on HTTP failures and ValueError if no usable answer came back.
+    """
+    if stats is None:
+        stats = {}
+    results: Dict[str, Optional[Dict[str, Any]]] = {}
+    keys: Dict[str, str] = {}
+    with timed(stats, "build_prompt"):
+        pending = micro_batch_pending(rubric, items, config, cache, results, keys)
+        if not pending:
+            return results
+        prompt = build_micro_batch_prompt(rubric, pending)
+        record_micro_batch_prompt(prompt, rubric, items, pending, config, stats)
+
+    ids = [submission_id for submission_id, _, _ in pending]
+    raw, entries = generate_micro_batch(prompt, rubric, ids, config, stats, client)
+    preflags_by_id = {submission_id: preflags for submission_id, _, preflags in pending}
+    with timed(stats, "validate_and_normalize"):
+        for entry in entries:
+            submission_id = entry.get("id") if isinstance(entry, dict) else None
+            if submission_id not in preflags_by_id or submission_id in results:
+                continue
+            results[submission_id], reasons = settle_micro_batch_entry(entry, rubric, preflags_by_id[submission_id],
+                                                                       config)
+            if reasons and escalations is not None:
+                escalations[submission_id] = reasons
+            if cache and results[submission_id] is not None:
+                cache.put(keys[submission_id], raw, results[submission_id])
+    for submission_id in ids:
+        results.setdefault(submission_id, None)
+    return results
+
+
+def micro_batch_pending(
+    rubric: Dict[str, Any],
+    items: List[Tuple[str, str]],
+    config: GradeConfig,
+    cache: Optional[GradeCache],
+    results: Dict[str, Optional[Dict[str, Any]]],
+    keys: Dict[str, str],
+) -> List[Tuple[str, str, List[str]]]:
     """
-    Returns mapping criterion_id -> body text from the submission.
+    The (submission_id, prompt markdown, precheck flags) items the model still has to grade.
+    Cache hits go straight into results; keys gets each item's cache key.
     """
-    out: Dict[str, str] = {}
-    for m in CRITERION_RE.finditer(submission_md):
-        attrs = parse_attrs(m.group("attrs"))
-        cid = attrs.get("id", "").strip()
-        body = (m.group("body") or "").strip()
-        if cid:
-            out[cid] = body
-    return out
+    pending = []
+    for submission_id, submission_md in items:
+        preflags = precheck_flags(submission_md)
+        md = compact_submission(submission_md, config.template_lines) if config.compact_prompt else submission_md
+        if cache:
+            keys[submission_id] = GradeCache.make_key(
+                rubric, config, MICRO_BATCH_CACHE_TAG + build_prompt_tail(rubric, md, preflags))
+            entry = cache.get(keys[submission_id])
+            if entry is not None:
+                results[submission_id] = entry["result"]
+                continue
+        pending.append((submission_id, md, preflags))
+    return pending
+
+
+def record_micro_batch_prompt(
+    prompt: str,
+    rubric: Dict[str, Any],
+    items: List[Tuple[str, str]],
+    pending: List[Tuple[str, str, List[str]]],
+    config: GradeConfig,
+    stats: Dict[str, Any],
+) -> None:
+    """
+    Records the micro-batch prompt's size (and, with --compact-prompt, the uncompacted size) into stats.
+    """
+    if config.compact_prompt:
+        originals = dict(items)
+        full = [(sid, originals[sid], preflags) for sid, _, preflags in pending]
+        stats["prompt_chars_full"] = len(build_micro_batch_prompt(rubric, full))
+    else:
+        stats["prompt_chars_full"] = len(prompt)
+    stats["prompt_chars"] = len(prompt)
+    stats["prompt_sha256"] = sha256_text(prompt)
 
 
-def precheck_flags(submission_md: str) -> List[str]:
+def generate_micro_batch(
+    prompt: str,
+    rubric: Dict[str, Any],
+    ids: List[str],
+    config: GradeConfig,
+    stats: Dict[str, Any],
+    client: Optional[OllamaClient] = None,
+) -> Tuple[str, List[Any]]:
     """
-    Deterministic checks for the most common "this should never be subjective" stuff.
+    (raw output, result entries) for a micro-batch prompt, retried once with the larger budget.
+    Raises ValueError if neither answer has a "results" list.
     """
-    flags: List[str] = []
-
-    # signoff checks
-    sm = SIGNOFF_RE.search(submission_md)
-    if sm:
-        body = sm.group("body")
-        # crude but effective: look for non-empty after colon
-        a = re.search(r"Student A initials:\s*(.+)", body)
-        b = re.search(r"Student B initials.*:\s*(.+)", body)
-        if not a or not a.group(1).strip():
-            flags.append(FLAG_MISSING_SIGNOFF_A)
-        if not b or not b.group(1).strip():
-            flags.append(FLAG_MISSING_SIGNOFF_B)
-    else:
-        flags.append(FLAG_MISSING_SIGNOFF_A)
-        flags.append(FLAG_MISSING_SIGNOFF_B)
-
-    # checkbox selection count in next_time block (anywhere in file is ok, but ideally in that block)
-    checks = CHECKBOX_RE.findall(submission_md)
-    selected = sum(1 for x, _lbl in checks if x.strip().lower() == "x")
-    if selected != 1:
-        flags.append(FLAG_MISSING_NEXT_TIME_CHOICE)
-
-    # basic evidence checks for specific criteria sections
-    blocks = extract_criteria_blocks(submission_md)
-
-    ws = blocks.get("work_summary", "")
-    if not ws or ("Goal" in ws and re.search(r"Goal.*:\s*$", ws, re.MULTILINE)) or ("Result" in ws and re.search(r"Result.*:\s*$", ws, re.MULTILINE)):
-        # If template lines are still blank, flag it
-        if re.search(r"Goal.*:\s*$", ws, re.MULTILINE) or re.search(r"Result.*:\s*$", ws, re.MULTILINE):
-            flags.append(FLAG_MISSING_WORK_SUMMARY)
-
-    snag = blocks.get("snag", "")
-    if not snag or re.search(r"Snag.*:\s*$", snag, re.MULTILINE) or re.search(r"Response.*:\s*$", snag, re.MULTILINE):
-        if re.search(r"Snag.*:\s*$", snag, re.MULTILINE) or re.search(r"Response.*:\s*$", snag, re.MULTILINE):
-            flags.append(FLAG_MISSING_SNAG)
-
-    # pair_type: if human_llm, require reflection lines in roles section
-    meta = META_RE.search(submission_md)
-    pair_type = ""
-    if meta:
-        body = meta.group("body")
-        mpt = re.search(r"pair_type:\s*(.+)", body)
-        if mpt:
-            pair_type = mpt.group(1).strip()
-
-    if "human_llm" in pair_type:
-        roles = blocks.get("roles", "")
-        # require Kept/Rejected/Why
-        missing = []
-        for key in ("Kept", "Rejected", "Why"):
-            if not re.search(rf"^{key}.*:\s*\S+", roles, re.MULTILINE):
-                missing.append(key)
-        if missing:
-            flags.append(FLAG_MISSING_LLM_REFLECTION)
-
-    # de-dupe while preserving order
-    seen = set()
-    out_flags = []
-    for f in flags:
-        if f not in seen:
-            seen.add(f)
-            out_flags.append(f)
-    return out_flags
-
-
-def build_prompt(rubric: Dict[str, Any], submission_md: str, preflags: List[str]) -> str:
-    """
-    Tell the model exactly what the rubric is AND exactly what flags are allowed.
-    Also: forbid it from judging checkbox "quality" (only "exactly one selected").
-    """
-    schema = """{
-  "score_total": number,
-  "criteria": [
-    { "criterion_id": string, "points": number, "comment": string }
-  ],
-  "overall_comment": string,
-  "flags": [string]
-}"""
-
-    # List criteria
-    criteria_lines = []
-    for c in rubric["criteria"]:
-        criteria_lines.append(
-            f'- {c["criterion_id"]} (max {c["max_points"]}): {c["prompt"][:260].strip()}'
-        )
-    criteria_text = "\n".join(criteria_lines)
-
-    allowed_flags = [
-        FLAG_MISSING_SIGNOFF_A,
-        FLAG_MISSING_SIGNOFF_B,
-        FLAG_MISSING_LLM_REFLECTION,
-        FLAG_MISSING_WORK_SUMMARY,
-        FLAG_MISSING_SNAG,
-        FLAG_MISSING_NEXT_TIME_CHOICE,
-    ]
-
-    prompt = f"""
-You are grading ONE student submission against a rubric.
-
-STRICT OUTPUT:
-- Output ONLY valid JSON (no markdown, no commentary).
-- Must match this JSON schema exactly:
-{schema}
-
-RUBRIC:
-- total_points: {rubric.get("expected_total_points", rubric.get("total_points", 10))}
-- criteria:
-{criteria_text}
-
-NON-NEGOTIABLE RULES:
-- Use only evidence in the submission.
-- Each criterion_id must appear exactly once in criteria[].
-- points must be between 0 and that criterion's max_points.
-- score_total must equal the sum of points.
-- Keep comments short, specific, and tied to evidence.
-- For "next_time": DO NOT judge the *type* of checkbox chosen. Only require that EXACTLY ONE checkbox is selected and that one-sentence plan exists.
-
-FLAGS:
-- flags[] may ONLY contain items from this allowlist:
-{json.dumps(allowed_flags, indent=2)}
-
-PRECHECK (deterministic findings):
-- If any of these are present, include them in flags[] (unless you verify the submission actually satisfies it):
-{json.dumps(preflags, indent=2)}
-
-SUBMISSION (markdown):
-{submission_md}
-""".strip()
-
-    return prompt
-
-
-def ollama_generate(
-    host: str,
-    model: str,
+    fmt = response_format(config, micro_batch_schema(rubric, ids))
+    attempts = num_predict_attempts(config, len(rubric["criteria"]) * len(ids), len(ids))
+    for attempt, num_predict in enumerate(attempts):
+        raw = generate_text(prompt, config, num_predict, stats, fmt, client)
+        try:
+            with timed(stats, "extract_json"):
+                entries = extract_json(raw, stats).get("results")
+                if not isinstance(entries, list):
+                    raise ValueError("micro-batch output: 'results' must be a list")
+            break
+        except ValueError:
+            if attempt:
+                raise
+    return raw, entries
+
+
+def settle_micro_batch_entry(
+    entry: Dict[str, Any],
+    rubric: Dict[str, Any],
+    preflags: List[str],
+    config: GradeConfig,
+) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    (normalized result, or None if the entry must be graded again, escalation reasons) for one
+    micro-batch entry. Reasons are only returned with a cascade; an unusable entry's reason is
+    unusable:<exception name>.
+    """
+    try:
+        normalized = validate_and_normalize({k: v for k, v in entry.items() if k != "id"}, rubric)
+        reasons = escalation_reasons(normalized, preflags, rubric, config)
+    except ValueError as exc:
+        normalized, reasons = None, [f"unusable:{type(exc).__name__}"]
+    if config.escalation is None:
+        reasons = []
+    if normalized is not None:
+        repaired = any(f.startswith(REPAIR_FLAG_PREFIXES) for f in normalized["flags"])
+        if repaired or reasons:
+            normalized = None
+    return normalized, reasons
+
+
+def grade_criterion(
+    rubric: Dict[str, Any],
+    criterion: Dict[str, Any],
     prompt: str,
-    num_predict: int,
-    temperature: float,
-    timeout_s: int,
-) -> str:
-    url = host.rstrip("/") + "/api/generate"
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "temperature": temperature,
-            "num_predict": num_predict,
-            # stop early if it tries to start formatting
-            "stop": ["```", "\n\n\n"],
-        },
+    config: GradeConfig,
+    cache: Optional[GradeCache],
+    stats: Optional[Dict[str, Any]] = None,
+    client: Optional[OllamaClient] = None,
+) -> Dict[str, Any]:
+    """
+    Grades one criterion prompt, retrying it alone once if the output is empty, unparseable or malformed.
+    Returns {"points", "comment", "flags"} with flags limited to that criterion's allowlist.
+    Raises requests.RequestException on HTTP failures and ValueError if both attempts fail.
+    """
+    if stats is None:
+        stats = {}
+    cache_key = GradeCache.make_key(rubric, config, prompt) if cache else ""
+    if cache:
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry["result"]
+
+    last_error: Optional[Exception] = None
+    fmt = response_format(config, criterion_schema(criterion))
+    for num_predict in num_predict_attempts(config, 1):
+        raw = generate_text(prompt, config, num_predict, stats, fmt, client)
+        try:
+            with timed(stats, "extract_json"):
+                piece = extract_json(raw, stats)
+                if "points" not in piece:
+                    raise ValueError("missing 'points' (output cut off?)")
+                flags = piece.get("flags", [])
+                if not isinstance(flags, list):
+                    raise ValueError(f"'flags' must be a list, got {type(flags).__name__}")
+            break
+        except ValueError as exc:
+            last_error = exc
+    else:
+        raise ValueError(f"criterion {criterion['criterion_id']}: {last_error}")
+
+    allowed = CRITERION_FLAGS.get(criterion["criterion_id"], [])
+    graded = {
+        "points": piece.get("points"),
+        "comment": str(piece.get("comment", "")).strip(),
+        "flags": [f for f in flags if f in allowed],
+    }
+    if cache:
+        cache.put(cache_key, raw, graded)
+    return graded
+
+
+def grade_per_criterion(
+    rubric: Dict[str, Any],
+    submission_md: str,
+    config: GradeConfig,
+    cache: Optional[GradeCache] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    client: Optional[OllamaClient] = None,
+) -> Dict[str, Any]:
+    """
+    Per-criterion engine: one small concurrent model call per criterion found in the submission,
+    merged into the contract schema via validate_and_normalize. Criteria without a block in the
+    submission are left to validate_and_normalize (0 points + missing_criterion flag).
+    Signoff prechecks are carried over directly since no criterion prompt sees the signoff.
+    The calls wait for the shared client's in-flight slots, so batch workers times criteria
+    never puts more than --concurrency calls on a host.
+    Raises requests.RequestException on HTTP failures and ValueError on unusable model output.
+    """
+    if stats is None:
+        stats = {}
+    with timed(stats, "precheck_flags"):
+        preflags = precheck_flags(submission_md)
+    blocks = criteria_answers(submission_md)
+    criteria = [c for c in rubric["criteria"] if c["criterion_id"] in blocks]
+    with timed(stats, "build_prompt"):
+        prompts, trimmed = build_criterion_prompts(criteria, blocks, extract_pair_type(submission_md), preflags,
+                                                   config, stats)
+
+    call_stats: Dict[str, Dict[str, Any]] = {c["criterion_id"]: {} for c in criteria}
+    with ThreadPoolExecutor(max_workers=max(1, len(criteria))) as pool:
+        futures = {
+            cid: pool.submit(grade_criterion, rubric, c, prompts[cid], config, cache, call_stats[cid], client)
+            for c in criteria
+            for cid in [c["criterion_id"]]
+        }
+        pieces = {cid: fut.result() for cid, fut in futures.items()}
+    for part in call_stats.values():
+        merge_stats(stats, part)
+
+    stats["criterion_calls"] = len(criteria)
+    stats["prompt_chars"] = sum(len(p) for p in prompts.values())
+    stats["prompt_sha256"] = sha256_text("".join(prompts[c["criterion_id"]] for c in criteria))
+    with timed(stats, "validate_and_normalize"):
+        return validate_and_normalize(merge_criterion_pieces(pieces, preflags, trimmed), rubric)
+
+
+def build_criterion_prompts(
+    criteria: List[Dict[str, Any]],
+    blocks: Dict[str, str],
+    pair_type: str,
+    preflags: List[str],
+    config: GradeConfig,
+    stats: Dict[str, Any],
+) -> Tuple[Dict[str, str], List[str]]:
+    """
+    criterion_id -> prompt for each criterion (compacted and trimmed to the budget as configured),
+    and the ids of criteria whose answers were trimmed. stats gets the uncompacted prompt size.
+    """
+    prompts = {}
+    trimmed: List[str] = []
+    first_predict = num_predict_attempts(config, 1)[0]
+    stats["prompt_chars_full"] = 0
+    for c in criteria:
+        body = blocks[c["criterion_id"]]
+        prompt = build_criterion_prompt(c, body, pair_type, preflags, config.prompt_layout)
+        stats["prompt_chars_full"] += len(prompt)
+        if config.compact_prompt:
+            body = strip_template_lines(body, config.template_lines) or "(blank)"
+            prompt = build_criterion_prompt(c, body, pair_type, preflags, config.prompt_layout)
+
+        def shrink(excess_chars: int) -> Tuple[str, List[str]]:
+            short = trim_text(body, max(0, len(body) - excess_chars - len(TRIMMED_MARKER)))
+            return build_criterion_prompt(c, short, pair_type, preflags, config.prompt_layout), [c["criterion_id"]]
+
+        prompts[c["criterion_id"]], cut = fit_prompt(prompt, config, first_predict, shrink, stats)
+        trimmed += cut
+    return prompts, trimmed
+
+
+def merge_criterion_pieces(pieces: Dict[str, Dict[str, Any]], preflags: List[str], trimmed: List[str]) -> Dict[str, Any]:
+    """
+    The per-criterion answers as one contract result (before validate_and_normalize). Precheck
+    flags tied to a criterion are dropped: each criterion's own answer decides those.
+    """
+    criterion_flags = {f for flags in CRITERION_FLAGS.values() for f in flags}
+    flags = [f for f in preflags if f not in criterion_flags]
+    for piece in pieces.values():
+        flags += piece["flags"]
+    flags += [TRIMMED_FLAG_PREFIX + cid for cid in trimmed]
+    return {
+        "score_total": 0,
+        "criteria": [
+            {"criterion_id": cid, "points": piece["points"], "comment": piece["comment"]}
+            for cid, piece in pieces.items()
+        ],
+        "overall_comment": "Graded criterion by criterion; see the comment on each criterion.",
+        "flags": flags,
     }
-    r = requests.post(url, json=payload, timeout=timeout_s)
-    r.raise_for_status()
-    data = r.json()
-    resp = data.get("response", "") or ""
-    return resp.strip()
 
 
-def extract_json(text: str) -> Dict[str, Any]:
-    text = text.strip()
-    if text.startswith("{") and text.endswith("}"):
-        return json.loads(text)
+def write_feedback(normalized: Dict[str, Any], rubric: Dict[str, Any], out_json: Path, out_txt: Path) -> None:
+    out_json.write_text(json.dumps(normalized, indent=2), encoding="utf-8")
+    out_txt.write_text(render_human_text(normalized, rubric), encoding="utf-8")
 
-    m = JSON_OBJ_RE.search(text)
-    if not m:
-        raise ValueError("Model output did not contain a JSON object.")
-    return json.loads(m.group(0))
 
+def find_submissions(submissions_dir: str, pattern: str) -> List[Path]:
+    """
+    Lists submission files under submissions_dir matching pattern, sorted by name.
+    Files starting with "_" (e.g. _TEMPLATE_pp.md) are skipped.
+    Raises FileNotFoundError if the directory does not exist.
+    """
+    root = Path(submissions_dir)
+    if not root.is_dir():
+        raise FileNotFoundError(f"Submissions directory not found: {submissions_dir}")
+    return sorted(p for p in root.glob(pattern) if p.is_file() and not p.name.startswith("_"))
 
-def validate_and_normalize(result: Dict[str, Any], rubric: Dict[str, Any]) -> Dict[str, Any]:
-    required_keys = {"score_total", "criteria", "overall_comment", "flags"}
-    missing = required_keys - set(result.keys())
-    if missing:
-        raise ValueError(f"Missing keys in result JSON: {sorted(missing)}")
 
-    if not isinstance(result["criteria"], list):
-        raise ValueError("criteria must be a list")
+def default_concurrency() -> int:
+    """
+    Matches the worker pool to the server's parallel slots when OLLAMA_NUM_PARALLEL is set.
+    """
+    env_value = os.environ.get("OLLAMA_NUM_PARALLEL", "").strip()
+    if env_value.isdigit() and int(env_value) > 0:
+        return int(env_value)
+    return 4
 
-    max_map = {c["criterion_id"]: float(c["max_points"]) for c in rubric["criteria"]}
-    order = list(max_map.keys())
 
-    seen = set()
-    normalized_criteria = []
-    extra_flags: List[str] = []
+def worker_count(concurrency: int, client: Optional[OllamaClient]) -> int:
+    """
+    Submissions graded at once: --concurrency per host, so every extra host adds throughput
+    (each host's client still bounds its own in-flight calls).
+    """
+    hosts = len(client.clients) if isinstance(client, OllamaPool) else 1
+    return max(1, concurrency) * hosts
 
-    for item in result["criteria"]:
-        cid = item.get("criterion_id")
-        pts = item.get("points")
-        comment = item.get("comment", "")
 
-        if cid not in max_map:
-            extra_flags.append(f"unknown_criterion_id:{cid}")
-            continue
-        if cid in seen:
-            extra_flags.append(f"duplicate_criterion_id:{cid}")
-            continue
-        seen.add(cid)
+def grading_run_key(rubric: Dict[str, Any], config: GradeConfig) -> Dict[str, str]:
+    """
+    What a stored grade depends on besides the submission: the rubric, the model and a hash of
+    every config option that can change a result (transport settings like host, timeout or
+    streaming are left out). Journal "done" events carry it so --resume can tell stale grades.
+    """
+    options = {
+        "engine": config.engine,
+        "num_predict": config.num_predict,
+        "temperature": config.temperature,
+        "fast_path": config.fast_path,
+        "compact_prompt": config.compact_prompt,
+        "template_lines": sorted(config.template_lines),
+        "response_format": config.response_format,
+        "prompt_layout": config.prompt_layout,
+        "wire": config.wire,
+        "max_ctx": config.budget.max_ctx if config.budget else None,
+        "micro_batch": config.micro_batch,
+        "escalation": [config.escalation.model, config.escalation.num_predict, list(config.escalate_cutoffs),
+                       config.escalate_margin] if config.escalation else None,
+    }
+    return {
+        "rubric_sha256": rubric_sha256(rubric),
+        "model": config.model,
+        "config_sha256": sha256_text(json.dumps(options, sort_keys=True)),
+    }
+
 
+def retry_delay(attempt: int, backoff_s: float, max_s: float = 60.0) -> float:
+    """
+    Exponential backoff with jitter: ~backoff_s, 2*backoff_s, 4*backoff_s, ... capped at max_s.
+    """
+    return min(max_s, backoff_s * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+def grade_file(
+    rubric: Dict[str, Any],
+    path: Path,
+    config: GradeConfig,
+    out_dir: Path,
+    cache: Optional[GradeCache] = None,
+    retries: int = 0,
+    backoff_s: float = 2.0,
+    journal: Optional[BatchJournal] = None,
+    prior: Optional[Tuple[Dict[str, Any], Dict[str, str]]] = None,
+    client: Optional[OllamaClient] = None,
+) -> Dict[str, Any]:
+    """
+    Grades one submission file and writes <out_dir>/<stem>.json and .txt.
+    Returns a summary row; HTTP and parse failures are recorded in the row instead of raised,
+    so one bad submission never stops a batch. Transient failures are retried up to `retries`
+    times with exponential backoff; every attempt is recorded in the journal if one is given.
+    prior (stored result, criterion fingerprints) switches to regrade_stale_criteria(); the row is
+    marked "unchanged" when that reproduces the stored result and fingerprints exactly.
+    """
+    row: Dict[str, Any] = {"submission": str(path), "student": path.stem}
+    stats: Dict[str, Any] = {}
+    started = time.perf_counter()
+    attempt = 0
+    while True:
+        attempt += 1
+        if journal:
+            journal.record(path, "in_flight", attempt=attempt)
         try:
-            pts_f = float(pts)
-        except Exception:
-            pts_f = 0.0
-            extra_flags.append(f"non_numeric_points:{cid}")
+            with timed(stats, "load_submission"):
+                submission_md = load_submission(str(path))
+            if prior is not None:
+                normalized = regrade_stale_criteria(rubric, submission_md, prior[0], prior[1], config, cache, stats,
+                                                    client)
+            else:
+                normalized = grade_submission_text(rubric, submission_md, config, cache, stats, client)
+            break
+        except (requests.RequestException, ValueError) as exc:
+            transient = is_transient_error(exc)
+            if journal:
+                state = "retrying" if transient and attempt <= retries else "failed"
+                journal.record(path, state, attempt=attempt, error_class=type(exc).__name__, error=str(exc))
+            if transient and attempt <= retries:
+                time.sleep(retry_delay(attempt, backoff_s))
+                continue
+            row.update({"status": "failed", "error": f"{type(exc).__name__}: {exc}",
+                        "error_class": type(exc).__name__, "transient": transient, "attempts": attempt,
+                        "elapsed_s": time.perf_counter() - started, **stats})
+            return row
+
+    row = finish_row(row, rubric, path, submission_md, normalized, out_dir, journal, attempt,
+                     elapsed_s=time.perf_counter() - started, **stats)
+    if prior is not None and normalized == prior[0] and row["criterion_fingerprints"] == prior[1]:
+        row["unchanged"] = True
+    return row
+
+
+def finish_row(
+    row: Dict[str, Any],
+    rubric: Dict[str, Any],
+    path: Path,
+    submission_md: str,
+    normalized: Dict[str, Any],
+    out_dir: Path,
+    journal: Optional[BatchJournal],
+    attempt: int,
+    **details: Any,
+) -> Dict[str, Any]:
+    """
+    Writes a graded submission's feedback files, completes its summary row (row, the result, then
+    details) and marks it done in the journal. Returns the row.
+    """
+    out_json = out_dir / f"{path.stem}.json"
+    write_feedback(normalized, rubric, out_json, out_dir / f"{path.stem}.txt")
+    row.update({
+        "status": "ok",
+        "score_total": normalized["score_total"],
+        "flags": normalized["flags"],
+        "out_json": str(out_json),
+        "result": normalized,
+        "submission_sha256": sha256_text(submission_md),
+        "criterion_fingerprints": criterion_fingerprints(rubric, submission_md),
+        "attempts": attempt,
+        **details,
+    })
+    if journal:
+        journal.record(path, "done", attempt=attempt, sha256=row["submission_sha256"],
+                       score_total=row["score_total"], flags=row["flags"], out_json=row["out_json"])
+    return row
+
+
+def plan_micro_batches(
+    rubric: Dict[str, Any],
+    paths: List[Path],
+    config: GradeConfig,
+) -> Tuple[List[List[Path]], List[Path]]:
+    """
+    Splits paths into micro-batches of up to config.micro_batch submissions and the rest.
+    Only submissions the whole engine would send to the model in full qualify (no fast-path
+    criteria); a batch grows while its estimated prompt still fits config.budget's max_ctx next
+    to the generation budget for all its results.
+    Returns (batches of two or more paths, paths to grade one at a time).
+    """
+    if config.micro_batch <= 1 or config.engine != "whole" or config.budget is None:
+        return [], list(paths)
+    budget = config.budget
+    head_chars = len(build_micro_batch_prompt(rubric, []))
+    item_predict = budget.num_predict(len(rubric["criteria"]), config.num_predict)
+
+    def fits(n: int, chars: int) -> bool:
+        return chars <= budget.max_prompt_chars(config.model, item_predict * n)
+
+    batches: List[List[Path]] = []
+    singles: List[Path] = []
+    current: List[Path] = []
+    current_chars = head_chars
+    for path in paths:
+        submission_md = load_submission(str(path))
+        if config.fast_path and find_empty_criteria(rubric, submission_md):
+            singles.append(path)
+            continue
+        chars = len(submission_md) + 200  # id line and precheck list
+        if current and (len(current) >= config.micro_batch or not fits(len(current) + 1, current_chars + chars)):
+            batches.append(current)
+            current, current_chars = [], head_chars
+        if not fits(1, current_chars + chars):
+            singles.append(path)
+            continue
+        current.append(path)
+        current_chars += chars
+    if current:
+        batches.append(current)
+    singles += [p for batch in batches if len(batch) == 1 for p in batch]
+    return [batch for batch in batches if len(batch) > 1], singles
+
+
+def grade_left_out(
+    rubric: Dict[str, Any],
+    path: Path,
+    config: GradeConfig,
+    out_dir: Path,
+    cache: Optional[GradeCache],
+    retries: int,
+    backoff_s: float,
+    journal: Optional[BatchJournal],
+    client: Optional[OllamaClient],
+    reasons: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Grades a micro-batched submission without a usable batch result with grade_file(). With
+    escalation reasons the base model has already answered in the batch, so the cascade's
+    larger model grades it directly. Returns grade_file()'s row.
+    """
+    if reasons and config.escalation is not None:
+        row = grade_file(rubric, path, config.escalation, out_dir, cache, retries, backoff_s, journal, client=client)
+        row.update({"tier": "escalated", "escalation_reasons": reasons})
+    else:
+        row = grade_file(rubric, path, config, out_dir, cache, retries, backoff_s, journal, client=client)
+    row["micro_batch_fallback"] = True
+    return row
+
+
+def grade_micro_batch(
+    rubric: Dict[str, Any],
+    paths: List[Path],
+    config: GradeConfig,
+    out_dir: Path,
+    cache: Optional[GradeCache] = None,
+    retries: int = 0,
+    backoff_s: float = 2.0,
+    journal: Optional[BatchJournal] = None,
+    client: Optional[OllamaClient] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Grades several submission files with one model call (grade_micro_batch_text) and writes each
+    one's feedback. Any submission without a clean result, or all of them when the call itself
+    fails, is graded on its own by grade_left_out() (which retries transient failures).
+    Returns one summary row per path; the call's stats are split evenly across its rows.
+    """
+    stats: Dict[str, Any] = {"graded_by": config.model}
+    if config.escalation:
+        stats["tier"] = "base"
+    started = time.perf_counter()
+    with timed(stats, "load_submission"):
+        texts = {p: load_submission(str(p)) for p in paths}
+    ids = {f"S{i + 1}": p for i, p in enumerate(paths)}
+    if journal:
+        for p in paths:
+            journal.record(p, "in_flight", attempt=1, micro_batch=len(paths))
+    escalations: Dict[str, List[str]] = {}
+    try:
+        results = grade_micro_batch_text(rubric, [(sid, texts[p]) for sid, p in ids.items()], config, cache, stats,
+                                         client, escalations)
+    except (requests.RequestException, ValueError) as exc:
+        results = {}
+        stats["micro_batch_error"] = f"{type(exc).__name__}: {exc}"
+    elapsed_s = time.perf_counter() - started
+
+    rows = []
+    for i, (sid, path) in enumerate(ids.items()):
+        normalized = results.get(sid)
+        if normalized is None:
+            rows.append(grade_left_out(rubric, path, config, out_dir, cache, retries, backoff_s, journal, client,
+                                       escalations.get(sid)))
+            continue
+        row = {**share_stats(stats, i, len(paths)), "submission": str(path), "student": path.stem}
+        rows.append(finish_row(row, rubric, path, texts[path], normalized, out_dir, journal, 1,
+                               micro_batch=len(paths), elapsed_s=elapsed_s))
+    return rows
 
-        max_pts = max_map[cid]
-        if pts_f < 0:
-            pts_f = 0.0
-        if pts_f > max_pts:
-            pts_f = max_pts
 
-        normalized_criteria.append({"criterion_id": cid, "points": pts_f, "comment": str(comment).strip()})
+def share_stats(stats: Dict[str, Any], i: int, n: int) -> Dict[str, Any]:
+    """
+    Submission i's share of stats from a call made for n submissions: counters split so they still
+    sum to the call's totals, times split evenly, other values copied.
+    """
+    split: Dict[str, Any] = {}
+    for k, v in stats.items():
+        if isinstance(v, bool) or not isinstance(v, (int, float)):
+            split[k] = v
+        elif isinstance(v, int):
+            split[k] = v // n + (1 if i < v % n else 0)
+        else:
+            split[k] = v / n
+    return split
+
+
+def grade_batch(
+    rubric: Dict[str, Any],
+    paths: List[Path],
+    config: GradeConfig,
+    out_dir: Path,
+    concurrency: int,
+    cache: Optional[GradeCache] = None,
+    verbose: bool = True,
+    on_row: Optional[Callable[[Dict[str, Any]], None]] = None,
+    retries: int = 0,
+    backoff_s: float = 2.0,
+    journal: Optional[BatchJournal] = None,
+    partners: Optional[Dict[str, List[Path]]] = None,
+    prior: Optional[Dict[str, Tuple[Dict[str, Any], Dict[str, str]]]] = None,
+    client: Optional[OllamaClient] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Grades many submissions through a bounded worker pool: concurrency workers per host
+    (see worker_count), one in-flight submission per worker.
+    Returns summary rows sorted by submission path. verbose logs one progress line per file;
+    on_row is called (from this thread) with each row as soon as its submission finishes.
+    partners maps a representative's path (str) to its partners' paths (all within paths): only
+    the representative is graded and its result is fanned out with grade_partner(); if it fails,
+    the partners are graded on their own.
+    prior maps a student (file stem) to its stored result and criterion fingerprints for an
+    incremental regrade (see grade_file); students without an entry are graded in full.
+    With config.micro_batch > 1, other submissions are packed into shared model calls
+    (plan_micro_batches / grade_micro_batch).
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    partners = partners or {}
+    prior = prior or {}
+    rows: List[Dict[str, Any]] = []
+    if journal:
+        for p in paths:
+            journal.record(p, "queued")
+    batches, singles = plan_batch(rubric, paths, config, partners, prior)
+    with ThreadPoolExecutor(max_workers=worker_count(concurrency, client)) as pool:
+        def submit(path: Path) -> Future:
+            return pool.submit(lambda: [grade_file(rubric, path, config, out_dir, cache, retries, backoff_s, journal,
+                                                   prior.get(path.stem), client)])
+
+        pending = {submit(p) for p in singles}
+        pending |= {pool.submit(grade_micro_batch, rubric, batch, config, out_dir, cache, retries, backoff_s, journal,
+                                client)
+                    for batch in batches}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for row in (row for fut in done for row in fut.result()):
+                finished = [row]
+                for partner in partners.get(row["submission"], []):
+                    if row["status"] == "ok":
+                        finished.append(grade_partner(rubric, row, partner, out_dir, journal))
+                    else:
+                        pending.add(submit(partner))
+                for done_row in finished:
+                    rows.append(done_row)
+                    if on_row:
+                        on_row(done_row)
+                    if verbose:
+                        logger.info("[%d/%d] %s", len(rows), len(paths), describe_progress(done_row))
+    rows.sort(key=lambda r: r["submission"])
+    return rows
+
+
+def plan_batch(
+    rubric: Dict[str, Any],
+    paths: List[Path],
+    config: GradeConfig,
+    partners: Dict[str, List[Path]],
+    prior: Dict[str, Tuple[Dict[str, Any], Dict[str, str]]],
+) -> Tuple[List[List[Path]], List[Path]]:
+    """
+    (micro-batches, single submissions) to grade: partners are left out (their representative's
+    result is fanned out) and submissions with a stored result are always graded singly.
+    """
+    fanned_out = {str(p) for group in partners.values() for p in group}
+    own = [p for p in paths if str(p) not in fanned_out]
+    batches, singles = plan_micro_batches(rubric, [p for p in own if p.stem not in prior], config)
+    return batches, singles + [p for p in own if p.stem in prior]
 
-    for cid in max_map.keys():
-        if cid not in seen:
-            normalized_criteria.append({"criterion_id": cid, "points": 0.0, "comment": "No evidence found."})
-            extra_flags.append(f"missing_criterion:{cid}")
 
-    normalized_criteria.sort(key=lambda x: order.index(x["criterion_id"]))
-    score_total = sum(c["points"] for c in normalized_criteria)
+def describe_progress(row: Dict[str, Any]) -> str:
+    """
+    One batch progress line: student, status and score (or error), plus how the row came about.
+    """
+    detail = row.get("score_total") if row["status"] == "ok" else row.get("error")
+    if row.get("duplicate_of"):
+        detail = f"{detail}, same as {Path(row['duplicate_of']).stem}"
+    elif row.get("unchanged"):
+        detail = f"{detail}, unchanged"
+    elif row.get("regraded_criteria") is not None:
+        detail = f"{detail}, regraded: {', '.join(row['regraded_criteria']) or 'none'}"
+    return f"{row['student']}: {row['status']} ({detail})"
+
+
+def find_partner_groups(
+    paths: List[Path],
+    template_lines: FrozenSet[str],
+    threshold: float,
+) -> Tuple[Dict[str, List[Path]], List[SimilarPair]]:
+    """
+    Indexes each submission's answer text (template boilerplate removed) and :::meta participants.
+    Returns ({representative: [partner paths]}, all near-duplicate pairs); the representative is
+    the first path of each partner group in sorted order.
+    """
+    index = SimilarityIndex(threshold)
+    for path in paths:
+        submission_md = load_submission(str(path))
+        answers = criteria_answers(submission_md)
+        text = "\n".join(strip_template_lines(answers[cid], template_lines) for cid in sorted(answers))
+        doc = parse_document(submission_md)
+        meta = doc.first("meta")
+        index.add(str(path), text, parse_participants(doc.body(meta)) if meta else frozenset())
+    pairs = index.pairs()
+    groups = {group[0]: [Path(key) for key in group[1:]] for group in index.partner_groups(pairs)}
+    return groups, pairs
+
+
+def grade_partner(
+    rubric: Dict[str, Any],
+    rep_row: Dict[str, Any],
+    path: Path,
+    out_dir: Path,
+    journal: Optional[BatchJournal] = None,
+) -> Dict[str, Any]:
+    """
+    Gives a partner's near-duplicate submission its representative's grade without a model call.
+    Criteria, comments and non-signoff flags are copied; signoff flags come from the partner's
+    own prechecks (each partner signs separately). Returns a summary row like grade_file().
+    """
+    stats: Dict[str, Any] = {}
+    started = time.perf_counter()
+    with timed(stats, "load_submission"):
+        submission_md = load_submission(str(path))
+    with timed(stats, "precheck_flags"):
+        preflags = precheck_flags(submission_md)
+    signoff = {FLAG_MISSING_SIGNOFF_A, FLAG_MISSING_SIGNOFF_B}
+    result = rep_row["result"]
+    flags = [f for f in result["flags"] if f not in signoff] + [f for f in preflags if f in signoff]
+    normalized = dict(result, flags=sorted(set(flags)))
+
+    out_json = out_dir / f"{path.stem}.json"
+    write_feedback(normalized, rubric, out_json, out_dir / f"{path.stem}.txt")
+    row = {
+        "submission": str(path),
+        "student": path.stem,
+        "status": "ok",
+        "score_total": normalized["score_total"],
+        "flags": normalized["flags"],
+        "out_json": str(out_json),
+        "result": normalized,
+        "submission_sha256": sha256_text(submission_md),
+        "criterion_fingerprints": criterion_fingerprints(rubric, submission_md),
+        "duplicate_of": rep_row["submission"],
+        "elapsed_s": time.perf_counter() - started,
+        **stats,
+    }
+    if journal:
+        journal.record(path, "done", attempt=1, sha256=row["submission_sha256"], duplicate_of=rep_row["submission"],
+                       score_total=row["score_total"], flags=row["flags"], out_json=row["out_json"])
+    return row
 
-    combined_flags = list(result.get("flags", []))
-    combined_flags += extra_flags
-    combined_flags = sorted(set(str(f).strip() for f in combined_flags if str(f).strip()))
 
-    return {
-        "score_total": score_total,
-        "criteria": normalized_criteria,
-        "overall_comment": str(result.get("overall_comment", "")).strip(),
-        "flags": combined_flags,
+def write_similarity_report(pairs: List[SimilarPair], groups: Dict[str, List[Path]], out_dir: Path) -> None:
+    """
+    <out_dir>/_similarity.json: partner groups graded once, and every near-duplicate pair.
+    Pairs with partners=false are near-identical reports from different people.
+    """
+    report = {
+        "partner_groups": [[rep] + [str(p) for p in group] for rep, group in sorted(groups.items())],
+        "pairs": [{"a": p.a, "b": p.b, "similarity": p.similarity, "partners": p.partners} for p in pairs],
     }
+    (out_dir / "_similarity.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
 
 
-def render_human_text(result: Dict[str, Any], rubric: Dict[str, Any]) -> str:
+def render_batch_summary(rows: List[Dict[str, Any]], rubric: Dict[str, Any]) -> str:
     total = rubric.get("expected_total_points", rubric.get("total_points", 10))
-    lines = [f"Score: {result['score_total']} / {total}", ""]
-
-    max_map = {c["criterion_id"]: c["max_points"] for c in rubric["criteria"]}
-    for c in result["criteria"]:
-        lines.append(f"- {c['criterion_id']}: {c['points']} / {max_map.get(c['criterion_id'], '?')}")
-        if c.get("comment"):
-            lines.append(f"  {c['comment']}")
-    lines.append("")
-
-    if result.get("overall_comment"):
-        lines.append("Overall:")
-        lines.append(result["overall_comment"])
-        lines.append("")
+    ok_rows = [r for r in rows if r["status"] == "ok"]
+    lines = [f"Graded: {len(ok_rows)} / {len(rows)}", ""]
+    for r in rows:
+        if r["status"] == "ok":
+            flags = ", ".join(r["flags"]) or "-"
+            lines.append(f"- {r['student']}: {r['score_total']} / {total}  flags: {flags}")
+        else:
+            lines.append(f"- {r['student']}: FAILED {r['error']}")
+    return "\n".join(lines).strip() + "\n"
 
-    if result.get("flags"):
-        lines.append("Flags:")
-        for f in result["flags"]:
-            lines.append(f"- {f}")
 
-    return "\n".join(lines).strip() + "\n"
+def write_batch_summary(rows: List[Dict[str, Any]], rubric: Dict[str, Any], out_dir: Path) -> None:
+    summary = {
+        "graded": sum(1 for r in rows if r["status"] == "ok"),
+        "failed": sum(1 for r in rows if r["status"] != "ok"),
+        "results": [{k: v for k, v in r.items() if k not in ("result", "criterion_fingerprints")} for r in rows],
+    }
+    (out_dir / "_summary.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    (out_dir / "_summary.txt").write_text(render_batch_summary(rows, rubric), encoding="utf-8")
 
 
-def main() -> int:
+def build_arg_parser() -> argparse.ArgumentParser:
     ap = argparse.ArgumentParser()
     ap.add_argument("--rubric", default="03_rubric.json")
     ap.add_argument("--submission", help="Student-filled markdown file")
+    ap.add_argument("--submissions-dir", help="Grade every matching submission in this directory")
+    ap.add_argument("--glob", default="*.md", help="File pattern used with --submissions-dir")
+    ap.add_argument("--out-dir", default="04_feedback", help="Per-student feedback folder for --submissions-dir")
+    ap.add_argument("--concurrency", type=int, default=default_concurrency(),
+                    help="Most Ollama calls in flight per host, any mode or engine (default: $OLLAMA_NUM_PARALLEL or 4)")
+    ap.add_argument("--resume", action="store_true",
+                    help="Continue an interrupted batch: skip submissions the journal already marks done")
+    ap.add_argument("--journal", help="Batch state journal (default: <out-dir>/_journal.jsonl)")
+    ap.add_argument("--retries", type=int, default=2, help="Retries per submission for transient Ollama failures")
+    ap.add_argument("--retry-backoff", type=float, default=2.0, help="First retry delay in seconds (doubles each time)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="With --results-db: regrade only criteria whose rubric text or answer changed since the stored result")
+    ap.add_argument("--dedup", action="store_true",
+                    help="Grade one submission per group of near-identical partner reports and copy the grade")
+    ap.add_argument("--dedup-threshold", type=float, default=0.9,
+                    help="Minimum estimated Jaccard similarity of answer text for --dedup")
+    ap.add_argument("--watch", action="store_true", help="With --submissions-dir: regrade files as they change")
+    ap.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between --watch directory scans")
+    ap.add_argument("--debounce", type=float, default=0.75, help="Seconds a file must be unchanged before regrading")
+    ap.add_argument("--serve", metavar="[HOST:]PORT",
+                    help="Run as a local grading service (POST /grade) with everything kept loaded")
+    ap.add_argument("--serve-queue", type=int, default=32,
+                    help="Requests that may wait for a grading slot before --serve answers 503")
     ap.add_argument("--init-submission", help="Create a starter submission file at this path and exit")
     ap.add_argument("--template", default="submissions/_TEMPLATE_pp.md", help="Template used for --init-submission")
+    ap.add_argument("--source", help="Source markdown the rubric must match (default: path stamped in the rubric)")
+    ap.add_argument("--rebuild-rubric", action="store_true", help="Rebuild a stale rubric instead of refusing")
+    ap.add_argument("--skip-rubric-check", action="store_true", help="Grade even if the rubric is stale")
     ap.add_argument("--model", default="qwen2.5:3b-instruct")
-    ap.add_argument("--host", default="http://127.0.0.1:11434")
+    ap.add_argument("--host", default="http://127.0.0.1:11434",
+                    help="Ollama URL, or a comma-separated list to spread calls over several hosts")
+    ap.add_argument("--hosts-file", help="File with one Ollama URL per line (# comments); overrides --host")
+    ap.add_argument("--health-interval", type=float, default=15.0,
+                    help="Seconds between /api/tags health checks with several hosts")
     ap.add_argument("--out-json", default="04_feedback.json")
     ap.add_argument("--out-txt", default="04_feedback.txt")
-    ap.add_argument("--num-predict", type=int, default=650)
+    ap.add_argument("--escalate-model",
+                    help="Cascade: re-grade with this larger model when the --model result looks unreliable")
+    ap.add_argument("--escalate-cutoffs", default="0.6,0.7,0.8,0.9",
+                    help="Grade cutoffs (fractions of total points) for the cascade's boundary check")
+    ap.add_argument("--escalate-margin", type=float, default=0.5,
+                    help="Scores up to this many points below a cutoff are re-graded by --escalate-model")
+    ap.add_argument("--num-predict", type=int, default=650,
+                    help="Generation token limit (the ceiling with --adaptive-budget)")
+    ap.add_argument("--adaptive-budget", action="store_true",
+                    help="Size num_ctx and num_predict per call; trim answers that don't fit --max-ctx")
+    ap.add_argument("--max-ctx", type=int, default=8192, help="Largest num_ctx --adaptive-budget may request")
+    ap.add_argument("--micro-batch", type=int, default=1, metavar="K",
+                    help="Batch mode: grade up to K submissions per model call (whole engine, needs --adaptive-budget)")
     ap.add_argument("--timeout", type=int, default=90)
-    args = ap.parse_args()
+    ap.add_argument("--engine", choices=["whole", "per-criterion"], default="whole",
+                    help="One prompt for the whole submission, or one concurrent prompt per criterion")
+    ap.add_argument("--keep-alive", default="30m",
+                    help="How long Ollama keeps the model loaded after a call (Ollama duration, e.g. 30m, -1)")
+    ap.add_argument("--warmup", action="store_true", help="Load the model before grading starts")
+    ap.add_argument("--fast-path", action="store_true",
+                    help="Score criteria still identical to the template 0 without sending them to the model")
+    ap.add_argument("--compact-prompt", action="store_true",
+                    help="Send only criterion bodies, signoff and pair_type, minus template boilerplate")
+    ap.add_argument("--results-db", help="Append every graded result to this SQLite database (see pp_results.py)")
+    ap.add_argument("--assignment", help="Assignment name stored with --results-db (default: rubric source stem)")
+    ap.add_argument("--metrics", help="Append per-submission stage timings + Ollama stats to this JSONL file")
+    ap.add_argument("--metrics-summary", action="store_true", help="Print a per-stage timing table at the end")
+    ap.add_argument("--prompt-layout", choices=["classic", "prefix"], default="classic",
+                    help="prefix: one rubric-invariant prompt prefix shared by every submission, per-submission parts last")
+    ap.add_argument("--wire", choices=["contract", "compact"], default="contract",
+                    help="compact: the model answers with positional scores, short keys and flag numbers (whole engine)")
+    ap.add_argument("--format", dest="response_format", choices=["schema", "json", "none"], default="schema",
+                    help="Ollama output constraint: rubric JSON schema (default), plain JSON mode, or none")
+    ap.add_argument("--stream", action="store_true",
+                    help="Stream tokens and stop as soon as the JSON object closes")
+    ap.add_argument("--cache-dir", default=".grade_cache", help="On-disk grading cache location")
+    ap.add_argument("--no-cache", action="store_true", help="Neither read nor write the grading cache")
+    ap.add_argument("--refresh", action="store_true", help="Ignore cached results but store fresh ones")
+    ap.add_argument("--cache-max-mb", type=float, default=200.0, help="Evict least-recently-used entries above this size")
+    ap.add_argument("--cache-max-age-days", type=float, default=30.0, help="Evict entries older than this")
+    return ap
+
+
+def check_micro_batch_options(micro_batch: int, engine: str, prompt_layout: str, adaptive_budget: bool) -> None:
+    """
+    Rejects option combinations --micro-batch can't honor (bench_grade.py applies the same rules).
+    Raises SystemExit with the reason.
+    """
+    if micro_batch <= 1:
+        return
+    if not adaptive_budget:
+        raise SystemExit("ERROR: --micro-batch needs --adaptive-budget (batched prompts must size num_ctx).")
+    if engine == "per-criterion":
+        raise SystemExit("ERROR: --micro-batch needs --engine whole (it packs whole submissions into one prompt).")
+    if prompt_layout == "prefix":
+        raise SystemExit("ERROR: --micro-batch can't be combined with --prompt-layout prefix "
+                         "(a batched prompt has its own layout).")
+
+
+def open_cache(args: argparse.Namespace) -> Optional[GradeCache]:
+    if args.no_cache:
+        return None
+    return GradeCache(
+        args.cache_dir,
+        max_age_s=args.cache_max_age_days * 86400,
+        max_bytes=int(args.cache_max_mb * 1024 * 1024),
+        refresh=args.refresh,
+    )
+
+
+def parse_hosts(host_arg: str, hosts_file: Optional[str] = None) -> List[str]:
+    """
+    Ollama URLs from --hosts-file (one per line, # comments) or the comma-separated --host.
+    """
+    text = Path(hosts_file).read_text(encoding="utf-8") if hosts_file else host_arg.replace(",", "\n")
+    hosts = [line.split("#", 1)[0].strip() for line in text.splitlines()]
+    hosts = [h for h in hosts if h]
+    if not hosts:
+        raise SystemExit("ERROR: no Ollama hosts given.")
+    return hosts
 
-    if args.init_submission:
-        init_submission(args.init_submission, args.template)
-        return 0
 
-    if not args.submission:
-        raise SystemExit("ERROR: --submission is required (or use --init-submission).")
+def open_client(args: argparse.Namespace, config: GradeConfig) -> OllamaClient:
+    """
+    Creates the shared pooled client (an OllamaPool with several hosts) used for every model of
+    the run. Each host runs at most --concurrency generations at once whatever the engine fans
+    out to. With --warmup, config.model (and a cascade's escalation model) is loaded first.
+    Raises SystemExit with a hint if the warmup call fails.
+    """
+    pool_size = max(1, args.concurrency)
+    hosts = parse_hosts(args.host, args.hosts_file)
+    if len(hosts) == 1:
+        client = OllamaClient(hosts[0], config.model, config.timeout_s,
+                              keep_alive=config.keep_alive, pool_size=pool_size)
+    else:
+        client = OllamaPool(hosts, config.model, config.timeout_s, keep_alive=config.keep_alive,
+                            pool_size=pool_size, health_interval_s=args.health_interval)
+        healthy = client.check_health()
+        logger.info("Hosts: %d / %d healthy", sum(healthy), len(hosts))
+    if args.warmup:
+        models = [config.model] + ([config.escalation.model] if config.escalation else [])
+        for model in models:
+            try:
+                logger.info("Warmed up %s in %.2fs", model, client.warmup(model))
+            except requests.RequestException as exc:
+                client.close()
+                raise SystemExit(
+                    f"ERROR: warmup of {model} failed ({type(exc).__name__}: {exc}).\n"
+                    f"Fix: start Ollama (ollama serve) and pull the model (ollama pull {model}), "
+                    f"or run without --warmup."
+                )
+    return client
+
+
+def row_sink(metrics: Optional[MetricsWriter], store: Optional[ResultStore]) -> Optional[Callable[[Dict[str, Any]], None]]:
+    """
+    One on_row callback feeding every enabled per-submission writer (None when there are none).
+    """
+    sinks = [sink.write for sink in (metrics, store) if sink]
+    if not sinks:
+        return None
+
+    def on_row(row: Dict[str, Any]) -> None:
+        for write in sinks:
+            write(row)
+    return on_row
+
+
+def rubric_run_info(rubric: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The run_info entries that depend on the rubric: its hash and each criterion's max points.
+    """
+    return {
+        "rubric_sha256": rubric_sha256(rubric),
+        "max_points": {c["criterion_id"]: float(c["max_points"]) for c in rubric["criteria"]},
+    }
+
+
+def refresh_run_info(rubric: Dict[str, Any], metrics: Optional[MetricsWriter], store: Optional[ResultStore]) -> None:
+    """
+    Points later metrics records and result rows at a reloaded rubric.
+    """
+    info = rubric_run_info(rubric)
+    if store:
+        store.run_info.update(info)
+    if metrics:
+        metrics.run_info["rubric_sha256"] = info["rubric_sha256"]
+
+
+def open_store(args: argparse.Namespace, rubric: Dict[str, Any], config: GradeConfig) -> Optional[ResultStore]:
+    if not args.results_db:
+        return None
+    return ResultStore(args.results_db, {
+        "assignment": args.assignment or Path(rubric.get("source") or args.rubric).stem,
+        "model": config.model,
+        "engine": config.engine,
+        **rubric_run_info(rubric),
+    })
+
+
+def run_batch(
+    args: argparse.Namespace,
+    rubric: Dict[str, Any],
+    config: GradeConfig,
+    client: OllamaClient,
+    cache: Optional[GradeCache],
+    metrics: Optional[MetricsWriter] = None,
+    store: Optional[ResultStore] = None,
+) -> int:
+    """
+    Grades --submissions-dir (resuming, deduplicating and regrading incrementally as asked),
+    writes the batch summary and logs the run's report. Returns the exit code (1 if any failed).
+    """
+    paths = find_submissions(args.submissions_dir, args.glob)
+    if not paths:
+        raise SystemExit(f"ERROR: no submissions matching {args.glob!r} in {args.submissions_dir}")
+
+    out_dir = Path(args.out_dir)
+    journal = BatchJournal(Path(args.journal or out_dir / "_journal.jsonl"), resume=args.resume,
+                           run_key=grading_run_key(rubric, config))
+    try:
+        resumed = resumed_rows(journal, paths) if args.resume else []
+        done = {row["submission"] for row in resumed}
+        paths = [p for p in paths if str(p) not in done]
+        groups = dedup_groups(args, paths, config, out_dir) if args.dedup and paths else {}
+        prior = store.latest_graded(store.run_info["assignment"]) if args.incremental and store else None
+        rows = grade_batch(rubric, paths, config, out_dir, args.concurrency, cache,
+                           on_row=row_sink(metrics, store),
+                           retries=args.retries, backoff_s=args.retry_backoff, journal=journal, partners=groups,
+                           prior=prior, client=client)
+    finally:
+        journal.close()
+    rows = sorted(resumed + rows, key=lambda r: r["submission"])
+    write_batch_summary(rows, rubric, out_dir)
+    report_batch(args, rows, rubric, config, out_dir)
+    return 1 if any(r["status"] != "ok" for r in rows) else 0
+
+
+def resumed_rows(journal: BatchJournal, paths: List[Path]) -> List[Dict[str, Any]]:
+    """
+    Summary rows of the submissions an earlier run already graded (see BatchJournal.finished_row).
+    """
+    resumed = [row for row in map(journal.finished_row, paths) if row]
+    logger.info("Resuming: %d already graded, %d to go", len(resumed), len(paths) - len(resumed))
+    return resumed
+
+
+def dedup_groups(args: argparse.Namespace, paths: List[Path], config: GradeConfig, out_dir: Path) -> Dict[str, List[Path]]:
+    """
+    Partner groups for --dedup (representative path -> partner paths); every near-duplicate pair
+    goes to <out_dir>/_similarity.json.
+    """
+    template_lines = config.template_lines or load_template_lines(args.template)
+    groups, pairs = find_partner_groups(paths, template_lines, args.dedup_threshold)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    write_similarity_report(pairs, groups, out_dir)
+    unrelated = sum(1 for p in pairs if not p.partners)
+    logger.info("Dedup: %d partner groups, %d submissions graded from a partner's result; "
+                "%d near-duplicate pairs from different people (see %s)", len(groups),
+                sum(len(g) for g in groups.values()), unrelated, out_dir / "_similarity.json")
+    return groups
+
+
+def report_batch(args: argparse.Namespace, rows: List[Dict[str, Any]], rubric: Dict[str, Any], config: GradeConfig,
+                 out_dir: Path) -> None:
+    """
+    Logs the batch report: files written, prompt sizes and each enabled feature's summary line.
+    """
+    failed = sum(1 for r in rows if r["status"] != "ok")
+    logger.info("Wrote %d feedback file pairs to %s (%d failed)", len(rows) - failed, out_dir, failed)
+    prompted = [r for r in rows if "prompt_chars" in r]
+    lines = []
+    if prompted:
+        lines.append(describe_prompt_size(sum(r["prompt_chars"] for r in prompted),
+                                          sum(r["prompt_chars_full"] for r in prompted))
+                     + f" over {len(prompted)} submissions")
+    lines.append(describe_prompt_eval(rows))
+    if config.escalation:
+        lines.append(describe_cascade(rows))
+    if config.budget:
+        lines.append(describe_budget(rows))
+    if config.micro_batch > 1:
+        lines.append(describe_micro_batch(rows))
+    if args.incremental:
+        lines.append(describe_incremental(rows, len(rubric["criteria"])))
+    lines.append(describe_wire(rows))
+    for line in filter(None, lines):
+        logger.info("%s", line)
+
+
+def snapshot_submissions(submissions_dir: str, pattern: str) -> Dict[Path, Tuple[int, int]]:
+    """
+    (mtime_ns, size) for every matching submission; one stat per file, no reads.
+    """
+    snapshot: Dict[Path, Tuple[int, int]] = {}
+    for path in find_submissions(submissions_dir, pattern):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue  # deleted between listing and stat
+        snapshot[path] = (st.st_mtime_ns, st.st_size)
+    return snapshot
+
+
+def needs_feedback(path: Path, out_dir: Path) -> bool:
+    """
+    True if the submission has no feedback yet or was edited after its feedback was written.
+    """
+    feedback = out_dir / f"{path.stem}.json"
+    return not feedback.exists() or feedback.stat().st_mtime_ns < path.stat().st_mtime_ns
+
+
+@dataclass
+class WatchState:
+    """
+    What watch_submissions carries from one poll to the next.
+    """
+
+    rubric: Dict[str, Any]
+    rubric_mtime: int
+    previous: Dict[Path, Tuple[int, int]]  # last snapshot_submissions()
+    pending: Dict[Path, float]  # changed file -> monotonic time of its last change
 
-    rubric = load_rubric(args.rubric)
-    submission_md = load_submission(args.submission)
 
-    preflags = precheck_flags(submission_md)
-    prompt = build_prompt(rubric, submission_md, preflags)
+def start_watch(args: argparse.Namespace, rubric: Dict[str, Any], out_dir: Path) -> WatchState:
+    """
+    Initial state: files with missing or outdated feedback are pending from the start.
+    """
+    previous = snapshot_submissions(args.submissions_dir, args.glob)
+    return WatchState(rubric=rubric, rubric_mtime=Path(args.rubric).stat().st_mtime_ns, previous=previous,
+                      pending={p: 0.0 for p in previous if needs_feedback(p, out_dir)})
 
-    # Try once, retry with more tokens if it returns empty
-    raw = ollama_generate(args.host, args.model, prompt, num_predict=args.num_predict, temperature=0.0, timeout_s=args.timeout)
-    if not raw.strip():
-        raw = ollama_generate(args.host, args.model, prompt, num_predict=max(args.num_predict, 900), temperature=0.0, timeout_s=args.timeout)
 
-    result = extract_json(raw)
-    normalized = validate_and_normalize(result, rubric)
+def note_changes(state: WatchState, current: Dict[Path, Tuple[int, int]], now: float) -> None:
+    """
+    Marks new and edited files pending (restarting their debounce) and forgets deleted ones.
+    """
+    for path, signature in current.items():
+        if state.previous.get(path) != signature:
+            state.pending[path] = now
+    state.previous = current
+    state.pending = {p: changed for p, changed in state.pending.items() if p in current}
 
-    Path(args.out_json).write_text(json.dumps(normalized, indent=2), encoding="utf-8")
-    Path(args.out_txt).write_text(render_human_text(normalized, rubric), encoding="utf-8")
 
-    print(f"Wrote {args.out_json} and {args.out_txt}")
-    print(f"Score_total: {normalized['score_total']}")
+def reload_if_edited(args: argparse.Namespace, state: WatchState,
+                     metrics: Optional[MetricsWriter], store: Optional[ResultStore]) -> None:
+    """
+    Reloads the rubric when its file changed. With --incremental every submission becomes
+    pending, and only the criteria the edit touched get regraded.
+    """
+    mtime = Path(args.rubric).stat().st_mtime_ns
+    if mtime == state.rubric_mtime:
+        return
+    state.rubric_mtime = mtime
+    reloaded = reload_watched_rubric(args, state.rubric)
+    if reloaded is not state.rubric:
+        refresh_run_info(reloaded, metrics, store)
+        if args.incremental and store:
+            state.pending.update({p: 0.0 for p in state.previous})
+    state.rubric = reloaded
+
+
+def take_ready(state: WatchState, now: float, debounce: float) -> List[Path]:
+    """
+    Removes and returns the pending files that have been quiet for debounce seconds.
+    """
+    ready = sorted(p for p, changed in state.pending.items() if now - changed >= debounce)
+    for path in ready:
+        del state.pending[path]
+    return ready
+
+
+def watch_poll(
+    args: argparse.Namespace,
+    state: WatchState,
+    config: GradeConfig,
+    client: OllamaClient,
+    cache: Optional[GradeCache],
+    metrics: Optional[MetricsWriter] = None,
+    store: Optional[ResultStore] = None,
+) -> List[Dict[str, Any]]:
+    """
+    One watch cycle: picks up file and rubric changes and grades what is ready.
+    Returns the rows of the submissions graded in this cycle.
+    """
+    now = time.monotonic()
+    note_changes(state, snapshot_submissions(args.submissions_dir, args.glob), now)
+    reload_if_edited(args, state, metrics, store)
+    ready = take_ready(state, now, args.debounce)
+    if not ready:
+        return []
+    prior = store.latest_graded(store.run_info["assignment"]) if args.incremental and store else None
+    return grade_batch(state.rubric, ready, config, Path(args.out_dir), args.concurrency, cache,
+                       on_row=row_sink(metrics, store), prior=prior, client=client)
+
+
+def watch_submissions(
+    args: argparse.Namespace,
+    rubric: Dict[str, Any],
+    config: GradeConfig,
+    client: OllamaClient,
+    cache: Optional[GradeCache],
+    metrics: Optional[MetricsWriter] = None,
+    store: Optional[ResultStore] = None,
+) -> int:
+    """
+    Polls the submissions folder and regrades files once they have been quiet for --debounce
+    seconds (editors often save several times in a row). Files with missing or outdated
+    feedback are graded on startup. The rubric is reloaded if its file changes; a stale or
+    unreadable reload keeps the previous rubric. An error in one pass (a bad file, a grading
+    crash) is logged and watching continues. Runs until Ctrl+C.
+    """
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    state = start_watch(args, rubric, out_dir)
+    logger.info("Watching %s/%s (Ctrl+C to stop)", args.submissions_dir, args.glob)
+    try:
+        while True:
+            try:
+                watch_poll(args, state, config, client, cache, metrics, store)
+            except Exception:
+                logger.exception("Watch pass failed; still watching")
+            time.sleep(args.poll_interval)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching.")
     return 0
 
 
+def reload_watched_rubric(args: argparse.Namespace, rubric: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The rubric file after an edit, or the current rubric if the new one is stale or unreadable.
+    """
+    try:
+        fresh = ensure_fresh_rubric(args, load_rubric(args.rubric))
+    except (StaleRubricError, OSError, ValueError) as exc:
+        logger.error("Not reloading %s: %s\nStill grading with the previous rubric.", args.rubric, exc)
+        return rubric
+    logger.info("Reloaded %s", args.rubric)
+    return fresh
+
+
+def serve(
+    args: argparse.Namespace,
+    rubric: Dict[str, Any],
+    config: GradeConfig,
+    client: OllamaClient,
+    cache: Optional[GradeCache],
+    metrics: Optional[MetricsWriter] = None,
+    store: Optional[ResultStore] = None,
+) -> int:
+    """
+    Runs the grading service until Ctrl+C:
+      POST /grade   body: submission markdown (or JSON {"submission", "student"}) -> contract JSON
+      GET  /health  queue depth and counters
+    """
+    def grade_text(current: Dict[str, Any], submission_md: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+        return grade_submission_text(current, submission_md, config, cache, stats, client)
+
+    service = GradingService(args, rubric, config.model, grade_text, row_sink(metrics, store),
+                             worker_count(args.concurrency, client), args.serve_queue,
+                             on_reload=lambda fresh: refresh_run_info(fresh, metrics, store))
+    httpd = ThreadingHTTPServer(parse_listen_address(args.serve), make_service_handler(service))
+    httpd.daemon_threads = True
+    host, port = httpd.server_address[:2]
+    logger.info("Serving on http://%s:%s (POST /grade, GET /health; Ctrl+C to stop)", host, port)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopped serving after %d grades.", service.graded)
+    finally:
+        httpd.server_close()
+    return 0
+
+
+def run_single(
+    args: argparse.Namespace,
+    rubric: Dict[str, Any],
+    config: GradeConfig,
+    client: OllamaClient,
+    cache: Optional[GradeCache],
+    metrics: Optional[MetricsWriter] = None,
+    store: Optional[ResultStore] = None,
+) -> int:
+    stats: Dict[str, Any] = {}
+    started = time.perf_counter()
+    with timed(stats, "load_submission"):
+        submission_md = load_submission(args.submission)
+    normalized = grade_submission_text(rubric, submission_md, config, cache, stats, client)
+    write_feedback(normalized, rubric, Path(args.out_json), Path(args.out_txt))
+    on_row = row_sink(metrics, store)
+    if on_row:
+        on_row({"submission": args.submission, "student": Path(args.submission).stem, "status": "ok",
+                "score_total": normalized["score_total"], "result": normalized,
+                "submission_sha256": sha256_text(submission_md),
+                "criterion_fingerprints": criterion_fingerprints(rubric, submission_md),
+                "elapsed_s": time.perf_counter() - started, **stats})
+
+    logger.info("Wrote %s and %s", args.out_json, args.out_txt)
+    logger.info("Score_total: %s", normalized["score_total"])
+    if "prompt_chars" in stats:
+        logger.info("%s", describe_prompt_size(stats["prompt_chars"], stats["prompt_chars_full"]))
+    if stats.get("first_token_s") is not None:
+        logger.info("Stream: first token %.2fs, total %.2fs, stopped early: %s", stats["first_token_s"],
+                    stats["generate_s"], stats["stopped_early"])
+    return 0
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    if args.init_submission:
+        init_submission(args.init_submission, args.template)
+        return 0
+    check_args(args)
+
+    load_started = time.perf_counter()
+    try:
+        rubric = ensure_fresh_rubric(args, load_rubric(args.rubric))
+    except StaleRubricError as exc:
+        raise SystemExit(f"ERROR: {exc}")
+    load_rubric_s = time.perf_counter() - load_started
+    config = build_config(args)
+    client = open_client(args, config)
+    cache = open_cache(args)
+    metrics = open_metrics(args, rubric, config, load_rubric_s)
+    store = open_store(args, rubric, config)
+    try:
+        if args.serve:
+            return serve(args, rubric, config, client, cache, metrics, store)
+        if args.watch:
+            return watch_submissions(args, rubric, config, client, cache, metrics, store)
+        if args.submissions_dir:
+            return run_batch(args, rubric, config, client, cache, metrics, store)
+        return run_single(args, rubric, config, client, cache, metrics, store)
+    finally:
+        close_run(args, config, client, cache, metrics, store)
+
+
+def check_args(args: argparse.Namespace) -> None:
+    """
+    Rejects option combinations that can't work together. Raises SystemExit with the reason.
+    """
+    if not args.submission and not args.submissions_dir and not args.serve:
+        raise SystemExit("ERROR: --submission, --submissions-dir or --serve is required (or use --init-submission).")
+    if args.watch and not args.submissions_dir:
+        raise SystemExit("ERROR: --watch needs --submissions-dir.")
+    if args.watch and args.dedup:
+        raise SystemExit("ERROR: --dedup works on a whole batch; it can't be combined with --watch.")
+    if args.incremental and not (args.submissions_dir and args.results_db):
+        raise SystemExit("ERROR: --incremental needs --submissions-dir and --results-db (where fingerprints are kept).")
+    check_micro_batch_options(args.micro_batch, args.engine, args.prompt_layout, args.adaptive_budget)
+
+
+def build_config(args: argparse.Namespace) -> GradeConfig:
+    """
+    The GradeConfig for the command line, with the budget, template lines and cascade it asks for.
+    """
+    config = GradeConfig(host=parse_hosts(args.host, args.hosts_file)[0], model=args.model, num_predict=args.num_predict,
+                         timeout_s=args.timeout, stream=args.stream, engine=args.engine,
+                         fast_path=args.fast_path, keep_alive=args.keep_alive,
+                         compact_prompt=args.compact_prompt, response_format=args.response_format,
+                         prompt_layout=args.prompt_layout, wire=args.wire, micro_batch=max(1, args.micro_batch))
+    if args.adaptive_budget:
+        config.budget = TokenBudget(max_ctx=args.max_ctx)
+    if args.compact_prompt:
+        config.template_lines = load_template_lines(args.template)
+    if args.escalate_model:
+        config.escalate_cutoffs = tuple(float(x) for x in args.escalate_cutoffs.split(",") if x.strip())
+        config.escalate_margin = args.escalate_margin
+        config.escalation = replace(config, model=args.escalate_model, num_predict=max(args.num_predict, 900))
+    return config
+
+
+def open_metrics(args: argparse.Namespace, rubric: Dict[str, Any], config: GradeConfig,
+                 load_rubric_s: float) -> Optional[MetricsWriter]:
+    """
+    The metrics writer for --metrics / --metrics-summary (None when neither is given).
+    """
+    if not (args.metrics or args.metrics_summary):
+        return None
+    run_info = {"model": config.model, "engine": config.engine, "stream": config.stream,
+                "compact_prompt": config.compact_prompt, "response_format": config.response_format,
+                "prompt_layout": config.prompt_layout, "wire": config.wire,
+                "max_ctx": config.budget.max_ctx if config.budget else None,
+                "rubric_sha256": rubric_sha256(rubric), "load_rubric_s": load_rubric_s}
+    return MetricsWriter(args.metrics or os.devnull, run_info)
+
+
+def close_run(
+    args: argparse.Namespace,
+    config: GradeConfig,
+    client: OllamaClient,
+    cache: Optional[GradeCache],
+    metrics: Optional[MetricsWriter],
+    store: Optional[ResultStore],
+) -> None:
+    """
+    Evicts old cache entries, closes the client, store and metrics file, and logs their counters.
+    """
+    if cache:
+        evicted = cache.evict()
+        logger.info("Cache: %d hits, %d misses, %d evicted", cache.hits, cache.misses, evicted)
+    logger.info("Model: %d warm / %d cold calls", client.warm_calls, client.cold_calls)
+    if config.budget:
+        logger.info("%s", config.budget.describe())
+    if isinstance(client, OllamaPool):
+        logger.info("Hosts: %s (%d failovers)", client.describe(), client.failovers)
+    client.close()
+    if store:
+        store.close()
+        logger.info("Results: %d stored in %s", store.written, args.results_db)
+    if metrics:
+        metrics.close()
+        if args.metrics_summary and metrics.records:
+            logger.info("Per-stage metrics:\n%s", render_metrics_summary(metrics.records))
+
+
 if __name__ == "__main__":
     raise SystemExit(main())
 
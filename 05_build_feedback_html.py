@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+05_build_feedback_html.py
+
+Reads the normalized results written by 04_grade.py and produces Canvas-pasteable feedback:
+- 05_feedback_html/<student>.html (one per graded submission; unsafe characters become "_")
+- 05_feedback_html/index.html (score table linking every student page)
+
+Approach:
+- Render each result as markdown (score, criteria table, overall comment, flags)
+- Convert it with ONE markdown.Markdown instance from 02_build_canvas_html.py, reset() between
+  students, instead of rebuilding the converter and its extensions per document
+- Stream: each page is written as soon as it is rendered and the index grows one row at a time,
+  so memory stays flat however large the section is
+
+Results come from the per-student JSON files of a 04 output directory (default), or from the
+latest results of one assignment in a --results-db database:
+
+  python 05_build_feedback_html.py --feedback-dir 04_feedback
+  python 05_build_feedback_html.py --results-db 04_results.sqlite --assignment pp01
+"""
+
+from __future__ import annotations
+
+import argparse
+import html
+import json
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from build_pipeline import CANVAS_SCRIPT, load_script
+from pp_results import open_db
+
+INDEX_HEAD = """<div class="pp-feedback-index">
+<table>
+<thead><tr><th>Student</th><th>Score</th><th>Flags</th></tr></thead>
+<tbody>
+"""
+INDEX_TAIL = """</tbody>
+</table>
+</div>
+"""
+INDEX_PAGE = "index.html"
+UNSAFE_NAME_RE = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+def md_escape(text: Any) -> str:
+    """
+    Model-written text as literal markdown: HTML is escaped and newlines folded (table-safe).
+    """
+    text = html.escape(" ".join(str(text).split()), quote=False)
+    return text.replace("|", "\\|")
+
+
+def feedback_markdown(student: str, result: Dict[str, Any], rubric: Dict[str, Any]) -> str:
+    """
+    Markdown feedback for one normalized result (same content as 04's .txt feedback).
+    """
+    total = rubric.get("expected_total_points", rubric.get("total_points", 10))
+    max_map = {c["criterion_id"]: c["max_points"] for c in rubric["criteria"]}
+    lines = [
+        f"## Feedback: {md_escape(student)}",
+        "",
+        f"**Score: {result['score_total']} / {total}**",
+        "",
+        "| Criterion | Points | Comment |",
+        "| --- | --- | --- |",
+    ]
+    for c in result["criteria"]:
+        points = f"{c['points']} / {max_map.get(c['criterion_id'], '?')}"
+        lines.append(f"| {md_escape(c['criterion_id'])} | {points} | {md_escape(c.get('comment', ''))} |")
+    lines.append("")
+
+    if result.get("overall_comment"):
+        lines += ["### Overall", "", md_escape(result["overall_comment"]), ""]
+
+    if result.get("flags"):
+        lines += ["### Flags", ""]
+        lines += [f"- `{f}`" for f in result["flags"]]
+
+    return "\n".join(lines).strip() + "\n"
+
+
+def iter_feedback_dir(feedback_dir: Path) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    (student, result) for each <student>.json in a 04 output directory (_summary etc. skipped).
+    Files are loaded one at a time.
+    """
+    for path in sorted(feedback_dir.glob("*.json")):
+        if path.name.startswith("_"):
+            continue
+        try:
+            result = json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            print(f"WARNING: skipping unreadable {path}")
+            continue
+        if isinstance(result, dict) and "criteria" in result:
+            yield path.stem, result
+
+
+def iter_results_db(conn: sqlite3.Connection, assignment: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    (student, result) for the latest result of each student, streamed from the database cursor.
+    """
+    cursor = conn.execute(
+        "SELECT student, result_json FROM latest_results WHERE assignment = ? ORDER BY student",
+        (assignment,),
+    )
+    for row in cursor:
+        yield row["student"], json.loads(row["result_json"])
+
+
+def page_name(student: str, taken: Set[str]) -> str:
+    """
+    A file name for a student's page that stays inside the output directory: anything but
+    letters, digits, "_" and "-" becomes "_" (so "../x" is just "x"), and a name already in
+    taken (including the index page) gets a numeric suffix. The chosen name is added to taken.
+    """
+    stem = UNSAFE_NAME_RE.sub("_", student).strip("_") or "student"
+    name, n = f"{stem}.html", 1
+    while name in taken:
+        n += 1
+        name = f"{stem}-{n}.html"
+    taken.add(name)
+    return name
+
+
+def index_row(student: str, page: str, result: Dict[str, Any], total: Any) -> str:
+    flags = ", ".join(html.escape(str(f)) for f in result.get("flags", []))
+    return (f'<tr><td><a href="{html.escape(page)}">{html.escape(student)}</a></td>'
+            f"<td>{result['score_total']} / {total}</td><td>{flags}</td></tr>\n")
+
+
+def render_all(
+    results: Iterator[Tuple[str, Dict[str, Any]]],
+    rubric: Dict[str, Any],
+    out_dir: Path,
+) -> int:
+    """
+    Writes a page for every result (named by page_name) and index.html, streaming both to disk.
+    Returns the number of pages written.
+    """
+    stage = load_script(CANVAS_SCRIPT)
+    converter = stage.make_converter()
+    total = rubric.get("expected_total_points", rubric.get("total_points", 10))
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    count = 0
+    taken = {INDEX_PAGE}
+    with open(out_dir / INDEX_PAGE, "w", encoding="utf-8") as index:
+        index.write(INDEX_HEAD)
+        for student, result in results:
+            body = stage.render_markdown(feedback_markdown(student, result, rubric), converter)
+            page = page_name(student, taken)
+            (out_dir / page).write_text(f'<div class="pp-feedback">\n{body}\n</div>\n', encoding="utf-8")
+            index.write(index_row(student, page, result, total))
+            count += 1
+        index.write(INDEX_TAIL)
+    return count
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Render per-student feedback HTML from 04_grade.py results")
+    ap.add_argument("--rubric", default="03_rubric.json", help="Rubric JSON (for max points)")
+    ap.add_argument("--feedback-dir", default="04_feedback", help="04_grade.py batch output directory")
+    ap.add_argument("--results-db", help="Read the latest results from this database instead of --feedback-dir")
+    ap.add_argument("--assignment", help="Assignment to render from --results-db (required with it)")
+    ap.add_argument("--out-dir", default="05_feedback_html", help="Output directory")
+    args = ap.parse_args(argv)
+    if args.results_db and not args.assignment:
+        raise SystemExit("ERROR: --results-db needs --assignment (the database can hold several assignments).")
+
+    rubric_path = Path(args.rubric)
+    if not rubric_path.exists():
+        raise SystemExit(f"ERROR: Rubric not found: {rubric_path}")
+    rubric = json.loads(rubric_path.read_text(encoding="utf-8"))
+
+    conn = None
+    if args.results_db:
+        try:
+            conn = open_db(args.results_db)
+        except FileNotFoundError as exc:
+            raise SystemExit(f"ERROR: {exc}")
+        source = f"{args.results_db} ({args.assignment})"
+        results = iter_results_db(conn, args.assignment)
+    else:
+        feedback_dir = Path(args.feedback_dir)
+        if not feedback_dir.is_dir():
+            raise SystemExit(f"ERROR: Feedback directory not found: {feedback_dir}")
+        source = str(feedback_dir)
+        results = iter_feedback_dir(feedback_dir)
+
+    started = time.perf_counter()
+    count = render_all(results, rubric, Path(args.out_dir))
+    if conn is not None:
+        conn.close()
+
+    print(f"Rendered {count} feedback pages from {source} to {args.out_dir} "
+          f"in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+"""
+bench_grade.py
+
+Measures 04_grade.py grading throughput without a real model.
+
+- Generates N synthetic submissions from submissions/_TEMPLATE_pp.md with a controlled mix of
+  variants: blank, partial, full, human_llm
+- Starts a local stand-in for Ollama's /api/generate with configurable latency, parallel slots
+  and malformed-output rate (plain and streaming responses); like Ollama, it only counts prompt
+  tokens past the longest prefix shared with a recent prompt in prompt_eval_count
+- Runs the real batch pipeline (precheck_flags, build_prompt, HTTP, extract_json,
+  validate_and_normalize) and reports submissions/sec, p50/p95 latency and parse-failure rate
+
+Example:
+  python bench_grade.py --n 200 --latency-ms 300 --stub-parallel 4 --concurrency 4
+  python bench_grade.py --n 200 --engine per-criterion --stream --json-out bench.json
+
+Several stub servers exercise multi-host scheduling; --stop-stub-after kills the first one
+mid-run to check that its in-flight work is re-queued on the others:
+  python bench_grade.py --n 200 --stub-servers 3 --concurrency 4 --stop-stub-after 1.0
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List
+
+from build_pipeline import load_script
+from pp_ollama import OllamaClient, OllamaPool, TokenBudget
+from pp_rubric import load_rubric
+from pp_submission import load_template_lines
+
+GRADER_SCRIPT = Path(__file__).resolve().with_name("04_grade.py")
+VARIANTS = ("blank", "partial", "full", "human_llm")
+
+WHOLE_CRITERION_RE = re.compile(r"^- (?P<cid>\w+) \(max (?P<max>[\d.]+)\):", re.MULTILINE)
+SINGLE_CRITERION_RE = re.compile(r"^CRITERION: (?P<cid>\w+) \(max (?P<max>[\d.]+)\)", re.MULTILINE)
+GRADE_LIST_RE = re.compile(r"^GRADE: (?P<ids>\[.*\])$", re.MULTILINE)
+COMPACT_MARKER = "in this compact form"
+MICRO_BATCH_MARKER = "SEVERAL student submissions"
+SUBMISSION_ID_RE = re.compile(r"^=== SUBMISSION ID: (?P<id>\w+) ===$", re.MULTILINE)
+
+CHATTY_TAIL = "\n\nI hope this helps! Let me know if you want me to explain any of the scores."
+
+
+# --- Synthetic submissions ---
+
+def fill_label(md_text: str, label: str, value: str) -> str:
+    """
+    Puts value after the first "- <label>...:" template line (keeping any "# hint" comment out).
+    """
+    pattern = re.compile(rf"^(- {re.escape(label)}[^:\n]*:)[^\n]*$", re.MULTILINE)
+    return pattern.sub(lambda m: f"{m.group(1)} {value}", md_text, count=1)
+
+
+def make_submission(template: str, variant: str, index: int, rng: random.Random) -> str:
+    """
+    Returns one synthetic submission of the given variant built from the template text.
+    """
+    if variant == "blank":
+        return template
+
+    topic = rng.choice(["CSV parser", "binary search", "unit converter", "tic-tac-toe board"])
+    md = template.replace("pair_type: human_pair | human_llm",
+                          f"pair_type: {'human_llm' if variant == 'human_llm' else 'human_pair'}")
+    md = fill_label(md, "Goal", f"Implement the {topic} for lab {index}.")
+    md = fill_label(md, "Snag", "Off-by-one error in the loop bounds.")
+    md = fill_label(md, "Response", "Printed the indexes on a tiny example and fixed the range.")
+    if variant == "partial":
+        return md
+
+    md = fill_label(md, "Result", f"A working {topic} with three passing tests.")
+    for label, action in [("D1", "Typed the function skeleton."), ("D2", "Ran the tests after each change."),
+                          ("N1", "Spotted a missing edge case."), ("N2", "Read the spec aloud before coding.")]:
+        md = fill_label(md, label, action + " " * rng.randint(0, 2))
+    if variant == "human_llm":
+        md = fill_label(md, "Kept", "The suggestion to use enumerate().")
+        md = fill_label(md, "Rejected", "A full rewrite with classes.")
+        md = fill_label(md, "Why", "We wanted code we could explain.")
+    choice = rng.choice(["Swap roles next time", "Test earlier (tiny example)", "Think out loud more"])
+    md = md.replace(f"- [ ] {choice}", f"- [x] {choice}", 1)
+    md = md.replace("One sentence: what will you do differently next time?",
+                    "One sentence: what will you do differently next time?\nWe will write a test first.", 1)
+    md = fill_label(md, "Student A initials", "AB")
+    md = fill_label(md, "Student B initials", "LLM" if variant == "human_llm" else "CD")
+    return md
+
+
+def parse_mix(mix_text: str) -> Dict[str, int]:
+    """
+    Parses "blank=1,partial=1,full=2,human_llm=1" into variant weights.
+    Raises ValueError on unknown variants or bad weights.
+    """
+    weights: Dict[str, int] = {}
+    for part in mix_text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in VARIANTS:
+            raise ValueError(f"Unknown variant {name!r}; expected one of {VARIANTS}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+def write_submissions(template: str, out_dir: Path, n: int, mix: Dict[str, int], seed: int) -> Dict[str, int]:
+    """
+    Writes n synthetic submissions to out_dir. Returns the count per variant.
+    """
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    counts = {name: 0 for name in names}
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(n):
+        variant = rng.choices(names, weights)[0]
+        counts[variant] += 1
+        text = make_submission(template, variant, i, rng)
+        (out_dir / f"bench_{i:05d}_{variant}.md").write_text(text, encoding="utf-8")
+    return counts
+
+
+# --- Stub Ollama server ---
+
+@dataclass
+class StubSettings:
+    latency_ms: float = 200.0
+    jitter_ms: float = 50.0
+    malformed_rate: float = 0.0
+    parallel: int = 4  # like OLLAMA_NUM_PARALLEL: extra requests wait for a free slot
+    seed: int = 0
+
+
+def fake_model_output(prompt: str, settings: StubSettings) -> str:
+    """
+    Deterministic pseudo-grade for a prompt: a contract object for whole-submission prompts,
+    {"results": [...]} with one per submission ID for micro-batch prompts, a {"points", "comment",
+    "flags"} piece for per-criterion prompts, or truncated JSON at the configured malformed rate.
+    """
+    rng = random.Random(zlib.crc32(prompt.encode("utf-8")) ^ settings.seed)
+    if rng.random() < settings.malformed_rate:
+        return 'Here is the grade: {"score_total": 7, "criteria": [{"criterion_id": "'
+
+    single = SINGLE_CRITERION_RE.search(prompt)
+    if single:
+        pts = rng.randint(0, int(float(single.group("max"))))
+        return json.dumps({"points": pts, "comment": "Some evidence given.", "flags": []}) + CHATTY_TAIL
+
+    if MICRO_BATCH_MARKER in prompt:
+        head = prompt.split("=== SUBMISSION ID:", 1)[0]
+        results = []
+        for m in SUBMISSION_ID_RE.finditer(prompt):
+            criteria = [{"criterion_id": c.group("cid"), "points": rng.randint(0, int(float(c.group("max")))),
+                         "comment": "Some evidence given."} for c in WHOLE_CRITERION_RE.finditer(head)]
+            results.append({"id": m.group("id"), "score_total": sum(c["points"] for c in criteria),
+                            "criteria": criteria, "overall_comment": "Synthetic grade from the benchmark stub.",
+                            "flags": []})
+        return json.dumps({"results": results}) + CHATTY_TAIL
+
+    criteria = []
+    for m in WHOLE_CRITERION_RE.finditer(prompt):
+        pts = rng.randint(0, int(float(m.group("max"))))
+        criteria.append({"criterion_id": m.group("cid"), "points": pts, "comment": "Some evidence given."})
+    if COMPACT_MARKER in prompt:
+        graded = GRADE_LIST_RE.search(prompt)
+        if graded:
+            wanted = json.loads(graded.group("ids"))
+            criteria = [c for c in criteria if c["criterion_id"] in wanted]
+        compact = {"s": [[c["points"], c["comment"]] for c in criteria],
+                   "o": "Synthetic grade from the benchmark stub.", "f": []}
+        return json.dumps(compact) + CHATTY_TAIL
+    result = {
+        "score_total": sum(c["points"] for c in criteria),
+        "criteria": criteria,
+        "overall_comment": "Synthetic grade from the benchmark stub.",
+        "flags": [],
+    }
+    return json.dumps(result) + CHATTY_TAIL
+
+
+class StubOllamaServer:
+    """
+    Minimal local stand-in for Ollama: POST /api/generate (stream true/false) and GET /api/tags.
+    Runs in a daemon thread; use as a context manager or call start()/stop().
+    """
+
+    def __init__(self, settings: StubSettings, port: int = 0, model: str = "stub-model") -> None:
+        self.settings = settings
+        self.model = model
+        self.calls = 0
+        self.stopped = False
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max(1, settings.parallel))
+        self._rng = random.Random(settings.seed)
+        self._recent_prompts: List[str] = []  # one per slot, newest last
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubOllamaServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped = True  # keep-alive connections still open now get dropped, like a dead host
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StubOllamaServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def _latency_s(self) -> float:
+        with self._lock:
+            self.calls += 1
+            jitter = self._rng.uniform(-self.settings.jitter_ms, self.settings.jitter_ms)
+        return max(0.0, self.settings.latency_ms + jitter) / 1000.0
+
+    def _evaluated_chars(self, prompt: str) -> int:
+        """
+        Chars of prompt not covered by the longest common prefix with a recent prompt
+        (a rough model of Ollama reusing a slot's KV cache).
+        """
+        with self._lock:
+            reused = max((len(os.path.commonprefix([prompt, p])) for p in self._recent_prompts), default=0)
+            self._recent_prompts = (self._recent_prompts + [prompt])[-max(1, self.settings.parallel):]
+        return len(prompt) - reused
+
+    def _make_handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def handle(self) -> None:
+                try:
+                    super().handle()
+                except ConnectionResetError:
+                    pass  # client hung up on a stream the stub had already finished writing
+
+            def _send_json(self, payload: Dict[str, Any]) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _dropped(self) -> bool:
+                if server.stopped:
+                    self.close_connection = True
+                return server.stopped
+
+            def do_GET(self) -> None:
+                if self._dropped():
+                    return
+                if self.path.rstrip("/") == "/api/tags":
+                    self._send_json({"models": [{"name": server.model}]})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self) -> None:
+                if self._dropped():
+                    return
+                if self.path.rstrip("/") != "/api/generate":
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                prompt = request.get("prompt", "")
+                if not prompt:  # warmup / model load
+                    self._send_json({"response": "", "done": True, "load_duration": 1_000_000})
+                    return
+                with server._slots:
+                    latency_s = server._latency_s()
+                    text = fake_model_output(prompt, server.settings)
+                    stats = {
+                        "done": True,
+                        "prompt_eval_count": max(1, server._evaluated_chars(prompt) // 4),
+                        "eval_count": len(text) // 4,
+                        "load_duration": 1_000_000,
+                        "prompt_eval_duration": int(latency_s * 0.4e9),
+                        "eval_duration": int(latency_s * 0.6e9),
+                        "total_duration": int(latency_s * 1e9),
+                    }
+                    if request.get("stream", True):
+                        self._stream(text, latency_s, stats)
+                    else:
+                        time.sleep(latency_s)
+                        if not self._dropped():
+                            self._send_json({"response": text, **stats})
+
+            def _stream(self, text: str, latency_s: float, stats: Dict[str, Any]) -> None:
+                pieces = [text[i:i + 8] for i in range(0, len(text), 8)]
+                time.sleep(latency_s * 0.4)  # prompt evaluation before the first token
+                per_piece_s = latency_s * 0.6 / max(1, len(pieces))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for piece in pieces:
+                        self._write_chunk({"response": piece, "done": False})
+                        time.sleep(per_piece_s)
+                    self._write_chunk({"response": "", **stats})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # client hung up early (streaming early stop)
+
+            def _write_chunk(self, payload: Dict[str, Any]) -> None:
+                line = (json.dumps(payload) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+# --- Benchmark run + report ---
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of values (0.0 for an empty list).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(rows: List[Dict[str, Any]], wall_s: float, model_calls: int) -> Dict[str, Any]:
+    latencies = [r["elapsed_s"] for r in rows]
+    parse_failures = [r for r in rows if r["status"] != "ok" and r["error"].startswith(("ValueError", "JSONDecodeError"))]
+    other_failures = [r for r in rows if r["status"] != "ok" and r not in parse_failures]
+    return {
+        "submissions": len(rows),
+        "wall_s": wall_s,
+        "submissions_per_s": len(rows) / wall_s if wall_s else 0.0,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_max_s": max(latencies, default=0.0),
+        "parse_failures": len(parse_failures),
+        "parse_failure_rate": len(parse_failures) / len(rows) if rows else 0.0,
+        "other_failures": len(other_failures),
+        "model_calls": model_calls,
+        "prompt_eval_tokens": sum(r.get("prompt_eval_count", 0) for r in rows),
+        "streams_cut": sum(1 for r in rows if r.get("stats_partial")),  # no prompt_eval_count for these
+        "generated_tokens": sum(r.get("eval_count", 0) for r in rows),
+        "predict_budget_tokens": sum(r.get("predict_tokens", 0) for r in rows),
+        # compact-wire answers and their verbose estimate (micro-batched rows answer in the contract format)
+        "compact_eval_count": sum(r.get("compact_eval_count", 0) for r in rows if not r.get("micro_batch")),
+        "verbose_eval_estimate": sum(r.get("verbose_eval_estimate", 0) for r in rows if not r.get("micro_batch")),
+    }
+
+
+def render_report(summary: Dict[str, Any], counts: Dict[str, int]) -> str:
+    mix = ", ".join(f"{name} {count}" for name, count in counts.items())
+    return "\n".join([
+        f"Submissions: {summary['submissions']} ({mix})",
+        f"Wall time: {summary['wall_s']:.2f}s  |  Throughput: {summary['submissions_per_s']:.2f} submissions/s",
+        f"Latency p50: {summary['latency_p50_s']:.3f}s  p95: {summary['latency_p95_s']:.3f}s  "
+        f"max: {summary['latency_max_s']:.3f}s",
+        f"Parse failures: {summary['parse_failures']} ({100 * summary['parse_failure_rate']:.1f}%)  |  "
+        f"Other failures: {summary['other_failures']}",
+        f"Model calls: {summary['model_calls']}"
+        + (f" (per host: {summary['calls_per_host']})" if len(summary.get("calls_per_host", [])) > 1 else ""),
+        f"Prompt tokens evaluated: {summary['prompt_eval_tokens']}"
+        + (f" ({summary['streams_cut']} streams hung up before Ollama's stats)" if summary["streams_cut"] else ""),
+        f"Generated tokens: {summary['generated_tokens']}"
+        + (f" (budgeted {summary['predict_budget_tokens']})" if summary["predict_budget_tokens"] else "")
+        + (f" (compact answers {summary['compact_eval_count']} vs ~{summary['verbose_eval_estimate']} verbose)"
+           if summary["verbose_eval_estimate"] else ""),
+    ])
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Benchmark 04_grade.py against a local stub Ollama server")
+    ap.add_argument("--n", type=int, default=100, help="Number of synthetic submissions")
+    ap.add_argument("--mix", default="blank=1,partial=1,full=2,human_llm=1", help="Variant weights")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--template", default="submissions/_TEMPLATE_pp.md")
+    ap.add_argument("--rubric", default="03_rubric.json")
+    ap.add_argument("--workdir", help="Keep generated submissions/feedback here (default: temp dir)")
+    ap.add_argument("--latency-ms", type=float, default=200.0, help="Stub time per generation")
+    ap.add_argument("--jitter-ms", type=float, default=50.0)
+    ap.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of stub outputs that are broken JSON")
+    ap.add_argument("--stub-parallel", type=int, default=4, help="Stub parallel slots (like OLLAMA_NUM_PARALLEL)")
+    ap.add_argument("--stub-servers", type=int, default=1, help="Number of stub hosts (OllamaPool when > 1)")
+    ap.add_argument("--stop-stub-after", type=float, help="Stop the first stub host after this many seconds")
+    ap.add_argument("--concurrency", type=int, default=4, help="Calls in flight per stub host (as in 04_grade.py)")
+    ap.add_argument("--engine", choices=["whole", "per-criterion"], default="whole")
+    ap.add_argument("--stream", action="store_true")
+    ap.add_argument("--compact-prompt", action="store_true")
+    ap.add_argument("--prompt-layout", choices=["classic", "prefix"], default="classic")
+    ap.add_argument("--fast-path", action="store_true")
+    ap.add_argument("--wire", choices=["contract", "compact"], default="contract")
+    ap.add_argument("--adaptive-budget", action="store_true", help="Per-call num_ctx/num_predict (see 04_grade.py)")
+    ap.add_argument("--max-ctx", type=int, default=8192)
+    ap.add_argument("--micro-batch", type=int, default=1, metavar="K",
+                    help="Submissions per model call (implies --adaptive-budget when > 1)")
+    ap.add_argument("--json-out", help="Also write the summary as JSON (for regression tracking)")
+    return ap
+
+
+def run_benchmark(args: argparse.Namespace, workdir: Path) -> Dict[str, Any]:
+    grader = load_script(GRADER_SCRIPT)
+    # --micro-batch implies --adaptive-budget here; the other rules are 04_grade.py's
+    grader.check_micro_batch_options(args.micro_batch, args.engine, args.prompt_layout, adaptive_budget=True)
+    template = Path(args.template).read_text(encoding="utf-8")
+    rubric = load_rubric(args.rubric)
+    counts = write_submissions(template, workdir / "submissions", args.n, parse_mix(args.mix), args.seed)
+
+    stubs = [
+        StubOllamaServer(StubSettings(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                      malformed_rate=args.malformed_rate, parallel=args.stub_parallel,
+                                      seed=args.seed + i)).start()
+        for i in range(max(1, args.stub_servers))
+    ]
+    stopper = None
+    if args.stop_stub_after is not None:
+        stopper = threading.Timer(args.stop_stub_after, stubs[0].stop)
+    try:
+        config = grader.GradeConfig(host=stubs[0].url, model=stubs[0].model, stream=args.stream,
+                                    engine=args.engine, fast_path=args.fast_path,
+                                    compact_prompt=args.compact_prompt, prompt_layout=args.prompt_layout,
+                                    wire=args.wire, micro_batch=max(1, args.micro_batch))
+        if args.compact_prompt:
+            config.template_lines = load_template_lines(args.template)
+        if args.adaptive_budget or args.micro_batch > 1:
+            config.budget = TokenBudget(max_ctx=args.max_ctx)
+        if len(stubs) == 1:
+            client = OllamaClient(stubs[0].url, stubs[0].model, config.timeout_s, pool_size=args.concurrency)
+        else:
+            client = OllamaPool([s.url for s in stubs], stubs[0].model, config.timeout_s,
+                            pool_size=args.concurrency, health_interval_s=0.5)
+
+        paths = grader.find_submissions(str(workdir / "submissions"), "*.md")
+        if stopper:
+            stopper.start()
+        started = time.perf_counter()
+        rows = grader.grade_batch(rubric, paths, config, workdir / "feedback", args.concurrency, verbose=False,
+                                  client=client)
+        wall_s = time.perf_counter() - started
+        client.close()
+    finally:
+        if stopper:
+            stopper.cancel()
+            stopper.join()
+        for stub in stubs:
+            stub.stop()  # idempotent: the stopped stub just returns
+
+    summary = summarize(rows, wall_s, sum(s.calls for s in stubs))
+    summary["counts"] = counts
+    summary["calls_per_host"] = [s.calls for s in stubs]
+    return summary
+
+
+def main() -> int:
+    args = build_arg_parser().parse_args()
+    if args.workdir:
+        summary = run_benchmark(args, Path(args.workdir))
+    else:
+        with tempfile.TemporaryDirectory(prefix="pp_bench_") as tmp:
+            summary = run_benchmark(args, Path(tmp))
+
+    print(render_report(summary, summary["counts"]))
+    if args.json_out:
+        Path(args.json_out).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        print(f"Wrote {args.json_out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
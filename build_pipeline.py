@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+build_pipeline.py
+
+One entry point for the 01 -> 02/03 stages:
+- reads and parses the source markdown once
+- emits 02_canvas.html (via 02_build_canvas_html.py) and 03_rubric.json (via 03_build_rubric_json.py)
+- records sha256 of inputs and outputs in a small manifest (.pipeline_manifest.json)
+- skips any stage whose inputs (source text, stage script, parser, options) and output are unchanged
+
+Several assignment variants can share one manifest; entries are keyed by source path:
+  python build_pipeline.py
+  python build_pipeline.py --src variants/pp02.md --canvas-out variants/pp02.html --rubric-out variants/pp02.json
+
+A no-op rebuild only hashes a few small files (the markdown library is not even imported).
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import sys
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional
+
+HERE = Path(__file__).resolve().parent
+PARSER_SCRIPT = HERE / "pp_blocks.py"
+CANVAS_SCRIPT = HERE / "02_build_canvas_html.py"
+RUBRIC_SCRIPT = HERE / "03_build_rubric_json.py"
+
+DEFAULT_MANIFEST = ".pipeline_manifest.json"
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path: Path) -> str:
+    """
+    sha256 of a file's bytes, or "" if it does not exist.
+    """
+    return sha256_bytes(path.read_bytes()) if path.exists() else ""
+
+
+def load_script(path: Path) -> ModuleType:
+    """
+    The numbered stage scripts can't be imported by name (leading digit), so load them from file.
+    """
+    name = "stage_" + path.stem.replace("-", "_")
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Cannot load {path}")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module  # dataclasses need the module registered
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_manifest(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {"sources": {}}
+    try:
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    except ValueError:
+        return {"sources": {}}  # corrupt manifest: rebuild everything
+    manifest.setdefault("sources", {})
+    return manifest
+
+
+def write_if_changed(path: Path, text: str) -> bool:
+    """
+    Writes text only if the file content differs (keeps mtimes stable). Returns True if written.
+    """
+    if path.exists() and path.read_text(encoding="utf-8") == text:
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return True
+
+
+def stage_key(source_sha: str, script: Path, options: Dict[str, Any]) -> str:
+    """
+    Fingerprint of everything a stage's output depends on.
+    """
+    material = json.dumps({
+        "source": source_sha,
+        "script": sha256_file(script),
+        "parser": sha256_file(PARSER_SCRIPT),
+        "options": options,
+    }, sort_keys=True)
+    return sha256_bytes(material.encode("utf-8"))
+
+
+def run_stage(
+    name: str,
+    entry: Dict[str, Any],
+    key: str,
+    out_path: Path,
+    render: Callable[[], str],
+    force: bool,
+) -> str:
+    """
+    Rebuilds one stage unless its key and output hash match the manifest entry.
+    Returns "skipped", "rebuilt" or "unchanged" (rebuilt but identical output).
+    """
+    recorded = entry.get(name, {})
+    if not force and recorded.get("key") == key and recorded.get("output_sha256") == sha256_file(out_path):
+        return "skipped"
+
+    text = render()
+    written = write_if_changed(out_path, text)
+    entry[name] = {
+        "key": key,
+        "output": str(out_path),
+        "output_sha256": sha256_bytes(text.encode("utf-8")),
+    }
+    return "rebuilt" if written else "unchanged"
+
+
+def build(src: str, canvas_out: Optional[str], rubric_out: str, require_sum: float,
+          manifest_path: str = DEFAULT_MANIFEST, force: bool = False) -> Dict[str, str]:
+    """
+    Runs both stages for one source file (only the rubric when canvas_out is None).
+    Returns {stage: status}.
+    Raises FileNotFoundError if the source is missing and ValueError if the rubric is invalid.
+    """
+    src_path = Path(src)
+    if not src_path.exists():
+        raise FileNotFoundError(f"Source file not found: {src}")
+    source_bytes = src_path.read_bytes()
+    source_sha = sha256_bytes(source_bytes)
+    md_text = source_bytes.decode("utf-8").replace("\r\n", "\n")
+
+    manifest_file = Path(manifest_path)
+    manifest = load_manifest(manifest_file)
+    entry = manifest["sources"].setdefault(str(src_path), {})
+    entry["source_sha256"] = source_sha
+
+    def render_canvas() -> str:
+        return load_script(CANVAS_SCRIPT).build_canvas_html(md_text)
+
+    def render_rubric() -> str:
+        stage = load_script(RUBRIC_SCRIPT)
+        rubric = stage.build_rubric(md_text, require_sum, stage.rubric_source_path(src, rubric_out), source_sha)
+        if not rubric["valid_total"]:
+            raise ValueError(f"points sum to {rubric['total_points']} but expected {require_sum}")
+        return json.dumps(rubric, indent=2)
+
+    statuses = {}
+    if canvas_out is not None:
+        statuses["canvas"] = run_stage("canvas", entry, stage_key(source_sha, CANVAS_SCRIPT, {}),
+                                       Path(canvas_out), render_canvas, force)
+    statuses["rubric"] = run_stage("rubric", entry,
+                                   stage_key(source_sha, RUBRIC_SCRIPT, {"require_sum": require_sum, "out": rubric_out}),
+                                   Path(rubric_out), render_rubric, force)
+    if any(status != "skipped" for status in statuses.values()) or not manifest_file.exists():
+        write_if_changed(manifest_file, json.dumps(manifest, indent=2, sort_keys=True))
+    return statuses
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Incrementally build 02_canvas.html and 03_rubric.json")
+    ap.add_argument("--src", default="01_source.md", help="Source markdown")
+    ap.add_argument("--canvas-out", default="02_canvas.html", help="Output HTML file")
+    ap.add_argument("--rubric-out", default="03_rubric.json", help="Output rubric JSON")
+    ap.add_argument("--require-sum", type=float, default=10.0, help="Expected total points")
+    ap.add_argument("--manifest", default=DEFAULT_MANIFEST, help="Build manifest (hashes of inputs/outputs)")
+    ap.add_argument("--force", action="store_true", help="Rebuild every stage")
+    args = ap.parse_args(argv)
+
+    try:
+        statuses = build(args.src, args.canvas_out, args.rubric_out, args.require_sum, args.manifest, args.force)
+    except (FileNotFoundError, ValueError) as exc:
+        raise SystemExit(f"ERROR: {exc}")
+
+    print(f"{args.canvas_out}: {statuses['canvas']} | {args.rubric_out}: {statuses['rubric']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
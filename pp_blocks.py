@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+pp_blocks.py
+
+Single-pass parser for the custom block grammar shared by the pipeline scripts:
+
+    :::meta                       :::criterion{id="roles" points="4"}
+    date: 2025-01-31              - D1: ...
+    :::                           :::
+
+- An opening line starts with ":::" followed by a block kind (\\w+) and an optional header.
+- A criterion header carries attributes in braces: {id="..." points="..."}.
+- The block ends at the next line that is just ":::" (trailing whitespace allowed).
+- Unclosed blocks are ignored.
+
+parse_document() walks the text line by line once and returns a compact tree of Block
+records whose body spans are offsets into the original string. Results are memoized per
+text, so 02_build_canvas_html.py, 03_build_rubric_json.py and 04_grade.py can all call it
+freely without rescanning the same document.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+OPEN_RE = re.compile(r":::(?P<kind>\w+)(?P<header>[^\n]*)")
+ATTR_RE = re.compile(r'(\w+)\s*=\s*"([^"]*)"')
+
+
+def parse_attrs(attr_text: str) -> Dict[str, str]:
+    """
+    Parse attribute string like: id="work_summary" points="2"
+    """
+    return {m.group(1): m.group(2) for m in ATTR_RE.finditer(attr_text)}
+
+
+def header_attrs(header: str) -> Dict[str, str]:
+    """
+    Attributes from a {...} header (criterion blocks); empty for plain headers.
+    """
+    header = header.strip()
+    if not (header.startswith("{") and "}" in header):
+        return {}
+    return parse_attrs(header[1:header.index("}")])
+
+
+@dataclass(frozen=True)
+class Block:
+    """
+    One :::kind ... ::: block.
+    start/end span the opening line through the closing ":::" (newline not included);
+    body_start/body_end span the lines in between (including the last body newline).
+    """
+    kind: str
+    header: str
+    attrs: Tuple[Tuple[str, str], ...]
+    start: int
+    end: int
+    body_start: int
+    body_end: int
+
+    def attr(self, name: str, default: str = "") -> str:
+        return dict(self.attrs).get(name, default)
+
+
+@dataclass(frozen=True)
+class Document:
+    """
+    Parsed markdown: the original text plus its blocks in document order.
+    """
+    text: str
+    blocks: Tuple[Block, ...]
+
+    def body(self, block: Block) -> str:
+        return self.text[block.body_start:block.body_end]
+
+    def first(self, kind: str) -> Optional[Block]:
+        return next((b for b in self.blocks if b.kind == kind), None)
+
+    def of_kind(self, kind: str) -> Tuple[Block, ...]:
+        return tuple(b for b in self.blocks if b.kind == kind)
+
+    def criteria_bodies(self) -> Dict[str, str]:
+        """
+        Returns mapping criterion_id -> stripped body text (blocks without an id are skipped).
+        """
+        out: Dict[str, str] = {}
+        for block in self.of_kind("criterion"):
+            cid = block.attr("id").strip()
+            if cid:
+                out[cid] = self.body(block).strip()
+        return out
+
+
+@lru_cache(maxsize=512)
+def parse_document(text: str) -> Document:
+    """
+    Tokenizes text into blocks in one linear pass over its lines.
+    Input: markdown text. Output: Document (memoized; treat it as read-only).
+    """
+    blocks = []
+    open_match: Optional[re.Match] = None
+    open_start = body_start = 0
+
+    pos = 0
+    length = len(text)
+    while pos < length:
+        newline = text.find("\n", pos)
+        line_end = length if newline < 0 else newline
+        next_pos = line_end + 1
+
+        if open_match is None:
+            m = OPEN_RE.match(text, pos, line_end)
+            if m and newline >= 0:
+                open_match, open_start, body_start = m, pos, next_pos
+        elif text.startswith(":::", pos) and not text[pos + 3:line_end].strip():
+            header = open_match.group("header")
+            blocks.append(Block(
+                kind=open_match.group("kind"),
+                header=header,
+                attrs=tuple(header_attrs(header).items()),
+                start=open_start,
+                end=pos + 3,
+                body_start=body_start,
+                body_end=pos,
+            ))
+            open_match = None
+
+        pos = next_pos
+
+    return Document(text=text, blocks=tuple(blocks))
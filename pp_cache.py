@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+pp_cache.py
+
+On-disk state of 04_grade.py batch runs (stdlib only):
+
+- GradeCache: content-addressed results keyed by the exact prompt, rubric and model options, so
+  unchanged submissions are never re-sent to the model (--refresh, --no-cache)
+- BatchJournal: append-only <out-dir>/_journal.jsonl of each submission's state (queued,
+  in_flight, done, failed), which --resume reads to skip unchanged submissions already done
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from pp_ollama import STOP_SEQUENCES
+
+
+class GradeCache:
+    """
+    Content-addressed on-disk cache of grading results.
+
+    Key: sha256 over (rubric JSON, model, generation options, exact prompt). With temperature 0.0
+    the model output is effectively a pure function of those inputs, so a hit can skip the model.
+    Entries live at <root>/<key[:2]>/<key>.json and hold the raw response and normalized result.
+    Eviction drops entries older than max_age_s, then least-recently-used entries above max_bytes.
+    """
+
+    def __init__(self, root: str, max_age_s: float, max_bytes: int, refresh: bool = False) -> None:
+        self.root = Path(root)
+        self.max_age_s = max_age_s
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(rubric: Dict[str, Any], config: Any, prompt: str) -> str:
+        """
+        Cache key for one prompt under 04_grade.py's GradeConfig (model, options, format, budget).
+        """
+        # source stamps change on any source edit; only the graded content belongs in the key
+        graded_rubric = {k: v for k, v in rubric.items() if k not in ("source", "source_sha256")}
+        key_material = json.dumps(
+            {
+                "rubric": graded_rubric,
+                "model": config.model,
+                "options": {
+                    "temperature": config.temperature,
+                    "num_predict": config.num_predict,
+                    "stop": STOP_SEQUENCES,
+                },
+                "format": config.response_format,
+                "prompt": prompt,
+                # adaptive budgets only change num_predict/num_ctx, but keep those runs apart
+                **({"budget_max_ctx": config.budget.max_ctx} if config.budget else {}),
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached entry ({"raw": str, "result": dict}) or None on a miss.
+        Always a miss when refresh is set. Unreadable entries count as misses.
+        """
+        path = self._entry_path(key)
+        entry = None
+        if not self.refresh and path.exists():
+            try:
+                entry = json.loads(path.read_text(encoding="utf-8"))
+                os.utime(path)  # mark as recently used for LRU eviction
+            except (OSError, ValueError):
+                entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key: str, raw: str, result: Dict[str, Any]) -> None:
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps({"raw": raw, "result": result, "created": time.time()}), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def evict(self) -> int:
+        """
+        Applies age and size limits. Returns the number of entries removed.
+        """
+        if not self.root.is_dir():
+            return 0
+        now = time.time()
+        entries = []
+        removed = 0
+        for path in self.root.glob("*/*.json"):
+            st = path.stat()
+            if now - st.st_mtime > self.max_age_s:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _mtime, size, _p in entries)
+        for _mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class BatchJournal:
+    """
+    Append-only JSONL log of submission states for one batch output folder:
+    {"ts", "submission", "state", "attempt", ...} with state queued | in_flight | retrying | done | failed.
+    Replaying the file gives the latest state per submission; a line cut short by a crash is ignored.
+    "done" events also carry run_key (see grading_run_key). Safe to call from the worker threads.
+    """
+
+    def __init__(self, path: Path, resume: bool = False, run_key: Optional[Dict[str, str]] = None) -> None:
+        self.path = path
+        self.run_key = run_key or {}
+        self.latest: Dict[str, Dict[str, Any]] = self.replay(path) if resume else {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._fh = self.path.open("a" if resume else "w", encoding="utf-8")
+
+    @staticmethod
+    def replay(path: Path) -> Dict[str, Dict[str, Any]]:
+        latest: Dict[str, Dict[str, Any]] = {}
+        if not path.exists():
+            return latest
+        with path.open("r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                latest[event["submission"]] = event
+        return latest
+
+    def close(self) -> None:
+        self._fh.close()
+
+    def record(self, path: Path, state: str, **fields: Any) -> None:
+        event = {"ts": time.time(), "submission": str(path), "state": state, **fields}
+        if state == "done":
+            event.update(self.run_key)
+        with self._lock:
+            self.latest[str(path)] = event
+            self._fh.write(json.dumps(event) + "\n")
+            self._fh.flush()
+
+    def finished_row(self, path: Path) -> Optional[Dict[str, Any]]:
+        """
+        The summary row of an earlier successful grade, if the submission text, its feedback file
+        and the run key (rubric, model, options) are unchanged since; None means the submission
+        still needs grading.
+        """
+        event = self.latest.get(str(path))
+        if not event or event["state"] != "done" or not Path(event["out_json"]).exists():
+            return None
+        if any(event.get(key) != value for key, value in self.run_key.items()):
+            return None
+        if event.get("sha256") != sha256_text(path.read_text(encoding="utf-8")):
+            return None
+        return {"submission": str(path), "student": path.stem, "status": "ok", "resumed": True,
+                "score_total": event["score_total"], "flags": event["flags"], "out_json": event["out_json"]}
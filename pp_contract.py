@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+pp_contract.py
+
+Grading output contract shared by 04_grade.py and its helpers:
+
+- the stable flag IDs the model may emit (ALLOWED_FLAGS) and the ones tied to one criterion
+- extract_json(): parses the model's JSON object, falling back to repair_json() for near-JSON
+  output (code fences, chatter, smart or single quotes, Python literals, trailing commas, output
+  cut off by num_predict)
+- expand_compact(): turns the --wire compact answer back into the contract form
+- validate_and_normalize(): the contract itself (known criteria, bounded points, sorted flags)
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+# --- Contract-stable flags (keep these IDs stable) ---
+FLAG_MISSING_SIGNOFF_A = "missing_signoff_a"
+FLAG_MISSING_SIGNOFF_B = "missing_signoff_b"
+FLAG_MISSING_LLM_REFLECTION = "missing_llm_reflection"
+FLAG_MISSING_WORK_SUMMARY = "missing_work_summary"
+FLAG_MISSING_SNAG = "missing_snag"
+FLAG_MISSING_NEXT_TIME_CHOICE = "missing_next_time_choice"
+
+ALLOWED_FLAGS = [
+    FLAG_MISSING_SIGNOFF_A,
+    FLAG_MISSING_SIGNOFF_B,
+    FLAG_MISSING_LLM_REFLECTION,
+    FLAG_MISSING_WORK_SUMMARY,
+    FLAG_MISSING_SNAG,
+    FLAG_MISSING_NEXT_TIME_CHOICE,
+]
+
+# Flags the model may raise while grading a single criterion (per-criterion engine).
+# Signoff flags belong to no criterion; they pass through from the prechecks unchanged.
+CRITERION_FLAGS = {
+    "work_summary": [FLAG_MISSING_WORK_SUMMARY],
+    "roles": [FLAG_MISSING_LLM_REFLECTION],
+    "snag": [FLAG_MISSING_SNAG],
+    "next_time": [FLAG_MISSING_NEXT_TIME_CHOICE],
+}
+
+JSON_OBJ_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+SMART_QUOTES = {"\u201c": '"', "\u201d": '"'}
+SMART_QUOTED = "smart"  # repair_json: string opened by a smart quote (closed by one as well)
+
+
+def repair_json(text: str) -> str:
+    """
+    Best-effort fix-up of near-JSON model output, in one pass from the first "{":
+    preamble and trailing chatter dropped, smart-quoted and single-quoted strings turned into
+    JSON strings (smart quotes inside a double-quoted string are kept as text), Python literals (True/False/None) and trailing commas fixed, and output cut off
+    by num_predict closed (open string, dangling key, open arrays/objects).
+    Returns the repaired text; it may still not parse.
+    """
+    start = text.find("{")
+    if start < 0:
+        return text
+    out: List[str] = []
+    closers: List[str] = []
+    quote = ""  # delimiter of the string being copied ('"', "'" or SMART_QUOTED), "" outside strings
+    escaped = False
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+                if ch == "'":
+                    out.pop()  # \' is not a JSON escape
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote or (quote == SMART_QUOTED and ch in SMART_QUOTES):
+                quote = ""
+                ch = '"'
+            elif ch == '"':
+                ch = '\\"'  # double quote inside a single- or smart-quoted string
+            out.append(ch)
+        elif ch in "\"'" or ch in SMART_QUOTES:
+            quote = ch if ch in "\"'" else SMART_QUOTED
+            out.append('"')
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            while out and out[-1] in ", \n\t\r":
+                out.pop()
+            if closers:
+                closers.pop()
+            out.append(ch)
+            if not closers:
+                break
+        elif ch.isalpha():
+            j = i
+            while j < len(text) and text[j].isalpha():
+                j += 1
+            word = text[i:j]
+            out.append(PYTHON_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if quote:
+        out.append('"')
+    if closers:
+        tail = "".join(out).rstrip().rstrip(",")
+        if tail.endswith(":"):
+            tail += " null"
+        out = [tail] + closers[::-1]
+    return "".join(out)
+
+
+def extract_json(text: str, stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Parses the model's JSON object: as-is, then the outermost {...} span, then repair_json().
+    stats["json_repaired"] is set when only the repaired text parsed.
+    Raises ValueError if no JSON object can be recovered.
+    """
+    text = text.strip()
+    candidates = []
+    if text.startswith("{") and text.endswith("}"):
+        candidates.append(text)
+    m = JSON_OBJ_RE.search(text)
+    if m:
+        candidates.append(m.group(0))
+    for candidate in candidates:
+        try:
+            result = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(result, dict):
+            return result
+
+    try:
+        result = json.loads(repair_json(text))
+    except ValueError:
+        result = None
+    if not isinstance(result, dict):
+        raise ValueError("Model output did not contain a JSON object.")
+    if stats is not None:
+        stats["json_repaired"] = True
+    return result
+
+
+def expand_compact(result: Dict[str, Any], rubric: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Expands a compact-wire answer into the contract format for validate_and_normalize:
+    the i-th "s" pair is the i-th rubric criterion, "o" is overall_comment and each "f" number
+    is an ALLOWED_FLAGS index (flag names are accepted too). Nothing is lost: ids come from the
+    rubric and score_total is recomputed by normalization anyway. Surplus pairs and unknown flag
+    numbers are reported as extra_scores:<n> / unknown_flag_index:<i>; a short "s" leaves the
+    remaining criteria to validate_and_normalize (missing_criterion). An answer that is already
+    in the contract format is returned unchanged.
+    Raises ValueError if "s" is not a list.
+    """
+    if "criteria" in result:
+        return result
+    scores = result.get("s")
+    if not isinstance(scores, list):
+        raise ValueError("compact output: 's' must be a list")
+
+    criteria = []
+    for c, pair in zip(rubric["criteria"], scores):
+        if isinstance(pair, list):
+            points, comment = (pair + [None, ""])[:2]
+        else:
+            points, comment = pair, ""
+        criteria.append({"criterion_id": c["criterion_id"], "points": points, "comment": comment or ""})
+
+    flags = []
+    for f in result.get("f") or []:
+        if isinstance(f, int) and not isinstance(f, bool) and 0 <= f < len(ALLOWED_FLAGS):
+            flags.append(ALLOWED_FLAGS[f])
+        elif f in ALLOWED_FLAGS:
+            flags.append(f)
+        else:
+            flags.append(f"unknown_flag_index:{f}")
+    if len(scores) > len(rubric["criteria"]):
+        flags.append(f"extra_scores:{len(scores) - len(rubric['criteria'])}")
+
+    return {
+        "score_total": 0,
+        "criteria": criteria,
+        "overall_comment": result.get("o", ""),
+        "flags": flags,
+    }
+
+
+def record_wire_savings(stats: Dict[str, Any], raw: str, answer: Dict[str, Any], normalized: Dict[str, Any],
+                        generated: int) -> None:
+    """
+    Estimates what the same answer would have cost in the verbose contract format: the tokens
+    generated for raw, scaled by the char ratio of raw with the compact JSON swapped for the
+    normalized contract JSON to raw itself. normalized (not the raw expansion) is used because
+    a repaired answer may lack points or hold non-numbers.
+    Accumulates compact_eval_count / verbose_eval_estimate; an answer the model wrote in the
+    contract format anyway (answer has "criteria") saved nothing and is not counted.
+    """
+    if generated <= 0 or not raw or "criteria" in answer:
+        return
+    other_chars = max(0, len(raw) - len(json.dumps(answer, ensure_ascii=False)))  # preamble, chatter
+    verbose_chars = other_chars + len(json.dumps(normalized, ensure_ascii=False))
+    stats["compact_eval_count"] = stats.get("compact_eval_count", 0) + generated
+    stats["verbose_eval_estimate"] = stats.get("verbose_eval_estimate", 0) + round(generated * verbose_chars / len(raw))
+
+
+def validate_and_normalize(result: Dict[str, Any], rubric: Dict[str, Any]) -> Dict[str, Any]:
+    required_keys = {"score_total", "criteria", "overall_comment", "flags"}
+    missing = required_keys - set(result.keys())
+    if missing:
+        raise ValueError(f"Missing keys in result JSON: {sorted(missing)}")
+
+    if not isinstance(result["criteria"], list):
+        raise ValueError("criteria must be a list")
+
+    max_map = {c["criterion_id"]: float(c["max_points"]) for c in rubric["criteria"]}
+    order = list(max_map.keys())
+
+    seen = set()
+    normalized_criteria = []
+    extra_flags: List[str] = []
+
+    for item in result["criteria"]:
+        cid = item.get("criterion_id")
+        pts = item.get("points")
+        comment = item.get("comment", "")
+
+        if cid not in max_map:
+            extra_flags.append(f"unknown_criterion_id:{cid}")
+            continue
+        if cid in seen:
+            extra_flags.append(f"duplicate_criterion_id:{cid}")
+            continue
+        seen.add(cid)
+
+        try:
+            pts_f = float(pts)
+        except Exception:
+            pts_f = 0.0
+            extra_flags.append(f"non_numeric_points:{cid}")
+
+        max_pts = max_map[cid]
+        if pts_f < 0:
+            pts_f = 0.0
+        if pts_f > max_pts:
+            pts_f = max_pts
+
+        normalized_criteria.append({"criterion_id": cid, "points": pts_f, "comment": str(comment).strip()})
+
+    for cid in max_map.keys():
+        if cid not in seen:
+            normalized_criteria.append({"criterion_id": cid, "points": 0.0, "comment": "No evidence found."})
+            extra_flags.append(f"missing_criterion:{cid}")
+
+    normalized_criteria.sort(key=lambda x: order.index(x["criterion_id"]))
+    score_total = sum(c["points"] for c in normalized_criteria)
+
+    combined_flags = list(result.get("flags", []))
+    combined_flags += extra_flags
+    combined_flags = sorted(set(str(f).strip() for f in combined_flags if str(f).strip()))
+
+    return {
+        "score_total": score_total,
+        "criteria": normalized_criteria,
+        "overall_comment": str(result.get("overall_comment", "")).strip(),
+        "flags": combined_flags,
+    }
+
+
+def render_human_text(result: Dict[str, Any], rubric: Dict[str, Any]) -> str:
+    total = rubric.get("expected_total_points", rubric.get("total_points", 10))
+    lines = [f"Score: {result['score_total']} / {total}", ""]
+
+    max_map = {c["criterion_id"]: c["max_points"] for c in rubric["criteria"]}
+    for c in result["criteria"]:
+        lines.append(f"- {c['criterion_id']}: {c['points']} / {max_map.get(c['criterion_id'], '?')}")
+        if c.get("comment"):
+            lines.append(f"  {c['comment']}")
+    lines.append("")
+
+    if result.get("overall_comment"):
+        lines.append("Overall:")
+        lines.append(result["overall_comment"])
+        lines.append("")
+
+    if result.get("flags"):
+        lines.append("Flags:")
+        for f in result["flags"]:
+            lines.append(f"- {f}")
+
+    return "\n".join(lines).strip() + "\n"
+
+
+REPAIR_FLAG_PREFIXES = ("missing_criterion:", "non_numeric_points:", "unknown_criterion_id:",
+                        "duplicate_criterion_id:", "unknown_flag_index:", "extra_scores:")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+pp_metrics.py
+
+Run metrics for 04_grade.py: --metrics appends one JSON line per submission with per-stage wall
+times and Ollama's token statistics, --metrics-summary prints a per-stage table, and the
+describe_*() helpers summarize a batch (prompt size, cascade, budgets, prefix reuse, wire savings).
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pp_ollama import OLLAMA_STAT_FIELDS
+
+# Per-submission wall-time stages reported by --metrics (seconds, summed across calls)
+METRIC_STAGES = (
+    "load_rubric",
+    "load_submission",
+    "fast_path_check",
+    "precheck_flags",
+    "build_prompt",
+    "http",
+    "extract_json",
+    "validate_and_normalize",
+)
+
+
+class MetricsWriter:
+    """
+    Appends one JSON line per graded submission to a metrics file:
+    {"submission", "status", "elapsed_s", "stages": {stage: s}, "ollama": {field: n}, "details": {...}}
+    run_info (model, engine, rubric load time, ...) is repeated in every record so lines stand alone.
+    """
+
+    def __init__(self, path: str, run_info: Dict[str, Any]) -> None:
+        self.path = Path(path)
+        self.run_info = run_info
+        self.records: List[Dict[str, Any]] = []
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = self.path.open("a", encoding="utf-8")
+
+    def close(self) -> None:
+        self._fh.close()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        record = metrics_record(row, self.run_info)
+        self.records.append(record)
+        self._fh.write(json.dumps(record) + "\n")
+        self._fh.flush()
+
+
+def metrics_record(row: Dict[str, Any], run_info: Dict[str, Any]) -> Dict[str, Any]:
+    stage_keys = {f"{stage}_s" for stage in METRIC_STAGES}
+    top_keys = {"submission", "student", "status", "score_total", "error", "elapsed_s"}
+    stages = {key[:-2]: row[key] for key in row if key in stage_keys}
+    stages.setdefault("load_rubric", run_info.get("load_rubric_s", 0.0))
+    return {
+        "ts": time.time(),
+        **{key: row[key] for key in row if key in top_keys},
+        "stages": stages,
+        "ollama": {key: row[key] for key in OLLAMA_STAT_FIELDS if key in row},
+        "details": {key: row[key] for key in row
+                    if key not in stage_keys and key not in top_keys and key not in OLLAMA_STAT_FIELDS
+                    and key not in ("flags", "out_json", "result", "criterion_fingerprints")},
+        "run": {key: value for key, value in run_info.items() if key != "load_rubric_s"},
+    }
+
+
+def render_metrics_summary(records: List[Dict[str, Any]]) -> str:
+    """
+    Per-stage table (total / mean / max seconds) plus Ollama token totals and generation speed.
+    """
+    lines = [f"{'stage':<24}{'total s':>10}{'mean s':>10}{'max s':>10}"]
+    load_rubric_s = records[0]["stages"].get("load_rubric", 0.0) if records else 0.0
+    lines.append(f"{'load_rubric (once)':<24}{load_rubric_s:>10.3f}")
+    for stage in METRIC_STAGES[1:]:
+        values = [r["stages"][stage] for r in records if stage in r["stages"]]
+        if values:
+            lines.append(f"{stage:<24}{sum(values):>10.3f}{sum(values) / len(values):>10.3f}{max(values):>10.3f}")
+
+    totals = {field: sum(r["ollama"].get(field, 0) for r in records) for field in OLLAMA_STAT_FIELDS}
+    lines.append("")
+    lines.append(f"prompt tokens: {totals['prompt_eval_count']}  generated tokens: {totals['eval_count']}")
+    lines.append(f"model load: {totals['load_duration'] / 1e9:.2f}s  prompt eval: "
+                 f"{totals['prompt_eval_duration'] / 1e9:.2f}s  generation: {totals['eval_duration'] / 1e9:.2f}s")
+    if totals["eval_duration"]:
+        complete = [r for r in records if not r["details"].get("stats_partial")]
+        generated = sum(r["ollama"].get("eval_count", 0) for r in complete)
+        lines.append(f"generation speed: {generated / (totals['eval_duration'] / 1e9):.1f} tokens/s")
+    cut = sum(1 for r in records if r["details"].get("stats_partial"))
+    if cut:
+        lines.append(f"{cut} streamed answers hung up before Ollama's stats: generated tokens counted "
+                     f"from the stream, prompt tokens unknown")
+    wire = describe_wire([r["details"] for r in records])
+    if wire:
+        lines.append(wire)
+    return "\n".join(lines)
+
+
+def describe_prompt_size(prompt_chars: int, prompt_chars_full: int) -> str:
+    saved = prompt_chars_full - prompt_chars
+    if not prompt_chars_full or not saved:
+        return f"Prompt: {prompt_chars} chars"
+    return f"Prompt: {prompt_chars} chars (full {prompt_chars_full}, -{100 * saved / prompt_chars_full:.0f}%)"
+
+
+def describe_cascade(rows: List[Dict[str, Any]]) -> str:
+    tiered = [r for r in rows if "tier" in r]
+    escalated = [r for r in tiered if r["tier"] == "escalated"]
+    reasons: Dict[str, int] = {}
+    for r in escalated:
+        for reason in r.get("escalation_reasons", []):
+            kind = reason.split(":", 1)[0]
+            reasons[kind] = reasons.get(kind, 0) + 1
+    detail = ", ".join(f"{kind} {n}" for kind, n in sorted(reasons.items()))
+    return f"Cascade: {len(escalated)} of {len(tiered)} escalated" + (f" ({detail})" if detail else "")
+
+
+def describe_incremental(rows: List[Dict[str, Any]], n_criteria: int) -> str:
+    """
+    How much of an --incremental batch was regraded: criteria sent to the model vs all criteria.
+    """
+    compared = [r for r in rows if "regraded_criteria" in r]
+    regraded = sum(len(r["regraded_criteria"]) for r in compared)
+    unchanged = sum(1 for r in rows if r.get("unchanged"))
+    fresh = sum(1 for r in rows if r["status"] == "ok" and "regraded_criteria" not in r and not r.get("resumed"))
+    return (f"Incremental: regraded {regraded} of {len(compared) * n_criteria} criteria in {len(compared)} "
+            f"previously graded submissions ({unchanged} unchanged); {fresh} graded in full")
+
+
+def describe_wire(rows: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Generated tokens of compact-wire answers against the estimate for the verbose contract format.
+    Micro-batched rows are left out: they answer in the contract format and carry a share of
+    their call's counters.
+    """
+    rows = [r for r in rows if not r.get("micro_batch")]
+    compact = sum(r.get("compact_eval_count", 0) for r in rows)
+    verbose = sum(r.get("verbose_eval_estimate", 0) for r in rows)
+    if not compact or not verbose:
+        return None
+    return (f"Compact output: {compact} generated tokens vs ~{verbose} in the verbose format "
+            f"(~{100 * (verbose - compact) / verbose:.0f}% saved)")
+
+
+def describe_micro_batch(rows: List[Dict[str, Any]]) -> str:
+    """
+    Submissions graded in shared calls, the model calls that took, and the single-grade fallbacks.
+    """
+    batched = [r for r in rows if r.get("micro_batch")]
+    calls = sum(1 / r["micro_batch"] for r in batched)
+    fallbacks = sum(1 for r in rows if r.get("micro_batch_fallback"))
+    return (f"Micro-batch: {len(batched)} submissions graded in {calls:.0f} calls "
+            f"({len(batched) - calls:.0f} calls saved), {fallbacks} fell back to single grading")
+
+
+def describe_budget(rows: List[Dict[str, Any]]) -> str:
+    """
+    Generation tokens budgeted (num_predict) against generated, and the average num_ctx per call.
+    """
+    budgeted = [r for r in rows if r.get("predict_tokens")]
+    calls = sum(r.get("budgeted_calls", 1) for r in budgeted)
+    predict = sum(r["predict_tokens"] for r in budgeted)
+    generated = sum(r.get("eval_count", 0) for r in budgeted)
+    ctx = sum(r.get("ctx_tokens", 0) for r in budgeted)
+    trimmed = sum(len(r.get("trimmed_criteria", [])) for r in rows)
+    return (f"Budget: {generated} of {predict} generation tokens used over {len(budgeted)} submissions, "
+            f"avg num_ctx {ctx / max(1, calls):.0f}, {trimmed} answers trimmed")
+
+
+def describe_prompt_eval(rows: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Prompt tokens Ollama actually evaluated (prompt_eval_count excludes reused prefix tokens)
+    against an estimate for evaluating every prompt in full: each prompt's chars times the highest
+    tokens-per-char ratio seen, i.e. a call that evaluated its whole prompt. Only indicative.
+    """
+    # escalated rows hold two calls' tokens for one prompt; leave them out of the ratio
+    measured = [r for r in rows if r.get("prompt_eval_count") and r.get("prompt_chars") and r.get("tier") != "escalated"]
+    if not measured:
+        return None
+    evaluated = sum(r["prompt_eval_count"] for r in measured)
+    per_char = max(r["prompt_eval_count"] / r["prompt_chars"] for r in measured)
+    full = per_char * sum(r["prompt_chars"] for r in measured)
+    saved = max(0.0, full - evaluated)
+    return (f"Prompt eval: {evaluated} tokens over {len(measured)} submissions "
+            f"(~{full:.0f} if evaluated in full, ~{100 * saved / full:.0f}% saved by prefix reuse)")
@@ -0,0 +1,586 @@
+#!/usr/bin/env python3
+"""
+pp_ollama.py
+
+HTTP client for Ollama's /api/generate used by 04_grade.py:
+
+- OllamaClient: one pooled requests.Session per host, plain or streamed (NDJSON) generation,
+  warm/cold model accounting from load_duration, and a one-time fallback from a JSON schema to
+  format="json" on servers that reject schemas
+- OllamaPool: several hosts behind the same interface; each call goes to the host with the fewest
+  outstanding requests, hosts are health-checked via /api/tags and a failing host's calls are
+  re-sent to the others
+- TokenBudget: per-call num_predict/num_ctx sizing for --adaptive-budget, calibrated against the
+  prompt_eval_count Ollama reports
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Counters and durations (nanoseconds) Ollama returns with every finished generation
+OLLAMA_STAT_FIELDS = (
+    "prompt_eval_count",
+    "eval_count",
+    "load_duration",
+    "prompt_eval_duration",
+    "eval_duration",
+    "total_duration",
+)
+
+# stop early if it tries to start formatting
+STOP_SEQUENCES = ["```", "\n\n\n"]
+
+
+@dataclass
+class StreamResult:
+    """
+    Outcome of one streamed generation. Times are seconds since the request was sent.
+    """
+    text: str
+    first_token_s: Optional[float]
+    total_s: float
+    stopped_early: bool
+
+
+class JsonObjectTracker:
+    """
+    Watches streamed text and reports when the first top-level JSON object has closed.
+    Double-quoted strings are tracked from the first character, so braces quoted in the model's
+    preamble neither open nor close the object; backslash escapes inside strings are honored.
+    """
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+        self.end_index = -1  # offset just past the closing "}" in the full text
+        self._consumed = 0
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Consumes the next chunk of text. Returns True once the object is complete.
+        """
+        for i, ch in enumerate(chunk):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+                self.started = True
+            elif ch == "}" and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end_index = self._consumed + i + 1
+                    return True
+        self._consumed += len(chunk)
+        return False
+
+
+class TokenBudget:
+    """
+    Sizes num_ctx and num_predict for each call instead of one fixed budget for every prompt.
+
+    Prompt tokens are estimated without a tokenizer as chars * tokens-per-char, starting from
+    DEFAULT_TOKENS_PER_CHAR and calibrated per model against the prompt_eval_count Ollama reports
+    (moving average). Calls that evaluated far fewer tokens than estimated reused a cached prompt
+    prefix and are not used for calibration.
+    num_predict comes from the number of criteria the answer must cover (never above the
+    configured --num-predict). num_ctx is the estimated prompt plus num_predict with a safety margin,
+    rounded up to a power of two between min_ctx and max_ctx: Ollama reloads the model whenever
+    num_ctx changes, so only a few sizes should ever be requested.
+    """
+
+    DEFAULT_TOKENS_PER_CHAR = 0.3
+    SAFETY = 1.15
+    OUTPUT_BASE_TOKENS = 100  # braces, overall_comment, flags
+    OUTPUT_TOKENS_PER_CRITERION = 110  # id, points and a short comment
+    MIN_PREDICT = 128
+    SMOOTHING = 0.2
+
+    def __init__(self, max_ctx: int = 8192, min_ctx: int = 2048) -> None:
+        self.max_ctx = max_ctx
+        self.min_ctx = min(min_ctx, max_ctx)
+        self.tokens_per_char: Dict[str, float] = {}
+        self.calibrations = 0
+        self.ctx_sizes: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def ratio(self, model: str) -> float:
+        return self.tokens_per_char.get(model, self.DEFAULT_TOKENS_PER_CHAR)
+
+    def is_calibrated(self, model: str) -> bool:
+        return model in self.tokens_per_char
+
+    def prompt_tokens(self, model: str, prompt_chars: int) -> int:
+        return int(prompt_chars * self.ratio(model)) + 1
+
+    def num_predict(self, n_criteria: int, ceiling: int) -> int:
+        wanted = self.OUTPUT_BASE_TOKENS + self.OUTPUT_TOKENS_PER_CRITERION * max(1, n_criteria)
+        return max(min(self.MIN_PREDICT, ceiling), min(wanted, ceiling))
+
+    def num_ctx(self, model: str, prompt_chars: int, num_predict: int) -> int:
+        needed = int((self.prompt_tokens(model, prompt_chars) + num_predict) * self.SAFETY)
+        ctx = self.min_ctx
+        while ctx < needed and ctx < self.max_ctx:
+            ctx *= 2
+        ctx = min(ctx, self.max_ctx)
+        with self._lock:
+            self.ctx_sizes[ctx] = self.ctx_sizes.get(ctx, 0) + 1
+        return ctx
+
+    def max_prompt_chars(self, model: str, num_predict: int) -> int:
+        """
+        Longest prompt that still fits max_ctx next to num_predict generated tokens.
+        """
+        return max(0, int((self.max_ctx / self.SAFETY - num_predict) / self.ratio(model)))
+
+    def observe(self, model: str, prompt_chars: int, prompt_eval_count: int) -> None:
+        """
+        Calibrates the model's tokens-per-char from one call's reported prompt_eval_count.
+        """
+        if prompt_chars <= 0 or prompt_eval_count <= 0:
+            return
+        measured = prompt_eval_count / prompt_chars
+        with self._lock:
+            current = self.ratio(model)
+            if measured < current / 2:
+                return  # prefix cache hit: only the tail was evaluated
+            self.tokens_per_char[model] = current + self.SMOOTHING * (measured - current)
+            self.calibrations += 1
+
+    def describe(self) -> str:
+        ratios = ", ".join(f"{m} {1 / r:.2f}" for m, r in sorted(self.tokens_per_char.items())) or "uncalibrated"
+        sizes = ", ".join(f"{ctx} x{n}" for ctx, n in sorted(self.ctx_sizes.items())) or "-"
+        return f"Budget: chars/token {ratios} ({self.calibrations} calibrations); num_ctx {sizes}"
+
+
+def build_generate_payload(
+    model: str,
+    prompt: str,
+    num_predict: int,
+    temperature: float,
+    stream: bool,
+    keep_alive: Optional[str] = None,
+    fmt: Optional[Any] = None,
+    num_ctx: Optional[int] = None,
+) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {
+        "model": model,
+        "prompt": prompt,
+        "stream": stream,
+        "options": {
+            "temperature": temperature,
+            "num_predict": num_predict,
+            "stop": STOP_SEQUENCES,
+        },
+    }
+    if num_ctx:
+        payload["options"]["num_ctx"] = num_ctx
+    if keep_alive:
+        payload["keep_alive"] = keep_alive
+    if fmt is not None:
+        payload["format"] = fmt
+    return payload
+
+
+SCHEMA_REJECTION_RE = re.compile(r"format|schema", re.IGNORECASE)
+
+
+def is_schema_rejection(response: requests.Response) -> bool:
+    """
+    True if an HTTP 400 body says the server can't take a JSON schema in `format`
+    (other 400s, e.g. a bad option, must not switch the client to plain JSON).
+    """
+    return response.status_code == 400 and bool(SCHEMA_REJECTION_RE.search(response.text))
+
+
+class OllamaClient:
+    """
+    Reusable connection to one Ollama host: a pooled keep-alive requests.Session plus
+    Ollama's keep_alive setting so the model stays loaded between calls and runs.
+    model is the default; generate() and warmup() take another one per call, so a cascade's
+    base and escalation models share the connection pool and the in-flight bound.
+
+    Each call records into the caller's stats dict whether it hit an already-loaded model
+    (Ollama reports load_duration; anything under COLD_LOAD_THRESHOLD_S counts as warm).
+    The session is shared by all worker threads. pool_size is also the most generations this
+    client runs at once (like OLLAMA_NUM_PARALLEL): further callers wait for a free slot, so
+    nested fan-out (per-criterion calls inside batch workers) never exceeds the bound.
+
+    Older Ollama servers reject a JSON schema in `format` with HTTP 400; the first such
+    rejection (a 400 whose body names the format or schema) switches this client to
+    format="json" for the rest of the run. Any other 400 is raised as usual.
+    """
+
+    COLD_LOAD_THRESHOLD_S = 0.5
+    STREAM_GRACE_CHUNKS = 8  # chunks read past a closed answer while waiting for the stats frame
+
+    def __init__(self, host: str, model: str, timeout_s: int, keep_alive: Optional[str] = None,
+                 pool_size: int = 4) -> None:
+        self.host = host.rstrip("/")
+        self.url = self.host + "/api/generate"
+        self.model = model
+        self.timeout_s = timeout_s
+        self.keep_alive = keep_alive
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.warm_calls = 0
+        self.cold_calls = 0
+        self.schema_supported = True
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, pool_size))
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _record_stats(self, data: Dict[str, Any], stats: Dict[str, Any]) -> None:
+        for field in OLLAMA_STAT_FIELDS:
+            if field in data:
+                stats[field] = stats.get(field, 0) + int(data[field])
+        if "load_duration" not in data:
+            return
+        load_s = data["load_duration"] / 1e9
+        warm = load_s < self.COLD_LOAD_THRESHOLD_S
+        stats["load_s"] = load_s
+        stats["model_loaded"] = warm
+        with self._lock:
+            if warm:
+                self.warm_calls += 1
+            else:
+                self.cold_calls += 1
+
+    def is_up(self) -> bool:
+        """
+        Cheap health probe: GET /api/tags answers without touching the model.
+        """
+        try:
+            return self.session.get(self.host + "/api/tags", timeout=5).ok
+        except requests.RequestException:
+            return False
+
+    def _post(self, payload: Dict[str, Any], stream: bool = False) -> requests.Response:
+        """
+        POSTs a generate payload, downgrading a schema `format` to "json" if the server rejects it.
+        Raises requests.HTTPError for any other HTTP failure.
+        """
+        schema = isinstance(payload.get("format"), dict)
+        if schema and not self.schema_supported:
+            payload = dict(payload, format="json")
+        r = self.session.post(self.url, json=payload, timeout=self.timeout_s, stream=stream)
+        if schema and self.schema_supported and is_schema_rejection(r):
+            r.close()
+            self._disable_schema(r.text)
+            r = self.session.post(self.url, json=dict(payload, format="json"), timeout=self.timeout_s, stream=stream)
+        r.raise_for_status()
+        return r
+
+    def _disable_schema(self, reason: str) -> None:
+        """
+        Switches this client to format="json" for the rest of the run (logged once).
+        """
+        with self._lock:
+            was_supported = self.schema_supported
+            self.schema_supported = False
+        if was_supported:
+            logger.warning("%s rejected the JSON schema format (%s); using format=\"json\" from now on",
+                           self.host, reason.strip()[:200])
+
+    def warmup(self, model: Optional[str] = None) -> float:
+        """
+        Loads the model (an empty prompt makes Ollama load it and return immediately).
+        Returns the seconds taken. Raises requests.RequestException if the host is unreachable.
+        """
+        payload: Dict[str, Any] = {"model": model or self.model, "prompt": "", "stream": False}
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        started = time.perf_counter()
+        r = self.session.post(self.url, json=payload, timeout=self.timeout_s)
+        r.raise_for_status()
+        return time.perf_counter() - started
+
+    def generate(self, prompt: str, num_predict: int, temperature: float,
+                 stats: Optional[Dict[str, Any]] = None, fmt: Optional[Any] = None,
+                 num_ctx: Optional[int] = None, model: Optional[str] = None) -> str:
+        payload = build_generate_payload(model or self.model, prompt, num_predict, temperature,
+                                         stream=False, keep_alive=self.keep_alive, fmt=fmt, num_ctx=num_ctx)
+        with self._slots:
+            data = self._post(payload).json()
+        self._record_stats(data, stats if stats is not None else {})
+        resp = data.get("response", "") or ""
+        return resp.strip()
+
+    def generate_stream(self, prompt: str, num_predict: int, temperature: float,
+                        stats: Optional[Dict[str, Any]] = None, fmt: Optional[Any] = None,
+                        num_ctx: Optional[int] = None, model: Optional[str] = None,
+                        drain: bool = False) -> StreamResult:
+        """
+        Streams /api/generate NDJSON chunks and stops reading once a complete top-level JSON
+        object has been emitted. The final stats frame (token counts for metrics and the budget's
+        calibration) usually follows right after the object; if it hasn't arrived within
+        STREAM_GRACE_CHUNKS more chunks, the connection is closed (Ollama stops generating when
+        the client hangs up) and only the generated-token count is recorded, with stats["stats_partial"].
+        drain reads on to the stats frame however long the model keeps talking.
+        Returns the text up to and including the closing brace, plus time-to-first-token.
+        Raises requests.RequestException on HTTP failures and ValueError if the server reports an error.
+        """
+        payload = build_generate_payload(model or self.model, prompt, num_predict, temperature,
+                                         stream=True, keep_alive=self.keep_alive, fmt=fmt, num_ctx=num_ctx)
+        if stats is None:
+            stats = {}
+        tracker = JsonObjectTracker()
+        pieces: List[str] = []
+        first_token_s: Optional[float] = None
+        tokens = 0  # Ollama streams one token per chunk
+        closed_at: Optional[int] = None
+        stopped_early = False
+
+        started = time.perf_counter()
+        with self._slots, self._post(payload, stream=True) as r:
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise ValueError(f"Ollama error: {chunk['error']}")
+                if chunk.get("done"):
+                    self._record_stats(chunk, stats)
+                    break
+                piece = chunk.get("response", "") or ""
+                tokens += 1
+                if piece and first_token_s is None:
+                    first_token_s = time.perf_counter() - started
+                if closed_at is None:
+                    pieces.append(piece)
+                    if tracker.feed(piece):
+                        closed_at = tokens
+                elif not drain and tokens - closed_at >= self.STREAM_GRACE_CHUNKS:
+                    stopped_early = True
+                    break
+        total_s = time.perf_counter() - started
+        if stopped_early:
+            stats["eval_count"] = stats.get("eval_count", 0) + tokens
+            stats["stats_partial"] = True
+
+        text = "".join(pieces)
+        if tracker.end_index >= 0:
+            text = text[:tracker.end_index]
+        return StreamResult(text=text.strip(), first_token_s=first_token_s, total_s=total_s,
+                            stopped_early=stopped_early)
+
+
+def is_transient_error(exc: Exception) -> bool:
+    """
+    Failures worth retrying: the server was unreachable, too slow, or errored (Ollama OOM is a 500).
+    Parse/validation errors are not retried here (grade_criterion already retries those once).
+    """
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+        return True
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is None or exc.response.status_code >= 500
+    return False
+
+
+class OllamaPool:
+    """
+    Spreads calls over several Ollama hosts with the same interface as OllamaClient.
+
+    Each call goes to the healthy host with the fewest outstanding requests (ties: fewest calls
+    so far). A host whose call fails transiently (connection error, timeout, HTTP 5xx) is taken
+    out of rotation and the call is re-sent to another host, so in-flight submissions are
+    re-queued rather than failed. A background thread polls GET /api/tags every
+    health_interval_s seconds and returns recovered hosts to rotation. While every host is out
+    of rotation, calls go to the least recently failed host instead of failing outright (one
+    blip plus one slow answer shouldn't fail submissions until the next health check); a
+    success puts that host back in rotation.
+    Raises requests.ConnectionError when a call has failed on every host.
+    """
+
+    def __init__(self, hosts: List[str], model: str, timeout_s: int, keep_alive: Optional[str] = None,
+                 pool_size: int = 4, health_interval_s: float = 15.0) -> None:
+        self.clients = [OllamaClient(h, model, timeout_s, keep_alive=keep_alive, pool_size=pool_size)
+                        for h in hosts]
+        self.model = model
+        self.healthy = [True] * len(hosts)
+        self.failed_at = [0.0] * len(hosts)  # monotonic time of each host's last failure
+        self.outstanding = [0] * len(hosts)
+        self.calls = [0] * len(hosts)
+        self.failovers = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._checker: Optional[threading.Thread] = None
+        if health_interval_s > 0:
+            self._checker = threading.Thread(target=self._health_loop, args=(health_interval_s,), daemon=True)
+            self._checker.start()
+
+    @property
+    def warm_calls(self) -> int:
+        return sum(c.warm_calls for c in self.clients)
+
+    @property
+    def cold_calls(self) -> int:
+        return sum(c.cold_calls for c in self.clients)
+
+    def close(self) -> None:
+        self._stop.set()
+        for client in self.clients:
+            client.close()
+
+    def check_health(self) -> List[bool]:
+        """
+        Probes every host once and updates the rotation. Returns the health of each host.
+        """
+        for i, client in enumerate(self.clients):
+            ok = client.is_up()
+            with self._lock:
+                changed = ok != self.healthy[i]
+                self.healthy[i] = ok
+            if changed:
+                logger.info("Host %s %s", client.host, "back in rotation" if ok else "is down")
+        return list(self.healthy)
+
+    def _health_loop(self, interval_s: float) -> None:
+        while not self._stop.wait(interval_s):
+            self.check_health()
+
+    def _acquire(self, exclude: List[int]) -> int:
+        """
+        Picks a host for one call: the least busy healthy host not in exclude, else the least
+        recently failed host not in exclude. Raises requests.ConnectionError if every host is excluded.
+        """
+        with self._lock:
+            untried = [i for i in range(len(self.clients)) if i not in exclude]
+            if not untried:
+                raise requests.ConnectionError("Every Ollama host failed this call")
+            healthy = [i for i in untried if self.healthy[i]]
+            if healthy:
+                i = min(healthy, key=lambda j: (self.outstanding[j], self.calls[j]))
+            else:
+                i = min(untried, key=lambda j: self.failed_at[j])
+            self.outstanding[i] += 1
+            self.calls[i] += 1
+            return i
+
+    def _release(self, i: int, exc: Optional[Exception] = None) -> None:
+        with self._lock:
+            self.outstanding[i] -= 1
+            if exc is None:
+                recovered = not self.healthy[i]
+                self.healthy[i] = True
+            else:
+                self.failed_at[i] = time.monotonic()
+                went_down = self.healthy[i]
+                self.healthy[i] = False
+                if went_down:
+                    self.failovers += 1
+        host = self.clients[i].host
+        if exc is None:
+            if recovered:
+                logger.info("Host %s back in rotation", host)
+        elif went_down:
+            logger.warning("Host %s failed (%s); re-queueing on another host", host, type(exc).__name__)
+
+    def _call(self, method: str, prompt: str, num_predict: int, temperature: float,
+              stats: Optional[Dict[str, Any]], fmt: Optional[Any], num_ctx: Optional[int],
+              model: Optional[str], **options: Any) -> Any:
+        tried: List[int] = []
+        while True:
+            i = self._acquire(tried)
+            failure: Optional[Exception] = None
+            try:
+                result = getattr(self.clients[i], method)(prompt, num_predict, temperature, stats, fmt, num_ctx, model,
+                                                          **options)
+            except requests.RequestException as exc:
+                if not is_transient_error(exc):
+                    raise
+                failure = exc
+            finally:
+                self._release(i, failure)  # also on ValueError (Ollama error chunk) and anything else
+            if failure is not None:
+                tried.append(i)
+                continue
+            if stats is not None:
+                stats["host"] = self.clients[i].host
+            return result
+
+    def generate(self, prompt: str, num_predict: int, temperature: float,
+                 stats: Optional[Dict[str, Any]] = None, fmt: Optional[Any] = None,
+                 num_ctx: Optional[int] = None, model: Optional[str] = None) -> str:
+        return self._call("generate", prompt, num_predict, temperature, stats, fmt, num_ctx, model)
+
+    def generate_stream(self, prompt: str, num_predict: int, temperature: float,
+                        stats: Optional[Dict[str, Any]] = None, fmt: Optional[Any] = None,
+                        num_ctx: Optional[int] = None, model: Optional[str] = None,
+                        drain: bool = False) -> StreamResult:
+        return self._call("generate_stream", prompt, num_predict, temperature, stats, fmt, num_ctx, model,
+                          drain=drain)
+
+    def warmup(self, model: Optional[str] = None) -> float:
+        """
+        Loads the model on every healthy host in parallel. Returns the slowest host's seconds.
+        """
+        targets = [c for c, ok in zip(self.clients, self.healthy) if ok]
+        if not targets:
+            raise requests.ConnectionError("No healthy Ollama host available")
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            return max(pool.map(lambda c: c.warmup(model), targets))
+
+    def describe(self) -> str:
+        return ", ".join(f"{c.host}: {n} calls{'' if ok else ' (down)'}"
+                         for c, n, ok in zip(self.clients, self.calls, self.healthy))
+
+
+def ollama_generate(
+    host: str,
+    model: str,
+    prompt: str,
+    num_predict: int,
+    temperature: float,
+    timeout_s: int,
+) -> str:
+    """
+    One-shot, non-pooled generation. Prefer a shared OllamaClient for repeated calls.
+    """
+    client = OllamaClient(host, model, timeout_s, pool_size=1)
+    try:
+        return client.generate(prompt, num_predict, temperature)
+    finally:
+        client.close()
+
+
+def ollama_generate_stream(
+    host: str,
+    model: str,
+    prompt: str,
+    num_predict: int,
+    temperature: float,
+    timeout_s: int,
+) -> StreamResult:
+    """
+    One-shot streamed generation; see OllamaClient.generate_stream.
+    """
+    client = OllamaClient(host, model, timeout_s, pool_size=1)
+    try:
+        return client.generate_stream(prompt, num_predict, temperature)
+    finally:
+        client.close()
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+pp_prompts.py
+
+Prompt text and output schemas for 04_grade.py:
+
+- build_prompt(): the whole-submission prompt; build_prompt_prefix()/build_prompt_tail() split it
+  so every rubric-invariant part comes first as one byte-identical prefix (--prompt-layout prefix)
+- build_compact_prompt_prefix(): the --wire compact variant (scores by position, flag numbers)
+- build_micro_batch_prompt(): several submissions under one rubric header (--micro-batch)
+- build_criterion_prompt(): one criterion at a time (--engine per-criterion)
+- *_schema(): JSON schemas for Ollama's `format` parameter, built from the rubric
+"""
+
+from __future__ import annotations
+
+import json
+import textwrap
+from typing import Any, Dict, List, Optional, Tuple
+
+from pp_contract import ALLOWED_FLAGS, CRITERION_FLAGS
+
+PROMPT_INTRO = "You are grading ONE student submission against a rubric."
+
+CONTRACT_SCHEMA_TEXT = """{
+  "score_total": number,
+  "criteria": [
+    { "criterion_id": string, "points": number, "comment": string }
+  ],
+  "overall_comment": string,
+  "flags": [string]
+}"""
+
+EVIDENCE_RULE = "- Use only evidence in the submission."
+COVERAGE_RULE = "- Each criterion_id must appear exactly once in criteria[]."
+GRADED_COVERAGE_RULE = "- Each criterion_id listed under GRADE must appear exactly once in criteria[]; leave out all others."
+POINTS_RULE = "- points must be between 0 and that criterion's max_points."
+TOTAL_RULE = "- score_total must equal the sum of points."
+COMMENT_RULE = "- Keep comments short, specific, and tied to evidence."
+NEXT_TIME_RULE = ('- For "next_time": DO NOT judge the *type* of checkbox chosen. Only require that EXACTLY ONE '
+                  "checkbox is selected and that one-sentence plan exists.")
+# micro-batch prompt: several submissions, one result each
+BATCH_EVIDENCE_RULE = "- Grade every submission only on its own evidence; never compare submissions or carry evidence over."
+BATCH_COVERAGE_RULE = "- Each criterion_id must appear exactly once in each result's criteria[]."
+BATCH_TOTAL_RULE = "- score_total must equal the sum of that result's points."
+
+
+def rubric_section(rubric: Dict[str, Any]) -> str:
+    """
+    RUBRIC section shared by the whole-submission prompts: total points and each criterion's
+    id, max points and (truncated) prompt.
+    """
+    criteria_text = "\n".join(
+        f'- {c["criterion_id"]} (max {c["max_points"]}): {c["prompt"][:260].strip()}' for c in rubric["criteria"]
+    )
+    total = rubric.get("expected_total_points", rubric.get("total_points", 10))
+    return f"RUBRIC:\n- total_points: {total}\n- criteria:\n{criteria_text}"
+
+
+def rules_section(
+    coverage: Optional[str] = COVERAGE_RULE,
+    evidence: str = EVIDENCE_RULE,
+    total: Optional[str] = TOTAL_RULE,
+) -> str:
+    """
+    NON-NEGOTIABLE RULES section shared by the whole-submission prompts. coverage (which
+    criterion ids the answer must contain), evidence and total vary with the output format;
+    None leaves a rule out (the compact wire has no ids and no score_total).
+    """
+    rules = [evidence, coverage, POINTS_RULE, total, COMMENT_RULE, NEXT_TIME_RULE]
+    return "NON-NEGOTIABLE RULES:\n" + "\n".join(rule for rule in rules if rule)
+
+
+def flags_section() -> str:
+    """
+    FLAGS section header shared by the whole-submission prompts: the allowlist of flag names.
+    """
+    return "FLAGS:\n- flags[] may ONLY contain items from this allowlist:\n" + json.dumps(ALLOWED_FLAGS, indent=2)
+
+
+def build_prompt(rubric: Dict[str, Any], submission_md: str, preflags: List[str]) -> str:
+    """
+    Tell the model exactly what the rubric is AND exactly what flags are allowed.
+    Also: forbid it from judging checkbox "quality" (only "exactly one selected").
+    """
+    prompt = f"""
+{PROMPT_INTRO}
+
+STRICT OUTPUT:
+- Output ONLY valid JSON (no markdown, no commentary).
+- Must match this JSON schema exactly:
+{CONTRACT_SCHEMA_TEXT}
+
+{rubric_section(rubric)}
+
+{rules_section()}
+
+{flags_section()}
+
+PRECHECK (deterministic findings):
+- If any of these are present, include them in flags[] (unless you verify the submission actually satisfies it):
+{json.dumps(preflags, indent=2)}
+
+SUBMISSION (markdown):
+{submission_md}
+""".strip()
+
+    return prompt
+
+
+def build_prompt_prefix(rubric: Dict[str, Any]) -> str:
+    """
+    Rubric-invariant head of a prefix-layout prompt: byte-identical for every submission graded
+    against the same rubric, so the server can reuse its evaluated tokens.
+    """
+    return f"""{PROMPT_INTRO}
+
+STRICT OUTPUT:
+- Output ONLY valid JSON (no markdown, no commentary).
+- Must match this JSON schema exactly:
+{CONTRACT_SCHEMA_TEXT}
+
+{rubric_section(rubric)}
+
+{rules_section(GRADED_COVERAGE_RULE)}
+
+{flags_section()}
+- PRECHECK lists deterministic findings: include each in flags[] unless you verify the submission actually satisfies it.
+
+"""
+
+
+def build_prompt_tail(rubric: Dict[str, Any], submission_md: str, preflags: List[str]) -> str:
+    """
+    Per-submission end of a prefix-layout prompt: the criteria to grade (rubric may be a
+    subset of the prefix rubric), precheck findings and the submission itself.
+    """
+    graded = [c["criterion_id"] for c in rubric["criteria"]]
+    return f"""GRADE: {json.dumps(graded)}
+
+PRECHECK:
+{json.dumps(preflags, indent=2)}
+
+SUBMISSION (markdown):
+{submission_md}
+""".rstrip()
+
+
+def build_layout_prompt(
+    rubric: Dict[str, Any],
+    submission_md: str,
+    preflags: List[str],
+    layout: str,
+    prefix_rubric: Optional[Dict[str, Any]] = None,
+    wire: str = "contract",
+) -> str:
+    """
+    build_prompt() for the classic layout; prefix + tail for the prefix layout, where the prefix
+    always shows prefix_rubric (the full rubric) even when only some criteria are graded.
+    The compact wire always uses prefix + tail (the classic layout just shows rubric in the prefix).
+    """
+    if wire == "compact":
+        head = (prefix_rubric or rubric) if layout == "prefix" else rubric
+        return build_compact_prompt_prefix(head) + build_prompt_tail(rubric, submission_md, preflags)
+    if layout == "prefix":
+        return build_prompt_prefix(prefix_rubric or rubric) + build_prompt_tail(rubric, submission_md, preflags)
+    return build_prompt(rubric, submission_md, preflags)
+
+
+def build_compact_prompt_prefix(rubric: Dict[str, Any]) -> str:
+    """
+    build_prompt_prefix() for the compact wire format: scores as [points, "comment"] pairs in
+    GRADE order (no criterion ids), short keys and flag numbers instead of flag names.
+    """
+    flags_text = "\n".join(f"{i}: {flag}" for i, flag in enumerate(ALLOWED_FLAGS))
+    return f"""{PROMPT_INTRO}
+
+STRICT OUTPUT:
+- Output ONLY valid JSON (no markdown, no commentary) in this compact form:
+{{"s": [[points, "comment"], ...], "o": "overall comment", "f": [flag numbers]}}
+- "s" holds exactly one [points, "comment"] pair per criterion listed under GRADE, in that order.
+- "o" is a short overall comment; "f" lists the numbers of the flags that apply.
+
+{rubric_section(rubric)}
+
+{rules_section(coverage=None, total=None)}
+
+FLAGS (put the numbers in "f"):
+{flags_text}
+- PRECHECK lists deterministic findings: include each one's number in "f" unless you verify the submission actually satisfies it.
+
+"""
+
+
+def build_micro_batch_prompt(rubric: Dict[str, Any], items: List[Tuple[str, str, List[str]]]) -> str:
+    """
+    One prompt grading several submissions: a single rubric header, then each (submission_id,
+    markdown, precheck flags) item. The model answers {"results": [contract object + "id", ...]}.
+    """
+    result_schema = textwrap.indent(CONTRACT_SCHEMA_TEXT.replace("{\n", '{\n  "id": string,\n', 1), "    ")
+    head = f"""You are grading SEVERAL student submissions against the same rubric, each one on its own.
+
+STRICT OUTPUT:
+- Output ONLY valid JSON (no markdown, no commentary), one result per submission:
+{{
+  "results": [
+{result_schema}
+  ]
+}}
+- "id" is the SUBMISSION ID exactly as given; every submission gets exactly one result.
+
+{rubric_section(rubric)}
+
+{rules_section(BATCH_COVERAGE_RULE, BATCH_EVIDENCE_RULE, BATCH_TOTAL_RULE)}
+
+{flags_section()}
+- Each submission's PRECHECK lists deterministic findings: include each in that result's flags[] unless you verify the submission actually satisfies it.
+"""
+    parts = [head]
+    for submission_id, submission_md, preflags in items:
+        parts.append(f"""=== SUBMISSION ID: {submission_id} ===
+PRECHECK:
+{json.dumps(preflags)}
+
+SUBMISSION (markdown):
+{submission_md.strip()}
+""")
+    return "\n".join(parts).rstrip()
+
+
+def build_criterion_prompt(
+    criterion: Dict[str, Any],
+    body: str,
+    pair_type: str,
+    preflags: List[str],
+    layout: str = "classic",
+) -> str:
+    """
+    Builds a small prompt that grades ONE criterion from only its rubric text and the
+    student's answer for it. The model returns {"points", "comment", "flags"}.
+    The prefix layout keeps everything above the answer identical for every student.
+    """
+    cid = criterion["criterion_id"]
+    allowed = CRITERION_FLAGS.get(cid, [])
+    relevant_preflags = [f for f in preflags if f in allowed]
+
+    extra_rules = ""
+    if cid == "next_time":
+        extra_rules = ("\n- DO NOT judge the *type* of checkbox chosen. Only require that EXACTLY ONE checkbox "
+                       "is selected and that one-sentence plan exists.")
+    if layout == "prefix":
+        if cid == "roles":
+            extra_rules += "\n- Judge the reflections against the pair_type given below, if any."
+        return build_criterion_prefix(criterion, extra_rules) + (
+            (f"pair_type: {pair_type}\n\n" if cid == "roles" and pair_type else "")
+            + f"PRECHECK:\n{json.dumps(relevant_preflags)}\n\nSTUDENT ANSWER (markdown):\n{body}"
+        ).rstrip()
+    if cid == "roles" and pair_type:
+        extra_rules += f"\n- pair_type is: {pair_type}"
+
+    prompt = f"""
+You are grading ONE rubric criterion of a student submission.
+
+STRICT OUTPUT:
+- Output ONLY valid JSON (no markdown, no commentary).
+- Must match this JSON schema exactly:
+{{ "points": number, "comment": string, "flags": [string] }}
+
+CRITERION: {cid} (max {criterion["max_points"]})
+{criterion["prompt"].strip()}
+
+NON-NEGOTIABLE RULES:
+- Use only evidence in the student answer below.
+- points must be between 0 and {criterion["max_points"]}.
+- Keep the comment short, specific, and tied to evidence.{extra_rules}
+
+FLAGS:
+- flags[] may ONLY contain items from this allowlist:
+{json.dumps(allowed)}
+
+PRECHECK (deterministic findings):
+- If any of these are present, include them in flags[] (unless you verify the answer actually satisfies it):
+{json.dumps(relevant_preflags)}
+
+STUDENT ANSWER (markdown):
+{body}
+""".strip()
+
+    return prompt
+
+
+def build_criterion_prefix(criterion: Dict[str, Any], extra_rules: str) -> str:
+    cid = criterion["criterion_id"]
+    return f"""You are grading ONE rubric criterion of a student submission.
+
+STRICT OUTPUT:
+- Output ONLY valid JSON (no markdown, no commentary).
+- Must match this JSON schema exactly:
+{{ "points": number, "comment": string, "flags": [string] }}
+
+CRITERION: {cid} (max {criterion["max_points"]})
+{criterion["prompt"].strip()}
+
+NON-NEGOTIABLE RULES:
+- Use only evidence in the student answer below.
+- points must be between 0 and {criterion["max_points"]}.
+- Keep the comment short, specific, and tied to evidence.{extra_rules}
+
+FLAGS:
+- flags[] may ONLY contain items from this allowlist:
+{json.dumps(CRITERION_FLAGS.get(cid, []))}
+- PRECHECK lists deterministic findings: include each in flags[] unless you verify the answer actually satisfies it.
+
+"""
+
+
+def contract_schema(rubric: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    JSON schema of the contract output for Ollama's `format` parameter: one entry per rubric
+    criterion (criterion_id enum, points bounded by that criterion's max) and flags from ALLOWED_FLAGS.
+    """
+    items = [
+        {
+            "type": "object",
+            "properties": {
+                "criterion_id": {"type": "string", "enum": [c["criterion_id"]]},
+                "points": {"type": "number", "minimum": 0, "maximum": float(c["max_points"])},
+                "comment": {"type": "string"},
+            },
+            "required": ["criterion_id", "points", "comment"],
+        }
+        for c in rubric["criteria"]
+    ]
+    return {
+        "type": "object",
+        "properties": {
+            "score_total": {"type": "number", "minimum": 0,
+                            "maximum": sum(float(c["max_points"]) for c in rubric["criteria"])},
+            "criteria": {"type": "array", "items": {"anyOf": items},
+                         "minItems": len(items), "maxItems": len(items)},
+            "overall_comment": {"type": "string"},
+            "flags": {"type": "array", "items": {"type": "string", "enum": ALLOWED_FLAGS}},
+        },
+        "required": ["score_total", "criteria", "overall_comment", "flags"],
+    }
+
+
+def compact_schema(rubric: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    JSON schema of the compact wire format: "s" is one [points, comment] tuple per rubric
+    criterion in rubric order (points bounded per criterion), "f" holds indices into ALLOWED_FLAGS.
+    """
+    pairs = [
+        {
+            "type": "array",
+            "prefixItems": [
+                {"type": "number", "minimum": 0, "maximum": float(c["max_points"])},
+                {"type": "string"},
+            ],
+            "minItems": 2,
+            "maxItems": 2,
+        }
+        for c in rubric["criteria"]
+    ]
+    return {
+        "type": "object",
+        "properties": {
+            "s": {"type": "array", "prefixItems": pairs, "minItems": len(pairs), "maxItems": len(pairs)},
+            "o": {"type": "string"},
+            "f": {"type": "array", "items": {"type": "integer", "enum": list(range(len(ALLOWED_FLAGS)))}},
+        },
+        "required": ["s", "o", "f"],
+    }
+
+
+def micro_batch_schema(rubric: Dict[str, Any], ids: List[str]) -> Dict[str, Any]:
+    """
+    JSON schema of a micro-batch answer: {"results": [...]} with one contract object per id.
+    """
+    item = contract_schema(rubric)
+    item = dict(item, properties=dict(item["properties"], id={"type": "string", "enum": ids}),
+                required=["id"] + item["required"])
+    return {
+        "type": "object",
+        "properties": {"results": {"type": "array", "items": item, "minItems": len(ids), "maxItems": len(ids)}},
+        "required": ["results"],
+    }
+
+
+def criterion_schema(criterion: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    JSON schema of one per-criterion answer: {"points", "comment", "flags"}.
+    """
+    allowed = CRITERION_FLAGS.get(criterion["criterion_id"], [])
+    flags: Dict[str, Any] = {"type": "array", "items": {"type": "string", "enum": allowed}}
+    if not allowed:
+        flags = {"type": "array", "maxItems": 0}
+    return {
+        "type": "object",
+        "properties": {
+            "points": {"type": "number", "minimum": 0, "maximum": float(criterion["max_points"])},
+            "comment": {"type": "string"},
+            "flags": flags,
+        },
+        "required": ["points", "comment", "flags"],
+    }
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+pp_results.py
+
+SQLite store (stdlib only) for every normalized grading result, so a cohort's history can be
+queried without opening per-student JSON files:
+
+- results:          one row per graded submission (student, assignment, rubric version, model,
+                    prompt hash, score, timings, full contract JSON)
+- criterion_scores: one row per (result, criterion), with the criterion's fingerprint (what
+                    04_grade.py --incremental compares to find stale criteria)
+- result_flags:     one row per (result, flag)
+
+"Latest" queries use the newest result per (assignment, student). 04_grade.py writes here with
+--results-db; this script queries and exports:
+
+  python pp_results.py --db grades.sqlite flagged missing_signoff_b
+  python pp_results.py --db grades.sqlite distribution --assignment pp01
+  python pp_results.py --db grades.sqlite export-csv gradebook.csv
+
+export-csv streams a Canvas gradebook import layout (Student, ID, SIS User ID, SIS Login ID,
+Section, one column per assignment, then a "Points Possible" row). The student key (submission
+file stem) goes in SIS Login ID; fill in Canvas IDs before importing if logins differ.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import itertools
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    graded_at REAL NOT NULL,
+    student TEXT NOT NULL,
+    assignment TEXT NOT NULL,
+    submission TEXT NOT NULL,
+    submission_sha256 TEXT,
+    rubric_sha256 TEXT,
+    model TEXT,
+    engine TEXT,
+    prompt_sha256 TEXT,
+    score_total REAL NOT NULL,
+    max_total REAL,
+    overall_comment TEXT,
+    elapsed_s REAL,
+    timings TEXT,
+    result_json TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS criterion_scores (
+    result_id INTEGER NOT NULL REFERENCES results(id) ON DELETE CASCADE,
+    criterion_id TEXT NOT NULL,
+    points REAL NOT NULL,
+    max_points REAL,
+    comment TEXT,
+    fingerprint TEXT
+);
+CREATE TABLE IF NOT EXISTS result_flags (
+    result_id INTEGER NOT NULL REFERENCES results(id) ON DELETE CASCADE,
+    flag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_student ON results(student, assignment);
+CREATE INDEX IF NOT EXISTS idx_results_assignment ON results(assignment, student, id);
+CREATE INDEX IF NOT EXISTS idx_criterion_scores ON criterion_scores(criterion_id, result_id);
+CREATE INDEX IF NOT EXISTS idx_criterion_result ON criterion_scores(result_id);
+CREATE INDEX IF NOT EXISTS idx_flags ON result_flags(flag, result_id);
+CREATE VIEW IF NOT EXISTS latest_results AS
+    SELECT r.* FROM results r
+    WHERE r.id = (SELECT MAX(id) FROM results WHERE assignment = r.assignment AND student = r.student);
+"""
+
+CANVAS_COLUMNS = ["Student", "ID", "SIS User ID", "SIS Login ID", "Section"]
+
+
+def timing_fields(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Stage times (*_s) and Ollama counters/durations from a 04_grade.py summary row.
+    """
+    return {k: v for k, v in row.items()
+            if isinstance(v, (int, float)) and not isinstance(v, bool)
+            and k.endswith(("_s", "_count", "_duration"))}
+
+
+class ResultStore:
+    """
+    Appends grading rows to the SQLite database at path (created on first use).
+    run_info supplies the per-run columns: assignment, model, engine, rubric_sha256, max_points.
+    Rows are committed in batches of commit_every (and on close) so large batches stay fast.
+    Not thread-safe: callers serialize write() (04_grade.py writes from the batch's result loop,
+    or under a lock in --serve mode).
+    """
+
+    def __init__(self, path: str, run_info: Optional[Dict[str, Any]] = None, commit_every: int = 50) -> None:
+        self.path = Path(path)
+        self.run_info = run_info or {}
+        self.commit_every = commit_every
+        self.written = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        columns = {r[1] for r in self.conn.execute("PRAGMA table_info(criterion_scores)")}
+        if "fingerprint" not in columns:  # databases created before fingerprints were stored
+            self.conn.execute("ALTER TABLE criterion_scores ADD COLUMN fingerprint TEXT")
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        """
+        Stores one successful row (status "ok" with its normalized "result"); other rows, and rows
+        marked "unchanged" (an incremental rerun that reused the stored result as is), are skipped.
+        row["criterion_fingerprints"] ({criterion_id: fingerprint}), if present, is stored per criterion.
+        """
+        result = row.get("result")
+        if row.get("status") != "ok" or result is None or row.get("unchanged"):
+            return
+        max_points: Dict[str, float] = self.run_info.get("max_points", {})
+        cur = self.conn.execute(
+            "INSERT INTO results (graded_at, student, assignment, submission, submission_sha256, rubric_sha256,"
+            " model, engine, prompt_sha256, score_total, max_total, overall_comment, elapsed_s, timings, result_json)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                time.time(), row["student"], self.run_info.get("assignment", ""), row["submission"],
+                row.get("submission_sha256"), self.run_info.get("rubric_sha256"),
+                row.get("graded_by") or self.run_info.get("model"), self.run_info.get("engine"),
+                row.get("prompt_sha256"),
+                float(result["score_total"]), sum(max_points.values()) if max_points else None,
+                result.get("overall_comment", ""), row.get("elapsed_s"),
+                json.dumps(timing_fields(row)), json.dumps(result),
+            ),
+        )
+        result_id = cur.lastrowid
+        fingerprints: Dict[str, str] = row.get("criterion_fingerprints") or {}
+        self.conn.executemany(
+            "INSERT INTO criterion_scores (result_id, criterion_id, points, max_points, comment, fingerprint)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [(result_id, c["criterion_id"], float(c["points"]), max_points.get(c["criterion_id"]), c.get("comment", ""),
+              fingerprints.get(c["criterion_id"]))
+             for c in result["criteria"]],
+        )
+        self.conn.executemany(
+            "INSERT INTO result_flags (result_id, flag) VALUES (?, ?)",
+            [(result_id, flag) for flag in result.get("flags", [])],
+        )
+        self.written += 1
+        if self.written % self.commit_every == 0:
+            self.conn.commit()
+
+    def latest_graded(self, assignment: str) -> Dict[str, Tuple[Dict[str, Any], Dict[str, str]]]:
+        """
+        student -> (latest result, {criterion_id: fingerprint}) for one assignment, in one query.
+        Criteria stored without a fingerprint are left out of the mapping (always stale).
+        """
+        self.conn.commit()
+        cursor = self.conn.execute(
+            "SELECT r.student, r.result_json, c.criterion_id, c.fingerprint"
+            " FROM latest_results r LEFT JOIN criterion_scores c ON c.result_id = r.id"
+            " WHERE r.assignment = ? ORDER BY r.student",
+            (assignment,),
+        )
+        latest: Dict[str, Tuple[Dict[str, Any], Dict[str, str]]] = {}
+        for student, rows in itertools.groupby(cursor, key=lambda r: r[0]):
+            rows = list(rows)
+            fingerprints = {cid: fp for _, _, cid, fp in rows if cid and fp}
+            latest[student] = (json.loads(rows[0][1]), fingerprints)
+        return latest
+
+
+def open_db(path: str) -> sqlite3.Connection:
+    """
+    Read-side connection; raises FileNotFoundError instead of creating an empty database.
+    """
+    if not Path(path).exists():
+        raise FileNotFoundError(f"Results database not found: {path}")
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def results_table(latest: bool) -> str:
+    return "latest_results" if latest else "results"
+
+
+def flagged(conn: sqlite3.Connection, flag: str, assignment: Optional[str] = None,
+            latest: bool = True) -> Iterator[sqlite3.Row]:
+    """
+    Submissions carrying flag, ordered by assignment and student.
+    """
+    sql = (f"SELECT r.student, r.assignment, r.score_total, r.submission, r.graded_at"
+           f" FROM {results_table(latest)} r JOIN result_flags f ON f.result_id = r.id WHERE f.flag = ?")
+    params: List[Any] = [flag]
+    if assignment:
+        sql += " AND r.assignment = ?"
+        params.append(assignment)
+    return conn.execute(sql + " ORDER BY r.assignment, r.student", params)
+
+
+def score_distribution(conn: sqlite3.Connection, assignment: Optional[str] = None,
+                       latest: bool = True) -> Iterator[sqlite3.Row]:
+    """
+    (criterion_id, points, n): one row per distinct score of each criterion.
+    """
+    where = "WHERE r.assignment = ?" if assignment else ""
+    sql = f"""
+        SELECT c.criterion_id, c.points, COUNT(*) AS n
+        FROM {results_table(latest)} r JOIN criterion_scores c ON c.result_id = r.id
+        {where}
+        GROUP BY c.criterion_id, c.points
+        ORDER BY c.criterion_id, c.points
+    """
+    return conn.execute(sql, [assignment] if assignment else [])
+
+
+def export_canvas_csv(conn: sqlite3.Connection, out: TextIO, assignments: Optional[List[str]] = None) -> int:
+    """
+    Streams the latest score per (student, assignment) as a Canvas gradebook CSV, one student
+    per line (rows are read in student order and pivoted one student at a time).
+    Returns the number of student rows written.
+    """
+    if not assignments:
+        assignments = [r[0] for r in conn.execute("SELECT DISTINCT assignment FROM results ORDER BY assignment")]
+    marks = ", ".join("?" for _ in assignments)
+    possible = dict(conn.execute(
+        f"SELECT assignment, MAX(max_total) FROM results WHERE assignment IN ({marks}) GROUP BY assignment",
+        assignments,
+    ).fetchall())
+
+    writer = csv.writer(out)
+    writer.writerow(CANVAS_COLUMNS + assignments)
+    writer.writerow(["Points Possible", "", "", "", ""] + [possible.get(a) or "" for a in assignments])
+    cursor = conn.execute(
+        f"SELECT student, assignment, score_total FROM latest_results WHERE assignment IN ({marks}) ORDER BY student",
+        assignments,
+    )
+    count = 0
+    for student, rows in itertools.groupby(cursor, key=lambda r: r[0]):
+        scores = {assignment: score for _, assignment, score in rows}
+        writer.writerow([student, "", "", student, ""] + [scores.get(a, "") for a in assignments])
+        count += 1
+    return count
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Query and export the grading results database")
+    ap.add_argument("--db", default="04_results.sqlite", help="Results database written by 04_grade.py --results-db")
+    ap.add_argument("--all-runs", action="store_true", help="Include superseded results, not only the latest")
+    sub = ap.add_subparsers(dest="command", required=True)
+    p_flag = sub.add_parser("flagged", help="Submissions carrying a flag")
+    p_flag.add_argument("flag")
+    p_flag.add_argument("--assignment")
+    p_dist = sub.add_parser("distribution", help="Score distribution per criterion")
+    p_dist.add_argument("--assignment")
+    p_csv = sub.add_parser("export-csv", help="Canvas gradebook CSV of the latest scores")
+    p_csv.add_argument("out", help="Output CSV path, or - for stdout")
+    p_csv.add_argument("--assignment", action="append", help="Assignment column(s) to export (default: all)")
+    args = ap.parse_args(argv)
+
+    try:
+        conn = open_db(args.db)
+    except FileNotFoundError as exc:
+        raise SystemExit(f"ERROR: {exc}")
+    latest = not args.all_runs
+
+    if args.command == "flagged":
+        rows = list(flagged(conn, args.flag, args.assignment, latest))
+        for r in rows:
+            print(f"{r['assignment']}\t{r['student']}\t{r['score_total']}\t{r['submission']}")
+        print(f"{len(rows)} submissions flagged {args.flag}")
+    elif args.command == "distribution":
+        rows = score_distribution(conn, args.assignment, latest)
+        for criterion_id, group in itertools.groupby(rows, key=lambda r: r["criterion_id"]):
+            counts = [(r["points"], r["n"]) for r in group]
+            total = sum(n for _, n in counts)
+            print(f"{criterion_id} (n={total}, mean {sum(p * n for p, n in counts) / total:.2f})")
+            for points, n in counts:
+                print(f"  {points:>5}: {n}")
+    else:
+        if args.out == "-":
+            count = export_canvas_csv(conn, sys.stdout, args.assignment)
+        else:
+            with open(args.out, "w", encoding="utf-8", newline="") as fh:
+                count = export_canvas_csv(conn, fh, args.assignment)
+            print(f"Wrote {count} students to {args.out}")
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+pp_rubric.py
+
+Loading 03_rubric.json for grading. 03_build_rubric_json.py stamps the source sha256 into the
+rubric; ensure_fresh_rubric() refuses a rubric whose source changed since, or rebuilds it through
+build_pipeline.py with --rebuild-rubric.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from pp_cache import sha256_text
+
+logger = logging.getLogger(__name__)
+
+
+def load_rubric(path: str) -> Dict[str, Any]:
+    p = Path(path)
+    if not p.exists():
+        raise FileNotFoundError(f"Rubric file not found: {path}. Run: python 03_build_rubric_json.py")
+    return json.loads(p.read_text(encoding="utf-8"))
+
+
+def find_rubric_source(rubric: Dict[str, Any], rubric_path: str, source_override: Optional[str]) -> Optional[Path]:
+    """
+    The source markdown the rubric was built from: --source if given, else the path stamped in
+    the rubric (relative to the rubric's folder). None if unknown or missing.
+    """
+    if source_override:
+        return Path(source_override)
+    if not rubric.get("source"):
+        return None
+    path = Path(rubric_path).parent / rubric["source"]
+    return path if path.exists() else None
+
+
+def rubric_is_stale(rubric: Dict[str, Any], source_path: Optional[Path]) -> bool:
+    """
+    True if the rubric's stamped source hash doesn't match the source file on disk.
+    Rubrics without a stamp, or whose source can't be found, are not checked.
+    Raises FileNotFoundError if an explicitly given source is missing.
+    """
+    if source_path is None or not rubric.get("source_sha256"):
+        return False
+    if not source_path.exists():
+        raise FileNotFoundError(f"Source file not found: {source_path}")
+    current = hashlib.sha256(source_path.read_bytes()).hexdigest()
+    return current != rubric["source_sha256"]
+
+
+class StaleRubricError(Exception):
+    """
+    The rubric was built from an older version of its source markdown.
+    """
+
+
+def ensure_fresh_rubric(args: argparse.Namespace, rubric: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Refuses to grade with a rubric built from an older source, or rebuilds it with
+    --rebuild-rubric. Returns the (possibly rebuilt) rubric.
+    Raises StaleRubricError (with a fix hint) for a stale rubric without --rebuild-rubric.
+    """
+    source_path = find_rubric_source(rubric, args.rubric, args.source)
+    if args.skip_rubric_check or not rubric_is_stale(rubric, source_path):
+        return rubric
+    if not args.rebuild_rubric:
+        raise StaleRubricError(
+            f"{args.rubric} is stale ({source_path} changed since it was built).\n"
+            f"Fix: python build_pipeline.py   (or pass --rebuild-rubric)"
+        )
+
+    import build_pipeline  # only needed when rebuilding
+
+    require_sum = float(rubric.get("expected_total_points", 10.0))
+    manifest = source_path.parent / build_pipeline.DEFAULT_MANIFEST
+    status = build_pipeline.build(str(source_path), None, args.rubric, require_sum, str(manifest))["rubric"]
+    logger.info("Rebuilt %s from %s (%s)", args.rubric, source_path, status)
+    return load_rubric(args.rubric)
+
+
+def rubric_sha256(rubric: Dict[str, Any]) -> str:
+    """
+    sha256 of the graded content of a rubric (the source path and source stamp are left out).
+    """
+    graded_rubric = {k: v for k, v in rubric.items() if k not in ("source", "source_sha256")}
+    return sha256_text(json.dumps(graded_rubric, sort_keys=True))
+
+
+class RubricUnavailableError(Exception):
+    """
+    The rubric file changed (or vanished) and could not be loaded again.
+    """
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+pp_service.py
+
+Resident grading service behind 04_grade.py --serve: the rubric, HTTP pool and cache stay
+loaded, POST /grade takes the submission markdown (X-Student header required) and answers with
+the contract JSON, GET /health reports the queue. At most `concurrency` grades run at once and
+`queue_size` more may wait; beyond that the service answers 503 + Retry-After.
+
+  python 04_grade.py --serve 8765 --warmup
+  curl -H "X-Student: bob_pp01" --data-binary @submissions/bob_pp01.md http://127.0.0.1:8765/grade
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from pp_cache import sha256_text
+from pp_rubric import RubricUnavailableError, StaleRubricError, ensure_fresh_rubric, load_rubric
+from pp_submission import criterion_fingerprints
+
+logger = logging.getLogger(__name__)
+
+
+class GradingService:
+    """
+    Resident grader behind --serve: grade_text(rubric, submission_md, stats) grades one submission
+    with the loaded client and cache and returns the contract result.
+    At most `concurrency` submissions grade at once and at most `queue_size` more wait for a slot;
+    beyond that grade() refuses immediately so callers can back off.
+    The rubric is reloaded when its file changes (one stat per request); on_reload gets each
+    reloaded rubric (to refresh run_info). A failed reload is retried by the next request.
+    """
+
+    def __init__(self, args: argparse.Namespace, rubric: Dict[str, Any], model: str,
+                 grade_text: Callable[[Dict[str, Any], str, Dict[str, Any]], Dict[str, Any]],
+                 on_row: Optional[Callable[[Dict[str, Any]], None]], concurrency: int, queue_size: int,
+                 on_reload: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+        self.args = args
+        self.rubric = rubric
+        self.rubric_mtime = Path(args.rubric).stat().st_mtime_ns
+        self.model = model
+        self.grade_text = grade_text
+        self.on_row = on_row
+        self.on_reload = on_reload
+        self.capacity = max(1, concurrency) + max(0, queue_size)
+        self.slots = threading.Semaphore(max(1, concurrency))
+        self.admitted = 0
+        self.graded = 0
+        self._lock = threading.Lock()
+        self._row_lock = threading.Lock()  # metrics file and results database are not thread-safe
+
+    def current_rubric(self) -> Dict[str, Any]:
+        """
+        The rubric to grade with, reloaded first if its file changed.
+        Raises StaleRubricError for a stale reload and RubricUnavailableError for an unreadable one.
+        """
+        try:
+            mtime = Path(self.args.rubric).stat().st_mtime_ns
+            with self._lock:
+                if mtime != self.rubric_mtime:
+                    fresh = ensure_fresh_rubric(self.args, load_rubric(self.args.rubric))
+                    if self.on_reload:
+                        with self._row_lock:
+                            self.on_reload(fresh)
+                    self.rubric, self.rubric_mtime = fresh, mtime
+                return self.rubric
+        except (OSError, ValueError) as exc:
+            raise RubricUnavailableError(f"Cannot reload {self.args.rubric}: {exc}") from exc
+
+    def grade(self, submission_md: str, student: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """
+        Returns (contract result, stats), or None if the queue is full.
+        Raises requests.RequestException on HTTP failures, ValueError on unusable model output and
+        StaleRubricError / RubricUnavailableError when a changed rubric can't be used.
+        """
+        with self._lock:
+            if self.admitted >= self.capacity:
+                return None
+            self.admitted += 1
+        try:
+            with self.slots:
+                stats: Dict[str, Any] = {}
+                started = time.perf_counter()
+                rubric = self.current_rubric()
+                normalized = self.grade_text(rubric, submission_md, stats)
+                stats["elapsed_s"] = time.perf_counter() - started
+        finally:
+            with self._lock:
+                self.admitted -= 1
+        with self._lock:
+            self.graded += 1
+        if self.on_row:
+            with self._row_lock:
+                self.on_row({"submission": f"<request:{student}>", "student": student, "status": "ok",
+                             "score_total": normalized["score_total"], "result": normalized,
+                             "submission_sha256": sha256_text(submission_md),
+                             "criterion_fingerprints": criterion_fingerprints(rubric, submission_md), **stats})
+        return normalized, stats
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"status": "ok", "model": self.model, "in_queue": self.admitted,
+                    "capacity": self.capacity, "graded": self.graded}
+
+
+# Student keys from --serve requests end up in result rows and the database; keep them plain
+STUDENT_NAME_RE = re.compile(r"[A-Za-z0-9_.-]+")
+
+
+def make_service_handler(service: GradingService) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            if urlsplit(self.path).path.rstrip("/") == "/health":
+                self._send_json(200, service.health())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self) -> None:
+            if urlsplit(self.path).path.rstrip("/") != "/grade":
+                self._send_json(404, {"error": "not found"})
+                return
+            request = self._read_request()
+            if request is None:
+                return
+            graded = self._grade(*request)
+            if graded is None:
+                return
+            normalized, stats = graded
+            self._send_json(200, normalized, {"X-Grade-Elapsed": f"{stats['elapsed_s']:.3f}",
+                                              "X-Graded-By": str(stats.get("graded_by", "fast-path"))})
+
+        def _read_request(self) -> Optional[Tuple[str, str]]:
+            """
+            (submission markdown, student) from the body and the X-Student header (or the
+            "student" of a JSON body). Answers 400 and returns None if either is unusable.
+            """
+            try:
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+            except ValueError:  # bad Content-Length, or a body that isn't UTF-8
+                self._send_json(400, {"error": "expected a UTF-8 body with a valid Content-Length"})
+                return None
+            student = self.headers.get("X-Student", "")
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                try:
+                    request = json.loads(raw)
+                    raw, student = request["submission"], request.get("student", student)
+                    if not isinstance(raw, str) or not isinstance(student, str):
+                        raise TypeError("submission and student must be strings")
+                except (ValueError, KeyError, TypeError):
+                    self._send_json(400, {"error": 'expected {"submission": "<markdown>", "student": "..."}'})
+                    return None
+            if not STUDENT_NAME_RE.fullmatch(student):
+                self._send_json(400, {"error": "X-Student header (or JSON \"student\") must match [A-Za-z0-9_.-]+"})
+                return None
+            return raw, student
+
+        def _grade(self, raw: str, student: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+            """
+            service.grade() with each failure answered by its status code (None after an error reply).
+            """
+            try:
+                graded = service.grade(raw, student)
+            except requests.RequestException as exc:
+                self._send_json(502, {"error": f"{type(exc).__name__}: {exc}"})
+                return None
+            except StaleRubricError as exc:
+                self._send_json(409, {"error": f"{type(exc).__name__}: {exc}"})
+                return None
+            except RubricUnavailableError as exc:
+                self._send_json(500, {"error": f"{type(exc).__name__}: {exc}"})
+                return None
+            except ValueError as exc:
+                self._send_json(422, {"error": f"{type(exc).__name__}: {exc}"})
+                return None
+            except Exception as exc:
+                logger.exception("Grading request failed")
+                self._send_json(500, {"error": f"{type(exc).__name__}: {exc}"})
+                return None
+            if graded is None:
+                self._send_json(503, {"error": "grading queue is full"}, {"Retry-After": "5"})
+            return graded
+
+    return Handler
+
+
+def parse_listen_address(value: str) -> Tuple[str, int]:
+    host, _, port = value.rpartition(":")
+    return host or "127.0.0.1", int(port)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+pp_similarity.py
+
+Near-duplicate index for submissions (stdlib only), used by 04_grade.py --dedup:
+
+- each submission is reduced to word 5-shingles of its answer text (template boilerplate removed
+  by the caller), summarized as a 64-value MinHash signature
+- locality-sensitive hashing (16 bands x 4 rows) proposes candidate pairs without comparing
+  every pair; candidates are kept if their estimated Jaccard similarity reaches the threshold
+- partners are near-duplicates whose :::meta participants name the same people; near-duplicates
+  with different or unknown participants are reported, never merged (an integrity signal)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+WORD_RE = re.compile(r"\w+")
+PARTICIPANT_RE = re.compile(r"^\s*-\s*name:\s*(.+?)\s*$", re.MULTILINE)
+# Names left as the template's placeholders identify nobody
+PLACEHOLDER_NAMES = frozenset({"student a", "student b", "student b or llm", "llm"})
+
+SHINGLE_WORDS = 5
+NUM_PERM = 64
+BANDS = 16
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def _permutations(n: int) -> List[Tuple[int, int]]:
+    # fixed seeds so signatures are comparable across runs
+    params = []
+    for i in range(n):
+        digest = hashlib.blake2b(f"minhash-{i}".encode("ascii"), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], "big") % (MERSENNE_PRIME - 1) + 1
+        b = int.from_bytes(digest[8:], "big") % MERSENNE_PRIME
+        params.append((a, b))
+    return params
+
+
+PERMUTATIONS = _permutations(NUM_PERM)
+
+
+def shingle_hashes(text: str, k: int = SHINGLE_WORDS) -> Set[int]:
+    """
+    32-bit hashes of the lowercase word k-shingles of text (one shingle for shorter texts).
+    """
+    words = WORD_RE.findall(text.lower())
+    if not words:
+        return set()
+    grams = [" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))]
+    return {int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "big") for g in grams}
+
+
+def minhash_signature(hashes: Set[int]) -> Tuple[int, ...]:
+    return tuple(min((a * h + b) % MERSENNE_PRIME & MAX_HASH for h in hashes) for a, b in PERMUTATIONS)
+
+
+def estimate_jaccard(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+def parse_participants(meta_body: str) -> FrozenSet[str]:
+    """
+    Normalized participant names from a :::meta body; template placeholders are ignored.
+    """
+    names = set()
+    for m in PARTICIPANT_RE.finditer(meta_body):
+        name = " ".join(WORD_RE.findall(m.group(1).lower()))
+        if name and name not in PLACEHOLDER_NAMES:
+            names.add(name)
+    return frozenset(names)
+
+
+@dataclass(frozen=True)
+class SimilarPair:
+    a: str
+    b: str
+    similarity: float
+    partners: bool  # same participants: safe to grade once
+
+
+class SimilarityIndex:
+    """
+    Collects submissions with add() and reports near-duplicate pairs and partner groups.
+    Submissions without any answer text are not indexed (blank templates all look alike).
+    """
+
+    def __init__(self, threshold: float = 0.9) -> None:
+        self.threshold = threshold
+        self.signatures: Dict[str, Tuple[int, ...]] = {}
+        self.participants: Dict[str, FrozenSet[str]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = defaultdict(list)
+
+    def add(self, key: str, text: str, participants: FrozenSet[str]) -> None:
+        hashes = shingle_hashes(text)
+        if not hashes:
+            return
+        signature = minhash_signature(hashes)
+        self.signatures[key] = signature
+        self.participants[key] = participants
+        rows = NUM_PERM // BANDS
+        for band in range(BANDS):
+            self._buckets[(band, signature[band * rows:(band + 1) * rows])].append(key)
+
+    def pairs(self) -> List[SimilarPair]:
+        """
+        Candidate pairs from shared LSH buckets whose estimated similarity reaches the threshold.
+        """
+        seen: Set[Tuple[str, str]] = set()
+        found = []
+        for keys in self._buckets.values():
+            for i, a in enumerate(keys):
+                for b in keys[i + 1:]:
+                    pair = (a, b) if a < b else (b, a)
+                    if pair in seen:
+                        continue
+                    seen.add(pair)
+                    similarity = estimate_jaccard(self.signatures[a], self.signatures[b])
+                    if similarity >= self.threshold:
+                        same_people = bool(self.participants[a]) and self.participants[a] == self.participants[b]
+                        found.append(SimilarPair(pair[0], pair[1], similarity, same_people))
+        return sorted(found, key=lambda p: (p.a, p.b))
+
+    def partner_groups(self, pairs: List[SimilarPair]) -> List[List[str]]:
+        """
+        Connected components of the partner pairs (sorted keys; singletons omitted).
+        """
+        parent: Dict[str, str] = {}
+
+        def find(x: str) -> str:
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for p in pairs:
+            if p.partners:
+                parent[find(p.a)] = find(p.b)
+        groups: Dict[str, List[str]] = defaultdict(list)
+        for key in parent:
+            groups[find(key)].append(key)
+        return sorted(sorted(g) for g in groups.values() if len(g) > 1)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+pp_submission.py
+
+Reading student submissions for 04_grade.py:
+
+- per-criterion answers, fingerprints (what --incremental compares) and template-only criteria
+  (what --fast-path scores 0 without the model)
+- deterministic prechecks for the structural flags (signoffs, exactly one checkbox)
+- --compact-prompt: template boilerplate and the :::private_note block removed, and
+  --adaptive-budget trimming of answers too long for the context
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Tuple
+
+from pp_blocks import parse_document
+from pp_cache import sha256_text
+from pp_contract import (
+    FLAG_MISSING_LLM_REFLECTION,
+    FLAG_MISSING_NEXT_TIME_CHOICE,
+    FLAG_MISSING_SIGNOFF_A,
+    FLAG_MISSING_SIGNOFF_B,
+    FLAG_MISSING_SNAG,
+    FLAG_MISSING_WORK_SUMMARY,
+)
+
+logger = logging.getLogger(__name__)
+
+CHECKBOX_RE = re.compile(r"^\s*-\s*\[(?P<x>[ xX])\]\s*(?P<label>.+?)\s*$", re.MULTILINE)
+
+# Template hints like "   # what exists now that didn't exist before"
+TEMPLATE_HINT_RE = re.compile(r"\s+#\s.*$")
+
+
+def load_submission(path: str) -> str:
+    p = Path(path)
+    if not p.exists():
+        raise FileNotFoundError(
+            f"Submission file not found: {path}\n"
+            f"Fix:\n"
+            f"  mkdir -p {p.parent}\n"
+            f"  cp submissions/_TEMPLATE_pp.md {path}\n"
+            f"  vi {path}\n"
+        )
+    return p.read_text(encoding="utf-8")
+
+
+def init_submission(dest: str, template: str) -> None:
+    src = Path(template)
+    if not src.exists():
+        raise FileNotFoundError(f"{template} not found; can't init a submission.")
+    d = Path(dest)
+    d.parent.mkdir(parents=True, exist_ok=True)
+    if d.exists():
+        raise FileExistsError(f"{dest} already exists. Refusing to overwrite.")
+    d.write_text(src.read_text(encoding="utf-8"), encoding="utf-8")
+    logger.info("Created starter submission: %s", dest)
+
+
+def extract_pair_type(submission_md: str) -> str:
+    """
+    Returns the raw pair_type value from the :::meta block ("" if absent).
+    """
+    doc = parse_document(submission_md)
+    meta = doc.first("meta")
+    if not meta:
+        return ""
+    mpt = re.search(r"pair_type:\s*(.+)", doc.body(meta))
+    return mpt.group(1).strip() if mpt else ""
+
+
+def normalize_template_line(line: str) -> str:
+    return TEMPLATE_HINT_RE.sub("", line).strip()
+
+
+def criterion_has_evidence(body: str, rubric_prompt: str) -> bool:
+    """
+    True if the answer body contains anything beyond the criterion's template text.
+    Only lines identical to a line of the rubric prompt (trailing "# hint" comments ignored)
+    don't count; any other non-blank line is evidence for the model to judge.
+    """
+    template_lines = {normalize_template_line(line) for line in rubric_prompt.splitlines()}
+    for line in body.splitlines():
+        text = normalize_template_line(line)
+        if text and text not in template_lines:
+            return True
+    return False
+
+
+def find_empty_criteria(rubric: Dict[str, Any], submission_md: str) -> List[str]:
+    """
+    Returns the ids of rubric criteria with no student evidence: the block is missing
+    or still contains only template text (answers written just below the block count).
+    """
+    blocks = criteria_answers(submission_md)
+    return [
+        c["criterion_id"]
+        for c in rubric["criteria"]
+        if not criterion_has_evidence(blocks.get(c["criterion_id"], ""), c["prompt"])
+    ]
+
+
+def criterion_fingerprints(rubric: Dict[str, Any], submission_md: str) -> Dict[str, str]:
+    """
+    criterion_id -> sha256 of everything that criterion's grade depends on: its id, max_points
+    and rubric prompt, and the student's answer for it. roles also depends on the :::meta
+    pair_type (its reflections are judged against it). A changed fingerprint means stale points.
+    """
+    answers = criteria_answers(submission_md)
+    pair_type = extract_pair_type(submission_md)
+    fingerprints = {}
+    for c in rubric["criteria"]:
+        cid = c["criterion_id"]
+        parts = [cid, float(c["max_points"]), c["prompt"], answers.get(cid, "")]
+        if cid == "roles" and pair_type:  # left out when absent so older fingerprints still match
+            parts.append(pair_type)
+        fingerprints[cid] = sha256_text(json.dumps(parts))
+    return fingerprints
+
+
+def load_template_lines(path: str) -> FrozenSet[str]:
+    """
+    Normalized lines of the blank submission template; these carry no student evidence.
+    Raises FileNotFoundError if the template is missing.
+    """
+    p = Path(path)
+    if not p.exists():
+        raise FileNotFoundError(f"Template not found: {path} (needed by --compact-prompt; see --template)")
+    lines = (normalize_template_line(line) for line in p.read_text(encoding="utf-8").splitlines())
+    return frozenset(line for line in lines if line)
+
+
+def strip_template_lines(text: str, template_lines: FrozenSet[str]) -> str:
+    """
+    Drops blank lines, lines identical to the template and trailing "# hint" comments.
+    """
+    dropped = template_lines | {""}
+    kept = []
+    for line in text.splitlines():
+        if normalize_template_line(line) not in dropped:
+            kept.append(TEMPLATE_HINT_RE.sub("", line).rstrip())
+    return "\n".join(kept)
+
+
+def compact_submission(submission_md: str, template_lines: FrozenSet[str]) -> str:
+    """
+    Gradeable content only: pair_type, each criterion body and the signoff, with template
+    boilerplate removed. The comment header, :::meta YAML, headings, rules and
+    :::private_note are dropped. Sections left empty are marked "(blank)".
+    """
+    doc = parse_document(submission_md)
+    answers = criteria_answers(submission_md)
+    sections = []
+    pair_type = extract_pair_type(submission_md)
+    if pair_type:
+        sections.append(f"pair_type: {pair_type}")
+    for block in doc.blocks:
+        if block.kind == "criterion":
+            label = f'[criterion {block.attr("id")}]'
+            text = answers.get(block.attr("id").strip(), doc.body(block))
+        elif block.kind == "signoff":
+            label = "[signoff]"
+            text = doc.body(block)
+        else:
+            continue
+        body = strip_template_lines(text, template_lines)
+        sections.append(f"{label}\n{body or '(blank)'}")
+    return "\n\n".join(sections)
+
+
+TRIMMED_MARKER = "\n[... answer trimmed to fit the model context ...]\n"
+# Result flag for every criterion whose answer was cut to fit --max-ctx (the grade saw part of it)
+TRIMMED_FLAG_PREFIX = "trimmed_answer:"
+
+
+def trim_text(text: str, limit: int) -> str:
+    """
+    The first limit chars of text (cut at a line break when possible) plus TRIMMED_MARKER.
+    """
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit)
+    return text[:cut if cut > limit // 2 else limit].rstrip() + TRIMMED_MARKER
+
+
+def trim_criterion_bodies(submission_md: str, excess_chars: int) -> Tuple[str, List[str]]:
+    """
+    Shortens the longest criterion bodies until about excess_chars are removed, capping every
+    body at one common length so short answers are never touched. Returns the trimmed markdown
+    and the ids of the criteria that were cut.
+    """
+    doc = parse_document(submission_md)
+    blocks = [b for b in doc.of_kind("criterion") if b.attr("id").strip()]
+    lengths = sorted((b.body_end - b.body_start for b in blocks), reverse=True)
+    if excess_chars <= 0 or not lengths:
+        return submission_md, []
+    # smallest common cap that removes enough; the marker adds back a little per trimmed body
+    cap = lengths[0]
+    while cap > 0 and sum(max(0, n - cap) - len(TRIMMED_MARKER) for n in lengths if n > cap) < excess_chars:
+        cap -= max(1, cap // 20)
+    cap = max(cap, 0)
+
+    pieces = []
+    trimmed = []
+    pos = 0
+    for block in blocks:
+        body = doc.body(block)
+        if len(body) <= cap:
+            continue
+        pieces.append(submission_md[pos:block.body_start])
+        pieces.append(trim_text(body, cap))
+        pos = block.body_end
+        trimmed.append(block.attr("id").strip())
+    pieces.append(submission_md[pos:])
+    return "".join(pieces), trimmed
+
+
+def criteria_answers(submission_md: str) -> Dict[str, str]:
+    """
+    Returns mapping criterion_id -> the student's answer: the block body plus any answer text
+    written just below the block's closing ":::" (up to the next heading or horizontal rule).
+    Every engine, the fast path and compaction read answers through this one function.
+    """
+    doc = parse_document(submission_md)
+    answers: Dict[str, str] = {}
+    for i, block in enumerate(doc.blocks):
+        cid = block.attr("id").strip()
+        if block.kind != "criterion" or not cid:
+            continue
+        next_start = doc.blocks[i + 1].start if i + 1 < len(doc.blocks) else len(submission_md)
+        text = doc.body(block) + trailing_answer_text(submission_md[block.end:next_start])
+        answers[cid] = text.strip()
+    return answers
+
+
+def trailing_answer_text(gap: str) -> str:
+    """
+    Students sometimes answer just below a criterion's closing ":::". Returns the text
+    between a block and the next heading or horizontal rule so compaction keeps it.
+    """
+    kept = []
+    for line in gap.splitlines()[1:]:  # first piece is the rest of the closing ":::" line
+        if line.startswith("#") or line.strip() == "---":
+            break
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def field_left_blank(answer: str, label: str) -> bool:
+    """
+    True if the answer still has a blank "<label>...:" template line and no filled-in one,
+    so an answer written below the block is not flagged for the untouched template line.
+    """
+    blank = re.search(rf"{label}.*:\s*$", answer, re.MULTILINE)
+    filled = re.search(rf"{label}.*:[ \t]*\S", answer, re.MULTILINE)
+    return bool(blank) and not filled
+
+
+def precheck_flags(submission_md: str) -> List[str]:
+    """
+    Deterministic checks for the most common "this should never be subjective" stuff.
+    The block structure comes from the shared (memoized) parse; only small bodies are rescanned.
+    """
+    flags: List[str] = []
+    doc = parse_document(submission_md)
+
+    # signoff checks
+    signoff = doc.first("signoff")
+    if signoff:
+        body = doc.body(signoff)
+        # crude but effective: look for non-empty after colon
+        a = re.search(r"Student A initials:\s*(.+)", body)
+        b = re.search(r"Student B initials.*:\s*(.+)", body)
+        if not a or not a.group(1).strip():
+            flags.append(FLAG_MISSING_SIGNOFF_A)
+        if not b or not b.group(1).strip():
+            flags.append(FLAG_MISSING_SIGNOFF_B)
+    else:
+        flags.append(FLAG_MISSING_SIGNOFF_A)
+        flags.append(FLAG_MISSING_SIGNOFF_B)
+
+    # checkbox selection count in next_time block (anywhere in file is ok, but ideally in that block)
+    checks = CHECKBOX_RE.findall(submission_md)
+    selected = sum(1 for x, _lbl in checks if x.strip().lower() == "x")
+    if selected != 1:
+        flags.append(FLAG_MISSING_NEXT_TIME_CHOICE)
+
+    # basic evidence checks read the same answers as the fast path and compaction
+    blocks = criteria_answers(submission_md)
+
+    ws = blocks.get("work_summary", "")
+    if field_left_blank(ws, "Goal") or field_left_blank(ws, "Result"):
+        flags.append(FLAG_MISSING_WORK_SUMMARY)
+
+    snag = blocks.get("snag", "")
+    if field_left_blank(snag, "Snag") or field_left_blank(snag, "Response"):
+        flags.append(FLAG_MISSING_SNAG)
+
+    # pair_type: if human_llm, require reflection lines in roles section
+    pair_type = extract_pair_type(submission_md)
+
+    if "human_llm" in pair_type:
+        roles = blocks.get("roles", "")
+        # require Kept/Rejected/Why
+        missing = []
+        for key in ("Kept", "Rejected", "Why"):
+            if not re.search(rf"^{key}.*:\s*\S+", roles, re.MULTILINE):
+                missing.append(key)
+        if missing:
+            flags.append(FLAG_MISSING_LLM_REFLECTION)
+
+    # de-dupe while preserving order
+    seen = set()
+    out_flags = []
+    for f in flags:
+        if f not in seen:
+            seen.add(f)
+            out_flags.append(f)
+    return out_flags
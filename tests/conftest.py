@@ -0,0 +1,24 @@
+"""
+Shared fixtures: the repo root on sys.path and the numbered grader script loaded as a module.
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from build_pipeline import load_script  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def grader() -> ModuleType:
+    """
+    04_grade.py (loaded from its file; the leading digit keeps it from being imported by name).
+    """
+    return load_script(ROOT / "04_grade.py")
@@ -0,0 +1,50 @@
+"""
+Test doubles for the Ollama client.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, List, Optional
+
+RUBRIC = {
+    "expected_total_points": 4.0,
+    "criteria": [
+        {"criterion_id": "work_summary", "max_points": 2.0, "prompt": "- Goal:\n- Result:"},
+        {"criterion_id": "snag", "max_points": 2.0, "prompt": "- Snag:\n- Response:"},
+    ],
+}
+
+SUBMISSION = """:::criterion{id="work_summary" points="2"}
+- Goal: parse blocks
+- Result: parser works
+:::
+
+:::criterion{id="snag" points="2"}
+- Snag: off-by-one
+- Response: added a test
+:::
+
+:::signoff
+Student A initials: AL
+Student B initials: AT
+:::
+"""
+
+
+class ScriptedClient:
+    """
+    Answers generate() calls with the given outputs in order and counts the calls.
+    """
+
+    def __init__(self, outputs: List[str]) -> None:
+        self.outputs = list(outputs)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str, num_predict: int, temperature: float,
+                 stats: Optional[Dict[str, Any]] = None, fmt: Optional[Any] = None,
+                 num_ctx: Optional[int] = None, model: Optional[str] = None) -> str:
+        with self._lock:
+            self.calls += 1
+            return self.outputs.pop(0)
@@ -0,0 +1,27 @@
+from pp_submission import criteria_answers, strip_template_lines
+
+
+SUBMISSION = """:::criterion{id="snag" points="2"}
+- Snag:   # what went wrong
+:::
+The build failed because of a typo.
+
+## Next
+:::criterion{id="next_time" points="2"}
+- [x] Swap roles
+:::
+"""
+
+
+def test_answer_includes_text_below_the_closing_fence():
+    expected = "- Snag:   # what went wrong\nThe build failed because of a typo."
+    assert criteria_answers(SUBMISSION)["snag"] == expected
+
+
+def test_answer_stops_at_the_next_heading():
+    assert "Next" not in criteria_answers(SUBMISSION)["snag"]
+
+
+def test_strip_template_lines_drops_template_and_blank_lines():
+    template = frozenset({"- Snag:"})
+    assert strip_template_lines("- Snag:   # hint\n\nIt broke.  # note", template) == "It broke."
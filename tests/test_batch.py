@@ -0,0 +1,50 @@
+import json
+
+from fakes import RUBRIC, SUBMISSION
+
+VALID = json.dumps({
+    "score_total": 3,
+    "criteria": [{"criterion_id": "work_summary", "points": 2, "comment": "ok"},
+                 {"criterion_id": "snag", "points": 1, "comment": "ok"}],
+    "overall_comment": "fine",
+    "flags": [],
+})
+
+
+def write_submissions(folder, submissions):
+    folder.mkdir()
+    for name, text in submissions.items():
+        (folder / f"{name}.md").write_text(text, encoding="utf-8")
+    return folder
+
+
+class GarbleClient:
+    """
+    Answers like the model: valid JSON, or chatter for a prompt containing "GARBLED".
+    """
+
+    def generate(self, prompt, *args, **kwargs):
+        return "no JSON here" if "GARBLED" in prompt else VALID
+
+
+def grade_folder(grader, tmp_path, submissions, concurrency=2):
+    folder = write_submissions(tmp_path / "subs", submissions)
+    config = grader.GradeConfig(host="http://stub", model="m")
+    return grader.grade_batch(RUBRIC, grader.find_submissions(str(folder), "*.md"), config, tmp_path / "out",
+                              concurrency, client=GarbleClient())
+
+
+def test_find_submissions_skips_templates(grader, tmp_path):
+    folder = write_submissions(tmp_path / "subs", {"_TEMPLATE_pp": "", "bob": "", "ada": ""})
+    assert [p.stem for p in grader.find_submissions(str(folder), "*.md")] == ["ada", "bob"]
+
+
+def test_batch_writes_feedback_for_every_submission(grader, tmp_path):
+    rows = grade_folder(grader, tmp_path, {"bob": SUBMISSION, "ada": SUBMISSION})
+    written = [(tmp_path / "out" / f"{r['student']}.json").exists() for r in rows]
+    assert ([r["student"] for r in rows], written) == (["ada", "bob"], [True, True])
+
+
+def test_failed_submission_does_not_stop_the_batch(grader, tmp_path):
+    rows = grade_folder(grader, tmp_path, {"ada": SUBMISSION + "GARBLED\n", "bob": SUBMISSION})
+    assert [r["status"] for r in rows] == ["failed", "ok"]
@@ -0,0 +1,19 @@
+import pytest
+
+import bench_grade
+from conftest import ROOT
+
+
+def test_one_tiny_run_grades_every_submission(tmp_path):
+    args = bench_grade.build_arg_parser().parse_args([
+        "--n", "3", "--latency-ms", "0", "--jitter-ms", "0",
+        "--template", str(ROOT / "submissions/_TEMPLATE_pp.md"), "--rubric", str(ROOT / "03_rubric.json"),
+    ])
+    summary = bench_grade.run_benchmark(args, tmp_path)
+    assert (summary["submissions"], summary["parse_failures"], summary["other_failures"]) == (3, 0, 0)
+
+
+def test_micro_batch_with_the_prefix_layout_is_rejected(tmp_path):
+    args = bench_grade.build_arg_parser().parse_args(["--micro-batch", "4", "--prompt-layout", "prefix"])
+    with pytest.raises(SystemExit, match="--prompt-layout prefix"):
+        bench_grade.run_benchmark(args, tmp_path)
@@ -0,0 +1,68 @@
+import os
+from dataclasses import replace
+
+import pytest
+
+from fakes import RUBRIC
+from pp_cache import GradeCache
+
+RESULT = {"score_total": 4.0, "criteria": [], "overall_comment": "ok", "flags": []}
+
+
+@pytest.fixture
+def base_config(grader):
+    return grader.GradeConfig(host="http://stub", model="m")
+
+
+def key(config, prompt="prompt", rubric=RUBRIC):
+    return GradeCache.make_key(rubric, config, prompt)
+
+
+def test_model_changes_the_key(base_config):
+    assert key(base_config) != key(replace(base_config, model="other"))
+
+
+def test_prompt_changes_the_key(base_config):
+    assert key(base_config) != key(base_config, prompt="other prompt")
+
+
+def test_options_change_the_key(base_config):
+    assert key(base_config) != key(replace(base_config, temperature=0.5))
+
+
+def test_rubric_changes_the_key(base_config):
+    edited = dict(RUBRIC, criteria=RUBRIC["criteria"][:1])
+    assert key(base_config) != key(base_config, rubric=edited)
+
+
+def test_source_stamp_does_not_change_the_key(base_config):
+    stamped = dict(RUBRIC, source="01_source.md", source_sha256="abc")
+    assert key(base_config) == key(base_config, rubric=stamped)
+
+
+def test_eviction_keeps_the_cache_under_its_size_limit(tmp_path):
+    cache = GradeCache(str(tmp_path), max_age_s=3600, max_bytes=10**9)
+    for i in range(5):
+        cache.put(f"{i:02d}" + "0" * 62, "raw", RESULT)
+    cache.max_bytes = 2 * min(p.stat().st_size for p in tmp_path.glob("*/*.json"))
+    cache.evict()
+    assert sum(p.stat().st_size for p in tmp_path.glob("*/*.json")) <= cache.max_bytes
+
+
+def test_eviction_drops_the_least_recently_used_entries(tmp_path):
+    cache = GradeCache(str(tmp_path), max_age_s=3600, max_bytes=10**9)
+    old, new = "aa" + "0" * 62, "bb" + "0" * 62
+    cache.put(old, "raw", RESULT)
+    cache.put(new, "raw", RESULT)
+    os.utime(cache._entry_path(old), (1, 1))
+    os.utime(cache._entry_path(new), (2, 2))
+    cache.max_age_s = float("inf")
+    cache.max_bytes = cache._entry_path(new).stat().st_size
+    cache.evict()
+    assert (cache._entry_path(old).exists(), cache._entry_path(new).exists()) == (False, True)
+
+
+def test_refresh_bypasses_cached_entries(tmp_path):
+    GradeCache(str(tmp_path), max_age_s=3600, max_bytes=10**9).put("cc" + "0" * 62, "raw", RESULT)
+    refreshing = GradeCache(str(tmp_path), max_age_s=3600, max_bytes=10**9, refresh=True)
+    assert refreshing.get("cc" + "0" * 62) is None
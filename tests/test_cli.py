@@ -0,0 +1,19 @@
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def run_grader(*args):
+    return subprocess.run([sys.executable, str(ROOT / "04_grade.py"), "--submissions-dir", "submissions", *args],
+                          cwd=ROOT, capture_output=True, text=True, timeout=60)
+
+
+def test_micro_batch_rejects_the_per_criterion_engine():
+    proc = run_grader("--micro-batch", "4", "--adaptive-budget", "--engine", "per-criterion")
+    assert "--micro-batch needs --engine whole" in proc.stderr
+
+
+def test_micro_batch_rejects_the_prefix_layout():
+    proc = run_grader("--micro-batch", "4", "--adaptive-budget", "--prompt-layout", "prefix")
+    assert "--prompt-layout prefix" in proc.stderr
@@ -0,0 +1,25 @@
+from pp_submission import compact_submission, trim_criterion_bodies
+
+
+SUBMISSION = """:::criterion{id="snag" points="2"}
+- Snag: the build failed because of a typo in the config loader
+:::
+:::private_note
+- Note: my partner did most of this one
+:::
+
+:::signoff
+Student A initials: AL
+:::
+"""
+
+
+def test_compact_prompt_drops_the_private_note():
+    compact = compact_submission(SUBMISSION, frozenset())
+    assert "partner did most" not in compact
+
+
+def test_trimmed_then_compacted_prompt_drops_the_private_note():
+    trimmed, cut = trim_criterion_bodies(SUBMISSION, 20)
+    compact = compact_submission(trimmed, frozenset())
+    assert (cut, "partner did most" in compact) == (["snag"], False)
@@ -0,0 +1,25 @@
+from fakes import SUBMISSION
+
+ANSWER = ("\n- Notes: we built the parser together and tested it on the sample file, then fixed the "
+          "missing closing fence by checking every block boundary before rendering.\n:::")
+
+
+def write_report(tmp_path, name, *participants):
+    meta = ":::meta\nparticipants:\n" + "".join(f"  - name: {p}\n" for p in participants) + ":::\n\n"
+    path = tmp_path / f"{name}.md"
+    path.write_text(meta + SUBMISSION.replace("\n:::", ANSWER, 1), encoding="utf-8")
+    return path
+
+
+def test_partners_listing_the_same_people_are_grouped(grader, tmp_path):
+    a = write_report(tmp_path, "ann", "Ada Lovelace", "Alan Turing")
+    b = write_report(tmp_path, "alan", "Alan Turing", "Ada Lovelace")
+    groups, _pairs = grader.find_partner_groups([a, b], frozenset(), 0.9)
+    assert groups == {str(b): [a]}
+
+
+def test_different_named_participants_are_not_grouped(grader, tmp_path):
+    a = write_report(tmp_path, "ann", "Ada Lovelace", "Alan Turing")
+    b = write_report(tmp_path, "grace", "Ada Lovelace", "Grace Hopper")
+    groups, pairs = grader.find_partner_groups([a, b], frozenset(), 0.9)
+    assert (groups, [p.partners for p in pairs]) == ({}, [False])
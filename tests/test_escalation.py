@@ -0,0 +1,18 @@
+from fakes import RUBRIC
+
+
+def config(grader):
+    return grader.GradeConfig(host="http://stub", model="m")
+
+
+def test_known_ids_only_exempt_unknown_criterion_flags(grader):
+    result = {"score_total": 4.0, "flags": ["unknown_criterion_id:snag", "missing_criterion:snag"]}
+    reasons = grader.escalation_reasons(result, [], RUBRIC, config(grader), frozenset({"snag"}))
+    assert reasons == ["repair:missing_criterion:snag"]
+
+
+def test_boundary_uses_the_final_score_and_full_total(grader):
+    sub_rubric = dict(RUBRIC, criteria=RUBRIC["criteria"][1:])
+    result = {"score_total": 1.0, "flags": []}
+    reasons = grader.escalation_reasons(result, [], sub_rubric, config(grader), settled_points=2.5, total_points=4.0)
+    assert reasons == ["boundary:3.6"]
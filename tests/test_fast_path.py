@@ -0,0 +1,46 @@
+import json
+
+from fakes import RUBRIC, SUBMISSION, ScriptedClient
+from pp_submission import find_empty_criteria, precheck_flags
+
+BLANK = """:::criterion{id="work_summary" points="2"}
+- Goal:
+- Result:
+:::
+
+:::criterion{id="snag" points="2"}
+- Snag:
+- Response:
+:::
+"""
+
+
+def config(grader):
+    return grader.GradeConfig(host="http://stub", model="m", fast_path=True)
+
+
+def test_blank_template_is_scored_without_a_call(grader):
+    client = ScriptedClient([])
+    empty = find_empty_criteria(RUBRIC, BLANK)
+    result = grader.grade_with_fast_path(RUBRIC, BLANK, config(grader), empty, None, {}, client=client)
+    assert (empty, result["score_total"], client.calls) == (["work_summary", "snag"], 0, 0)
+
+
+def test_filled_submission_goes_to_the_model(grader):
+    answer = json.dumps({"score_total": 4, "criteria": [
+        {"criterion_id": "work_summary", "points": 2, "comment": "ok"},
+        {"criterion_id": "snag", "points": 2, "comment": "ok"}], "overall_comment": "good", "flags": []})
+    client = ScriptedClient([answer])
+    empty = find_empty_criteria(RUBRIC, SUBMISSION)
+    result = grader.grade_with_fast_path(RUBRIC, SUBMISSION, config(grader), empty, None, {}, client=client)
+    assert (empty, result["score_total"], client.calls) == ([], 4.0, 1)
+
+
+def test_label_only_line_counts_as_evidence():
+    typed = BLANK.replace("- Snag:\n", "- Snag:\nBlocked:\n")
+    assert find_empty_criteria(RUBRIC, typed) == ["work_summary"]
+
+
+def test_precheck_reads_an_answer_written_below_the_block():
+    below = BLANK.replace("- Response:\n:::\n", "- Response:\n:::\nSnag: flaky test\nResponse: pinned the seed\n")
+    assert "missing_snag" not in precheck_flags(below)
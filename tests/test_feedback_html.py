@@ -0,0 +1,40 @@
+import pytest
+
+from build_pipeline import load_script
+from conftest import ROOT
+from fakes import RUBRIC
+
+RESULT = {"score_total": 3.0, "overall_comment": "Good <b>work</b>", "flags": ["missing_snag"], "criteria": [
+    {"criterion_id": "work_summary", "points": 2.0, "comment": "clear | complete"},
+    {"criterion_id": "snag", "points": 1.0, "comment": "thin"}]}
+
+
+@pytest.fixture(scope="module")
+def stage():
+    return load_script(ROOT / "05_build_feedback_html.py")
+
+
+def test_model_text_is_escaped(stage):
+    md = stage.feedback_markdown("ann", RESULT, RUBRIC)
+    assert ("<b>" in md, "clear \\| complete" in md) == (False, True)
+
+
+def test_page_names_stay_inside_the_output_directory(stage, tmp_path):
+    stage.render_all(iter([("../evil", RESULT)]), RUBRIC, tmp_path / "out")
+    assert sorted(p.name for p in (tmp_path / "out").iterdir()) == ["evil.html", "index.html"]
+
+
+def test_a_student_named_index_keeps_the_index_page(stage, tmp_path):
+    stage.render_all(iter([("index", RESULT)]), RUBRIC, tmp_path)
+    assert "pp-feedback-index" in (tmp_path / "index.html").read_text(encoding="utf-8")
+
+
+def test_index_links_every_page(stage, tmp_path):
+    count = stage.render_all(iter([("ann", RESULT), ("bob", RESULT)]), RUBRIC, tmp_path)
+    index = (tmp_path / "index.html").read_text(encoding="utf-8")
+    assert (count, 'href="ann.html"' in index, 'href="bob.html"' in index) == (2, True, True)
+
+
+def test_results_db_without_assignment_is_rejected(stage, tmp_path):
+    with pytest.raises(SystemExit, match="--assignment"):
+        stage.main(["--rubric", str(ROOT / "03_rubric.json"), "--results-db", str(tmp_path / "r.sqlite")])
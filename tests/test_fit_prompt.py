@@ -0,0 +1,35 @@
+import pytest
+
+
+class FixedBudget:
+    """
+    Stands in for TokenBudget: every prompt may be at most limit chars.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def max_prompt_chars(self, model, num_predict):
+        return self.limit
+
+
+def config(grader, limit):
+    cfg = grader.GradeConfig(host="http://stub", model="m")
+    cfg.budget = FixedBudget(limit)
+    return cfg
+
+
+def test_prompt_is_shrunk_again_until_it_fits(grader):
+    def shrink(excess):  # compaction only removes half of what was trimmed from the markdown
+        return "x" * (1000 - excess // 2), ["snag"]
+
+    prompt, _ = grader.fit_prompt("x" * 1000, config(grader, 600), 100, shrink, {})
+    assert len(prompt) <= 600
+
+
+def test_prompt_that_cannot_fit_is_rejected(grader):
+    def shrink(excess):
+        return "x" * max(700, 1000 - excess), ["snag"]
+
+    with pytest.raises(ValueError):
+        grader.fit_prompt("x" * 1000, config(grader, 600), 100, shrink, {})
@@ -0,0 +1,41 @@
+import json
+
+from fakes import RUBRIC, SUBMISSION, ScriptedClient
+from pp_submission import criterion_fingerprints
+
+PREVIOUS = {
+    "score_total": 3.0,
+    "criteria": [{"criterion_id": "work_summary", "points": 2.0, "comment": "ok"},
+                 {"criterion_id": "snag", "points": 1.0, "comment": "thin"}],
+    "overall_comment": "fine",
+    "flags": [],
+}
+
+
+def config(grader):
+    return grader.GradeConfig(host="http://stub", model="m", response_format="none")
+
+
+def test_nothing_stale_returns_previous_without_a_call(grader):
+    client = ScriptedClient([])
+    fingerprints = criterion_fingerprints(RUBRIC, SUBMISSION)
+    result = grader.regrade_stale_criteria(RUBRIC, SUBMISSION, PREVIOUS, fingerprints, config(grader), client=client)
+    assert (result is PREVIOUS, client.calls) == (True, 0)
+
+
+def test_signoff_flags_come_from_the_regrade_answer(grader):
+    answer = json.dumps({"score_total": 2, "criteria": [{"criterion_id": "snag", "points": 2, "comment": "good"}],
+                         "overall_comment": "better", "flags": ["missing_signoff_a"]})
+    fingerprints = criterion_fingerprints(RUBRIC, SUBMISSION)
+    edited = SUBMISSION.replace("added a test", "added two tests")
+    result = grader.regrade_stale_criteria(RUBRIC, edited, PREVIOUS, fingerprints, config(grader),
+                                           client=ScriptedClient([answer]))
+    assert result["flags"] == ["missing_signoff_a"]
+
+
+def test_roles_fingerprint_covers_pair_type():
+    rubric = {"criteria": [{"criterion_id": "roles", "max_points": 2.0, "prompt": "- Driver:"}]}
+    body = ':::criterion{id="roles" points="2"}\n- Driver: AL\n:::\n'
+    human = criterion_fingerprints(rubric, ":::meta\npair_type: human_human\n:::\n\n" + body)
+    llm = criterion_fingerprints(rubric, ":::meta\npair_type: human_llm\n:::\n\n" + body)
+    assert human != llm
@@ -0,0 +1,53 @@
+from pp_cache import BatchJournal, sha256_text
+
+
+KEY = {"rubric_sha256": "r1", "model": "small", "config_sha256": "c1"}
+
+
+def finish(tmp_path, run_key):
+    submission = tmp_path / "ada.md"
+    submission.write_text("answer", encoding="utf-8")
+    out_json = tmp_path / "ada.json"
+    out_json.write_text("{}", encoding="utf-8")
+    journal = BatchJournal(tmp_path / "_journal.jsonl", run_key=run_key)
+    journal.record(submission, "done", sha256=sha256_text("answer"), score_total=7.0, flags=[],
+                   out_json=str(out_json))
+    journal.close()
+    return submission
+
+
+def resumed_row(tmp_path, run_key):
+    journal = BatchJournal(tmp_path / "_journal.jsonl", resume=True, run_key=run_key)
+    try:
+        return journal.finished_row(tmp_path / "ada.md")
+    finally:
+        journal.close()
+
+
+def test_resume_reuses_a_grade_from_the_same_run_key(tmp_path):
+    finish(tmp_path, KEY)
+    assert resumed_row(tmp_path, KEY)["score_total"] == 7.0
+
+
+def test_resume_regrades_after_a_model_change(tmp_path):
+    finish(tmp_path, KEY)
+    assert resumed_row(tmp_path, dict(KEY, model="large")) is None
+
+
+def test_resume_regrades_after_a_rubric_change(tmp_path):
+    finish(tmp_path, KEY)
+    assert resumed_row(tmp_path, dict(KEY, rubric_sha256="r2")) is None
+
+
+def test_run_key_changes_with_grading_options(grader):
+    rubric = {"criteria": []}
+    base = grader.GradeConfig(host="h", model="m")
+    changed = grader.GradeConfig(host="h", model="m", engine="per-criterion")
+    assert grader.grading_run_key(rubric, base) != grader.grading_run_key(rubric, changed)
+
+
+def test_run_key_ignores_transport_settings(grader):
+    rubric = {"criteria": []}
+    base = grader.GradeConfig(host="h", model="m")
+    moved = grader.GradeConfig(host="other", model="m", timeout_s=5, stream=True)
+    assert grader.grading_run_key(rubric, base) == grader.grading_run_key(rubric, moved)
@@ -0,0 +1,40 @@
+import json
+
+from pp_metrics import MetricsWriter, metrics_record, render_metrics_summary
+
+ROW = {
+    "submission": "a.md", "student": "a", "status": "ok", "score_total": 3.0, "elapsed_s": 1.5,
+    "precheck_flags_s": 0.01, "http_s": 1.2, "eval_count": 40, "eval_duration": 2e9,
+    "prompt_chars": 900, "flags": ["missing_snag"],
+}
+RUN_INFO = {"model": "m", "load_rubric_s": 0.02}
+
+
+def test_writer_appends_one_json_line_per_row(tmp_path):
+    writer = MetricsWriter(str(tmp_path / "metrics.jsonl"), RUN_INFO)
+    writer.write(ROW)
+    writer.write(ROW)
+    writer.close()
+    lines = (tmp_path / "metrics.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["submission"] for line in lines] == ["a.md", "a.md"]
+
+
+def test_record_splits_stages_ollama_stats_and_details():
+    record = metrics_record(ROW, RUN_INFO)
+    assert (record["stages"], record["ollama"], record["details"], record["run"]) == (
+        {"precheck_flags": 0.01, "http": 1.2, "load_rubric": 0.02},
+        {"eval_count": 40, "eval_duration": 2e9},
+        {"prompt_chars": 900},
+        {"model": "m"},
+    )
+
+
+def test_summary_table_totals_each_stage():
+    records = [metrics_record(ROW, RUN_INFO)] * 2
+    lines = render_metrics_summary(records).splitlines()
+    assert [line.split() for line in lines if line.startswith("http")] == [["http", "2.400", "1.200", "1.200"]]
+
+
+def test_summary_reports_generation_speed():
+    summary = render_metrics_summary([metrics_record(ROW, RUN_INFO)])
+    assert "generation speed: 20.0 tokens/s" in summary
@@ -0,0 +1,59 @@
+import json
+from dataclasses import replace
+
+from fakes import RUBRIC, SUBMISSION, ScriptedClient
+from pp_ollama import TokenBudget
+
+
+class ModelRecordingClient(ScriptedClient):
+    """
+    ScriptedClient that also records which model each call asked for.
+    """
+
+    def __init__(self, outputs):
+        super().__init__(outputs)
+        self.models = []
+
+    def generate(self, prompt, num_predict, temperature, stats=None, fmt=None, num_ctx=None, model=None):
+        self.models.append(model)
+        return super().generate(prompt, num_predict, temperature, stats, fmt, num_ctx, model)
+
+
+def entry(submission_id, flags):
+    return {"id": submission_id, "score_total": 4, "overall_comment": "good", "flags": flags, "criteria": [
+        {"criterion_id": "work_summary", "points": 2, "comment": "ok"},
+        {"criterion_id": "snag", "points": 2, "comment": "ok"}]}
+
+
+def cascade_config(grader):
+    config = grader.GradeConfig(host="http://stub", model="small", response_format="none", micro_batch=2,
+                                budget=TokenBudget(max_ctx=8192))
+    config.escalation = replace(config, model="big")
+    return config
+
+
+def write_pair(tmp_path):
+    paths = [tmp_path / "ann.md", tmp_path / "bob.md"]
+    for path in paths:
+        path.write_text(SUBMISSION, encoding="utf-8")
+    return paths
+
+
+def test_escalated_entry_goes_straight_to_the_larger_model(grader, tmp_path):
+    batch = json.dumps({"results": [entry("S1", ["missing_snag"]), entry("S2", [])]})
+    client = ModelRecordingClient([batch, json.dumps(entry("S1", []))])
+    rows = grader.grade_micro_batch(RUBRIC, write_pair(tmp_path), cascade_config(grader), tmp_path,
+                                    client=client)
+    assert (client.models, [r.get("tier") for r in rows]) == (["small", "big"], ["escalated", "base"])
+
+
+def test_retry_budget_keeps_the_per_submission_ceiling(grader):
+    config = grader.GradeConfig(host="http://stub", model="m", num_predict=1000, budget=TokenBudget(max_ctx=8192))
+    first, retry = grader.num_predict_attempts(config, 40, submissions=2)
+    assert (first, retry) == (2000, 2000)
+
+
+def test_shared_stats_still_sum_to_the_call_totals(grader):
+    stats = {"eval_count": 7, "http_s": 0.9, "graded_by": "small"}
+    shares = [grader.share_stats(stats, i, 3) for i in range(3)]
+    assert [sum(s["eval_count"] for s in shares), shares[0]["graded_by"]] == [7, "small"]
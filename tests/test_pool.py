@@ -0,0 +1,101 @@
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from fakes import RUBRIC, SUBMISSION
+from pp_ollama import OllamaPool
+
+ANSWER = json.dumps({"score_total": 4, "criteria": [
+    {"criterion_id": "work_summary", "points": 2, "comment": "ok"},
+    {"criterion_id": "snag", "points": 2, "comment": "ok"}], "overall_comment": "good", "flags": []})
+
+
+class FakeHost:
+    """
+    Stands in for one OllamaClient: raises the queued errors in order, then answers "ok".
+    """
+
+    def __init__(self, host, errors=()):
+        self.host = host
+        self.errors = list(errors)
+
+    def generate(self, *args):
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+    def close(self):
+        pass
+
+
+def make_pool(*hosts):
+    pool = OllamaPool([h.host for h in hosts], "m", 5, health_interval_s=0)
+    pool.clients = list(hosts)
+    return pool
+
+
+def test_value_error_releases_the_host():
+    pool = make_pool(FakeHost("a", [ValueError("error chunk")]))
+    with pytest.raises(ValueError):
+        pool.generate("p", 10, 0.0)
+    assert pool.outstanding == [0]
+
+
+def test_all_hosts_down_retries_the_least_recently_failed():
+    pool = make_pool(FakeHost("a"), FakeHost("b"))
+    pool.healthy = [False, False]
+    pool.failed_at = [20.0, 10.0]
+    assert (pool.generate("p", 10, 0.0), pool.calls) == ("ok", [0, 1])
+
+
+def test_success_on_a_down_host_returns_it_to_rotation():
+    pool = make_pool(FakeHost("a"))
+    pool.healthy = [False]
+    pool.generate("p", 10, 0.0)
+    assert pool.healthy == [True]
+
+
+def test_call_failing_on_every_host_raises():
+    pool = make_pool(FakeHost("a", [requests.ConnectionError()]),
+                     FakeHost("b", [requests.Timeout()]))
+    with pytest.raises(requests.ConnectionError):
+        pool.generate("p", 10, 0.0)
+
+
+class SlowHost:
+    """
+    Stands in for one OllamaClient that takes a while to answer; records the peak number of
+    calls in flight across all hosts sharing the same counter.
+    """
+
+    def __init__(self, host, answer, counter):
+        self.host = host
+        self.answer = answer
+        self.counter = counter
+
+    def generate(self, *args):
+        with self.counter["lock"]:
+            self.counter["now"] += 1
+            self.counter["peak"] = max(self.counter["peak"], self.counter["now"])
+        time.sleep(0.1)
+        with self.counter["lock"]:
+            self.counter["now"] -= 1
+        return self.answer
+
+    def close(self):
+        pass
+
+
+def test_each_host_adds_concurrency_to_a_batch(grader, tmp_path):
+    counter = {"lock": threading.Lock(), "now": 0, "peak": 0}
+    pool = make_pool(*(SlowHost(h, ANSWER, counter) for h in ("a", "b", "c")))
+    paths = []
+    for name in "abcdef":
+        paths.append(tmp_path / f"{name}.md")
+        paths[-1].write_text(SUBMISSION, encoding="utf-8")
+    config = grader.GradeConfig(host="http://stub", model="m", response_format="none")
+    grader.grade_batch(RUBRIC, paths, config, tmp_path / "out", 1, verbose=False, client=pool)
+    assert counter["peak"] == 3
@@ -0,0 +1,62 @@
+from pp_blocks import header_attrs, parse_attrs, parse_document
+
+SOURCE = """# Title
+
+:::meta
+date: 2025-01-31
+:::
+
+:::criterion{id="roles" points="4"}
+- D1: who drove
+:::
+
+:::criterion{points="1"}
+no id here
+:::
+"""
+
+
+def test_blocks_are_found_in_document_order():
+    doc = parse_document(SOURCE)
+    assert [b.kind for b in doc.blocks] == ["meta", "criterion", "criterion"]
+
+
+def test_criterion_attributes_are_parsed():
+    block = parse_document(SOURCE).of_kind("criterion")[0]
+    assert (block.attr("id"), block.attr("points")) == ("roles", "4")
+
+
+def test_body_spans_the_lines_between_open_and_close():
+    doc = parse_document(SOURCE)
+    assert doc.body(doc.first("meta")) == "date: 2025-01-31\n"
+
+
+def test_criteria_bodies_skip_blocks_without_id():
+    assert parse_document(SOURCE).criteria_bodies() == {"roles": "- D1: who drove"}
+
+
+def test_unclosed_block_is_ignored():
+    doc = parse_document(":::signoff\nStudent A initials: AB\n")
+    assert doc.blocks == ()
+
+
+def test_closing_line_may_have_trailing_whitespace():
+    doc = parse_document(":::signoff\nAB\n:::   \n")
+    assert doc.body(doc.first("signoff")) == "AB\n"
+
+
+def test_closing_line_with_text_does_not_close():
+    doc = parse_document(":::signoff\n:::meta\nAB\n:::\n")
+    assert doc.body(doc.first("signoff")) == ":::meta\nAB\n"
+
+
+def test_parse_is_memoized_per_text():
+    assert parse_document(SOURCE) is parse_document(SOURCE)
+
+
+def test_parse_attrs_reads_quoted_values():
+    assert parse_attrs('id="work_summary" points="2"') == {"id": "work_summary", "points": "2"}
+
+
+def test_plain_header_has_no_attrs():
+    assert header_attrs(" notes") == {}
@@ -0,0 +1,58 @@
+import csv
+import io
+
+import pp_results
+
+RUN_INFO = {"assignment": "pp01", "model": "m", "engine": "whole",
+            "max_points": {"work_summary": 2.0, "snag": 2.0}}
+
+
+def row(student, score, flags=()):
+    result = {"score_total": score, "overall_comment": "", "flags": list(flags), "criteria": [
+        {"criterion_id": "work_summary", "points": score / 2, "comment": ""},
+        {"criterion_id": "snag", "points": score / 2, "comment": ""}]}
+    return {"status": "ok", "student": student, "submission": f"{student}.md", "result": result,
+            "criterion_fingerprints": {"snag": f"fp-{score}"}}
+
+
+def store_with(tmp_path, *rows):
+    store = pp_results.ResultStore(str(tmp_path / "results.sqlite"), RUN_INFO)
+    for r in rows:
+        store.write(r)
+    return store
+
+
+def test_failed_and_unchanged_rows_are_not_stored(tmp_path):
+    store = store_with(tmp_path, {"status": "error", "student": "a"}, dict(row("b", 4.0), unchanged=True))
+    assert (store.written, store.latest_graded("pp01")) == (0, {})
+
+
+def test_latest_row_wins(tmp_path):
+    store = store_with(tmp_path, row("ann", 2.0), row("ann", 4.0))
+    result, fingerprints = store.latest_graded("pp01")["ann"]
+    assert (result["score_total"], fingerprints) == (4.0, {"snag": "fp-4.0"})
+
+
+def test_flagged_lists_only_the_latest_result(tmp_path):
+    store_with(tmp_path, row("ann", 2.0, ["missing_snag"]), row("ann", 4.0), row("bob", 1.0, ["missing_snag"])).close()
+    conn = pp_results.open_db(str(tmp_path / "results.sqlite"))
+    assert [r["student"] for r in pp_results.flagged(conn, "missing_snag")] == ["bob"]
+
+
+def test_score_distribution_counts_each_criterion_score(tmp_path):
+    store_with(tmp_path, row("ann", 4.0), row("bob", 4.0), row("cat", 2.0)).close()
+    conn = pp_results.open_db(str(tmp_path / "results.sqlite"))
+    rows = [tuple(r) for r in pp_results.score_distribution(conn, "pp01")]
+    assert rows == [("snag", 1.0, 1), ("snag", 2.0, 2), ("work_summary", 1.0, 1), ("work_summary", 2.0, 2)]
+
+
+def test_canvas_csv_layout(tmp_path):
+    store_with(tmp_path, row("bob", 1.0), row("ann", 2.0), row("ann", 3.5)).close()
+    out = io.StringIO()
+    count = pp_results.export_canvas_csv(pp_results.open_db(str(tmp_path / "results.sqlite")), out)
+    assert (count, list(csv.reader(io.StringIO(out.getvalue())))) == (2, [
+        ["Student", "ID", "SIS User ID", "SIS Login ID", "Section", "pp01"],
+        ["Points Possible", "", "", "", "", "4.0"],
+        ["ann", "", "", "ann", "", "3.5"],
+        ["bob", "", "", "bob", "", "1.0"],
+    ])
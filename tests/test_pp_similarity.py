@@ -0,0 +1,60 @@
+from pp_similarity import SimilarityIndex, estimate_jaccard, minhash_signature, parse_participants, shingle_hashes
+
+ANSWER = ("We built the parser together and tested it on the sample file. The snag was a missing "
+          "closing fence, which we fixed by checking every block boundary before rendering.")
+OTHER = ("I wrote a tokenizer for arithmetic expressions alone and my partner reviewed the error "
+         "messages after lunch, then we compared timing numbers for three input sizes.")
+PAIR = frozenset({"ada lovelace", "alan turing"})
+
+
+def test_identical_text_has_similarity_one():
+    signature = minhash_signature(shingle_hashes(ANSWER))
+    assert estimate_jaccard(signature, signature) == 1.0
+
+
+def test_same_text_same_participants_form_a_partner_group():
+    index = SimilarityIndex()
+    index.add("a.md", ANSWER, PAIR)
+    index.add("b.md", ANSWER, PAIR)
+    assert index.partner_groups(index.pairs()) == [["a.md", "b.md"]]
+
+
+def test_same_text_different_participants_is_reported_not_merged():
+    index = SimilarityIndex()
+    index.add("a.md", ANSWER, PAIR)
+    index.add("b.md", ANSWER, frozenset({"grace hopper"}))
+    pairs = index.pairs()
+    assert [(p.a, p.b, p.partners) for p in pairs] == [("a.md", "b.md", False)]
+    assert index.partner_groups(pairs) == []
+
+
+def test_unknown_participants_are_never_partners():
+    index = SimilarityIndex()
+    index.add("a.md", ANSWER, frozenset())
+    index.add("b.md", ANSWER, frozenset())
+    assert not index.pairs()[0].partners
+
+
+def test_unrelated_texts_are_not_paired():
+    index = SimilarityIndex()
+    index.add("a.md", ANSWER, PAIR)
+    index.add("b.md", OTHER, PAIR)
+    assert index.pairs() == []
+
+
+def test_partner_groups_join_chains():
+    index = SimilarityIndex()
+    for key in ("a.md", "b.md", "c.md"):
+        index.add(key, ANSWER, PAIR)
+    assert index.partner_groups(index.pairs()) == [["a.md", "b.md", "c.md"]]
+
+
+def test_blank_text_is_not_indexed():
+    index = SimilarityIndex()
+    index.add("a.md", "   ", PAIR)
+    assert index.signatures == {}
+
+
+def test_parse_participants_ignores_template_placeholders():
+    meta = "participants:\n  - name: Student A\n  - name: Ada  Lovelace\n  - name: LLM\n"
+    assert parse_participants(meta) == frozenset({"ada lovelace"})
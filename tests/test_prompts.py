@@ -0,0 +1,12 @@
+from fakes import RUBRIC, SUBMISSION
+from pp_prompts import COVERAGE_RULE, GRADED_COVERAGE_RULE, build_micro_batch_prompt, build_prompt, build_prompt_prefix, rubric_section
+
+
+def test_prefix_prompt_head_matches_classic_prompt():
+    classic = build_prompt(RUBRIC, SUBMISSION, []).split("\n\nPRECHECK")[0]
+    prefix = build_prompt_prefix(RUBRIC).split("\n- PRECHECK")[0]
+    assert prefix == classic.replace(COVERAGE_RULE, GRADED_COVERAGE_RULE)
+
+
+def test_micro_batch_prompt_uses_the_shared_rubric_section():
+    assert rubric_section(RUBRIC) in build_micro_batch_prompt(RUBRIC, [])
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from pp_contract import extract_json, repair_json
+
+
+def test_truncated_output_is_closed():
+    text = '{"score_total": 7, "criteria": [{"criterion_id": "roles", "comment": "Good wo'
+    repaired = json.loads(repair_json(text))
+    assert repaired["criteria"] == [{"criterion_id": "roles", "comment": "Good wo"}]
+
+
+def test_dangling_key_gets_null():
+    assert json.loads(repair_json('{"score_total": 7, "flags":')) == {"score_total": 7, "flags": None}
+
+
+def test_trailing_commas_are_dropped():
+    assert json.loads(repair_json('{"flags": ["a", "b",], }')) == {"flags": ["a", "b"]}
+
+
+def test_python_literals_become_json():
+    assert json.loads(repair_json("{'ok': True, 'x': None}")) == {"ok": True, "x": None}
+
+
+def test_single_quoted_string_keeps_inner_double_quote():
+    assert json.loads(repair_json("""{'comment': 'said "hi"'}""")) == {"comment": 'said "hi"'}
+
+
+def test_smart_quote_delimiters_become_json_quotes():
+    assert json.loads(repair_json("{“comment”: “ok”}")) == {"comment": "ok"}
+
+
+def test_preamble_and_trailing_chatter_are_dropped():
+    text = 'Here you go:\n```json\n{"flags": []}\n```\nHope this helps!'
+    assert json.loads(repair_json(text)) == {"flags": []}
+
+
+def test_extract_json_marks_repaired_output():
+    stats = {}
+    extract_json('{"flags": ["a",', stats)
+    assert stats.get("json_repaired") is True
+
+
+def test_extract_json_leaves_valid_output_unmarked():
+    stats = {}
+    extract_json('{"flags": []}', stats)
+    assert "json_repaired" not in stats
+
+
+def test_extract_json_rejects_text_without_object():
+    with pytest.raises(ValueError):
+        extract_json("I cannot grade this.")
+
+
+def test_smart_quotes_inside_a_double_quoted_string_are_kept():
+    text = '{"comment": "They called it “done” too early"}'
+    assert json.loads(repair_json(text)) == {"comment": "They called it “done” too early"}
+
+
+def test_plain_quote_inside_a_smart_quoted_string_is_escaped():
+    assert json.loads(repair_json('{“comment”: “said "hi"”}')) == {"comment": 'said "hi"'}
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from fakes import RUBRIC, SUBMISSION, ScriptedClient
+
+VALID = json.dumps({
+    "score_total": 3,
+    "criteria": [{"criterion_id": "work_summary", "points": 2, "comment": "ok"},
+                 {"criterion_id": "snag", "points": 1, "comment": "ok"}],
+    "overall_comment": "fine",
+    "flags": [],
+})
+TRUNCATED = '{"score_total": 3, "criteria": [{"criterion_id": "work_summary", "points": 2'
+
+
+def config(grader, **changes):
+    return grader.GradeConfig(host="http://stub", model="m", response_format="none", **changes)
+
+
+def test_truncated_whole_answer_is_retried(grader):
+    client = ScriptedClient([TRUNCATED, VALID])
+    result = grader.grade_with_engine(RUBRIC, SUBMISSION, config(grader), client=client)
+    assert (client.calls, result["score_total"]) == (2, 3.0)
+
+
+def test_truncated_criterion_answer_is_retried(grader):
+    piece = json.dumps({"points": 2, "comment": "ok", "flags": []})
+    client = ScriptedClient(['{"comment": "Good', piece, piece])
+    grader.grade_with_engine(RUBRIC, SUBMISSION, config(grader, engine="per-criterion"), client=client)
+    assert client.calls == 3
+
+
+def test_non_list_criterion_flags_are_rejected(grader):
+    bad = json.dumps({"points": 2, "comment": "ok", "flags": None})
+    client = ScriptedClient([json.dumps({"points": 2, "comment": "ok", "flags": 3}), bad])
+    with pytest.raises(ValueError):
+        grader.grade_criterion(RUBRIC, RUBRIC["criteria"][0], "prompt", config(grader), None, client=client)
@@ -0,0 +1,37 @@
+import json
+
+import build_pipeline
+from build_pipeline import load_script
+from pp_rubric import rubric_is_stale
+
+from conftest import ROOT
+
+SOURCE = ':::criterion{id="roles" points="10"}\r\n- D1: who drove\r\n:::\r\n'
+
+
+def write_crlf_source(tmp_path):
+    src = tmp_path / "01_source.md"
+    src.write_bytes(SOURCE.encode("utf-8"))
+    return src
+
+
+def test_crlf_rubric_from_stage_script_is_fresh(tmp_path):
+    stage = load_script(ROOT / "03_build_rubric_json.py")
+    source_bytes = write_crlf_source(tmp_path).read_bytes()
+    rubric = stage.build_rubric(stage.decode_source(source_bytes), 10.0, "01_source.md",
+                                stage.source_fingerprint(source_bytes))
+    assert not rubric_is_stale(rubric, tmp_path / "01_source.md")
+
+
+def test_crlf_rubric_from_build_pipeline_is_fresh(tmp_path):
+    src = write_crlf_source(tmp_path)
+    out = tmp_path / "03_rubric.json"
+    build_pipeline.build(str(src), None, str(out), 10.0, str(tmp_path / "manifest.json"))
+    rubric = json.loads(out.read_text(encoding="utf-8"))
+    assert not rubric_is_stale(rubric, src)
+
+
+def test_crlf_prompt_has_no_carriage_returns(tmp_path):
+    stage = load_script(ROOT / "03_build_rubric_json.py")
+    rubric = stage.build_rubric(stage.decode_source(SOURCE.encode("utf-8")), 10.0)
+    assert rubric["criteria"][0]["prompt"] == "- D1: who drove"
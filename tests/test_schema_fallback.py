@@ -0,0 +1,49 @@
+import pytest
+import requests
+
+from pp_ollama import OllamaClient
+
+SCHEMA = {"type": "object"}
+
+
+class FakeResponse:
+    """
+    Stands in for a requests.Response with a status code and a text body.
+    """
+
+    def __init__(self, status_code, text=""):
+        self.status_code = status_code
+        self.text = text
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}: {self.text}")
+
+
+def client_answering(*responses):
+    client = OllamaClient("http://stub", "m", 5)
+    queue = list(responses)
+    client.sent = []
+
+    def post(url, json, timeout, stream):
+        client.sent.append(json)
+        return queue.pop(0)
+
+    client.session.post = post
+    return client
+
+
+def test_schema_rejection_falls_back_to_plain_json():
+    client = client_answering(FakeResponse(400, '{"error": "invalid format"}'), FakeResponse(200))
+    client._post({"format": SCHEMA})
+    assert ([p["format"] for p in client.sent], client.schema_supported) == ([SCHEMA, "json"], False)
+
+
+def test_other_bad_request_keeps_schema_support():
+    client = client_answering(FakeResponse(400, '{"error": "num_ctx must be positive"}'))
+    with pytest.raises(requests.HTTPError):
+        client._post({"format": SCHEMA})
+    assert (len(client.sent), client.schema_supported) == (1, True)
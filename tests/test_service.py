@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+import requests
+
+from fakes import RUBRIC
+from pp_results import ResultStore
+from pp_rubric import RubricUnavailableError, StaleRubricError
+from pp_service import GradingService, make_service_handler
+
+STUDENT = {"X-Student": "bob_pp01"}
+
+
+class RaisingService:
+    """
+    Stands in for GradingService: grade() raises the given exception.
+    """
+
+    def __init__(self, exc):
+        self.exc = exc
+
+    def grade(self, submission_md, student):
+        raise self.exc
+
+
+@pytest.fixture
+def serve_handler():
+    servers = []
+
+    def start(service):
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_service_handler(service))
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append(httpd)
+        return f"http://127.0.0.1:{httpd.server_address[1]}/grade"
+
+    yield start
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def write_rubric(path, rubric, mtime_ns):
+    path.write_text(json.dumps(rubric), encoding="utf-8")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def make_service(tmp_path, on_reload=None):
+    path = tmp_path / "03_rubric.json"
+    write_rubric(path, RUBRIC, 10**18)
+    args = argparse.Namespace(rubric=str(path), source=None, skip_rubric_check=False, rebuild_rubric=False)
+    return GradingService(args, RUBRIC, "fake", None, None, 1, 0, on_reload=on_reload), path
+
+
+def test_stale_rubric_is_a_409(serve_handler):
+    url = serve_handler(RaisingService(StaleRubricError("stale")))
+    assert requests.post(url, data="md", headers=STUDENT, timeout=5).status_code == 409
+
+
+def test_unexpected_error_is_a_500(serve_handler):
+    url = serve_handler(RaisingService(RuntimeError("boom")))
+    assert requests.post(url, data="md", headers=STUDENT, timeout=5).status_code == 500
+
+
+def test_non_utf8_body_is_a_400(serve_handler):
+    url = serve_handler(RaisingService(RuntimeError("not reached")))
+    assert requests.post(url, data=b"\xff\xfe", headers=STUDENT, timeout=5).status_code == 400
+
+
+def test_missing_student_is_a_400(serve_handler):
+    url = serve_handler(RaisingService(RuntimeError("not reached")))
+    assert requests.post(url, data="md", timeout=5).status_code == 400
+
+
+def test_student_with_path_characters_is_a_400(serve_handler):
+    url = serve_handler(RaisingService(RuntimeError("not reached")))
+    assert requests.post(url, data="md", headers={"X-Student": "../bob"}, timeout=5).status_code == 400
+
+
+def test_unreadable_reload_raises_rubric_unavailable(tmp_path):
+    service, path = make_service(tmp_path)
+    path.write_text("{not json", encoding="utf-8")
+    with pytest.raises(RubricUnavailableError):
+        service.current_rubric()
+
+
+def test_reload_refreshes_the_store_run_info(grader, tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"), grader.rubric_run_info(RUBRIC))
+    service, path = make_service(tmp_path, lambda fresh: grader.refresh_run_info(fresh, None, store))
+    edited = dict(RUBRIC, criteria=[dict(RUBRIC["criteria"][0], max_points=3.0), RUBRIC["criteria"][1]])
+    write_rubric(path, edited, 2 * 10**18)
+    service.current_rubric()
+    store.close()
+    assert store.run_info == grader.rubric_run_info(edited)
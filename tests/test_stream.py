@@ -0,0 +1,76 @@
+import json
+
+from pp_ollama import JsonObjectTracker, OllamaClient
+
+
+class FakeStream:
+    """
+    Stands in for a streamed requests.Response: yields the given NDJSON chunks.
+    """
+
+    def __init__(self, chunks):
+        self.lines = [json.dumps(c).encode("utf-8") for c in chunks]
+        self.read = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_lines(self):
+        for line in self.lines:
+            self.read += 1
+            yield line
+
+
+ANSWER = ['{"a": ', '"}"', '}']
+STATS = {"done": True, "prompt_eval_count": 50, "eval_count": 3}
+
+
+def streamed_client(chunks):
+    client = OllamaClient("http://stub", "m", 5, pool_size=1)
+    response = FakeStream(chunks)
+    client._post = lambda payload, stream=False: response
+    return client, response
+
+
+def answer_chunks(tail=0):
+    return [{"response": p, "done": False} for p in ANSWER + ["chatter "] * tail] + [STATS]
+
+
+def test_tracker_ignores_a_brace_quoted_in_the_preamble():
+    tracker = JsonObjectTracker()
+    assert tracker.feed('pre "{" {"a": "}"') is False
+
+
+def test_tracker_reports_the_end_of_the_object():
+    tracker = JsonObjectTracker()
+    tracker.feed('Here: {"a": "}"} and more')
+    assert tracker.end_index == len('Here: {"a": "}"}')
+
+
+def test_stream_returns_the_text_up_to_the_closing_brace():
+    client, _ = streamed_client(answer_chunks(tail=2))
+    assert client.generate_stream("p", 10, 0.0).text == '{"a": "}"}'
+
+
+def test_stats_frame_after_the_answer_is_recorded():
+    client, _ = streamed_client(answer_chunks(tail=2))
+    stats = {}
+    client.generate_stream("p", 10, 0.0, stats)
+    assert stats["prompt_eval_count"] == 50
+
+
+def test_chatty_stream_hangs_up_with_partial_counts():
+    client, stream = streamed_client(answer_chunks(tail=50))
+    stats = {}
+    client.generate_stream("p", 10, 0.0, stats)
+    assert (stats["stats_partial"], stats["eval_count"], stream.read) == (True, 11, 11)
+
+
+def test_drain_reads_on_to_the_stats_frame():
+    client, _ = streamed_client(answer_chunks(tail=50))
+    stats = {}
+    client.generate_stream("p", 10, 0.0, stats, drain=True)
+    assert stats["prompt_eval_count"] == 50
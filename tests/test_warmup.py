@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pp_ollama import OllamaClient, OllamaPool
+
+
+class CountingSession:
+    """
+    Stands in for requests.Session: records the most POSTs in flight at once.
+    """
+
+    status_code = 200
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def post(self, *args, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        return self
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"response": "{}"}
+
+
+class WarmupHost:
+    """
+    Stands in for one OllamaClient: counts warmup() calls and reports a fixed load time.
+    """
+
+    def __init__(self, host, seconds):
+        self.host = host
+        self.seconds = seconds
+        self.warmups = 0
+
+    def warmup(self, model=None):
+        self.warmups += 1
+        return self.seconds
+
+    def close(self):
+        pass
+
+
+def test_pool_warms_each_host_once():
+    hosts = [WarmupHost("a", 0.5), WarmupHost("b", 2.0)]
+    pool = OllamaPool([h.host for h in hosts], "m", 5, health_interval_s=0)
+    pool.clients = hosts
+    slowest = pool.warmup()
+    assert (slowest, [h.warmups for h in hosts]) == (2.0, [1, 1])
+
+
+def test_client_runs_at_most_pool_size_calls_at_once():
+    client = OllamaClient("http://stub", "m", 5, pool_size=2)
+    client.session = CountingSession()
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        list(pool.map(lambda _: client.generate("p", 10, 0.0), range(6)))
+    assert client.session.peak == 2
+
+
+def test_load_duration_decides_warm_or_cold():
+    client = OllamaClient("http://stub", "m", 5)
+    for load_ns in (1e8, 2e8, 3e9):
+        client._record_stats({"load_duration": load_ns}, {})
+    assert (client.warm_calls, client.cold_calls) == (2, 1)
+
+
+def test_stats_without_load_duration_are_not_counted():
+    client = OllamaClient("http://stub", "m", 5)
+    stats = {}
+    client._record_stats({"eval_count": 12}, stats)
+    assert (client.warm_calls + client.cold_calls, stats["eval_count"]) == (0, 12)
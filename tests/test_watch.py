@@ -0,0 +1,35 @@
+import argparse
+import json
+import subprocess
+import sys
+
+from conftest import ROOT
+from fakes import RUBRIC, SUBMISSION, ScriptedClient
+
+ANSWER = json.dumps({"score_total": 4, "criteria": [
+    {"criterion_id": "work_summary", "points": 2, "comment": "ok"},
+    {"criterion_id": "snag", "points": 2, "comment": "ok"}], "overall_comment": "good", "flags": []})
+
+
+def watch_args(tmp_path):
+    (tmp_path / "subs").mkdir()
+    (tmp_path / "rubric.json").write_text(json.dumps(RUBRIC), encoding="utf-8")
+    return argparse.Namespace(submissions_dir=str(tmp_path / "subs"), glob="*.md", out_dir=str(tmp_path / "out"),
+                              rubric=str(tmp_path / "rubric.json"), debounce=0.0, incremental=False, concurrency=1)
+
+
+def test_one_poll_grades_a_new_submission_once(grader, tmp_path):
+    args = watch_args(tmp_path)
+    state = grader.start_watch(args, RUBRIC, tmp_path / "out")
+    (tmp_path / "subs" / "ann.md").write_text(SUBMISSION, encoding="utf-8")
+    config = grader.GradeConfig(host="http://stub", model="m", response_format="none")
+    client = ScriptedClient([ANSWER])
+    first = grader.watch_poll(args, state, config, client, None)
+    second = grader.watch_poll(args, state, config, client, None)
+    assert ([r["status"] for r in first], second, client.calls) == (["ok"], [], 1)
+
+
+def test_watch_rejects_dedup():
+    proc = subprocess.run([sys.executable, str(ROOT / "04_grade.py"), "--submissions-dir", "submissions",
+                           "--watch", "--dedup"], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert "can't be combined with --watch" in proc.stderr
@@ -0,0 +1,39 @@
+import json
+
+from fakes import RUBRIC, SUBMISSION, ScriptedClient
+from pp_metrics import describe_wire
+
+
+class CountingClient(ScriptedClient):
+    """
+    ScriptedClient that also reports 40 generated tokens per call, like Ollama's eval_count.
+    """
+
+    def generate(self, prompt, num_predict, temperature, stats=None, fmt=None, num_ctx=None, model=None):
+        if stats is not None:
+            stats["eval_count"] = stats.get("eval_count", 0) + 40
+        return super().generate(prompt, num_predict, temperature, stats, fmt, num_ctx, model)
+
+
+def compact_stats(grader, answer):
+    config = grader.GradeConfig(host="http://stub", model="m", response_format="none", wire="compact")
+    stats = {}
+    grader.grade_with_engine(RUBRIC, SUBMISSION, config, stats=stats, client=CountingClient([json.dumps(answer)]))
+    return stats
+
+
+def test_savings_of_a_repaired_compact_answer_are_recorded(grader):
+    stats = compact_stats(grader, {"s": [[2, "ok"], ["n/a", "no points"]], "o": "ok", "f": []})
+    assert stats["compact_eval_count"] == 40
+
+
+def test_contract_format_reply_records_no_savings(grader):
+    stats = compact_stats(grader, {"score_total": 2, "overall_comment": "ok", "flags": [],
+                                   "criteria": [{"criterion_id": "work_summary", "points": 2, "comment": "ok"},
+                                                {"criterion_id": "snag", "comment": "no points"}]})
+    assert "compact_eval_count" not in stats
+
+
+def test_micro_batched_rows_are_left_out_of_the_wire_summary():
+    rows = [{"micro_batch": 2, "compact_eval_count": 10, "verbose_eval_estimate": 30}]
+    assert describe_wire(rows) is None